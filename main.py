@@ -1,10 +1,38 @@
 """
 Run Server
+
+モジュールの読み込み時には設定を行わないため、起動時にbootstrap()を呼び出す
+(WSGIサーバから起動する場合はcreate_app()をアプリケーションとする)
 """
 import os
-from wsgiref.simple_server import make_server
+import signal
+import sys
+
+from server import logconfig
+from server.api import InternalServerError
+from server.metrics import RequestTracker
+from server.profiling import ProfilingMiddleware
+from server.urls import dispatch, endpoint_label, install_query_observers
+
+
+# 設定に応じてプロファイルを取得する割り当て
+DISPATCH = ProfilingMiddleware.from_env(dispatch)
+
 
-from server.urls import dispatch
+def bootstrap():
+    """起動処理(ログ設定、DBクエリの記録の登録)
+    """
+    logconfig.setup()
+    install_query_observers()
+
+
+def create_app():
+    """起動処理を行いWSGIアプリを返す
+
+    @return WSGIアプリ
+    """
+    bootstrap()
+    return run
 
 
 def run(environ, start_response):
@@ -14,18 +42,44 @@ def run(environ, start_response):
     @param start_response ステータスコード、レスポンスヘッダーを受け取るオブジェクト
     @return レスポンスデータ
     """
-    response = dispatch(environ)
+    try:
+        request_bytes = int(environ.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        request_bytes = 0
+    request_id = logconfig.start_request(environ)
+    tracker = RequestTracker(endpoint_label(environ.get('PATH_INFO')), request_bytes)
+    try:
+        response = DISPATCH(environ)
+    except BaseException:
+        tracker.finish(InternalServerError())
+        raise
     start_response(
         response.status,
         [
             ('Content-Type', '{}'.format(response.content_type)),
-            ('Access-Control-Allow-Origin', '*')
+            ('Access-Control-Allow-Origin', '*'),
+            ('X-Request-Id', request_id),
         ])
-    return [response.body.encode('UTF-8')]
+    if isinstance(response.body, str):
+        data = response.body.encode('UTF-8')
+        tracker.response_bytes = len(data)
+        tracker.finish(response)
+        logconfig.end_request()
+        return [data]
+    # ストリーミングレスポンス(送信完了まで計測する)
+    # ログのリクエストIDは次のリクエストの開始まで残る
+    return tracker.stream(response, response.body)
 
 
 if __name__ == '__main__':
+    # SIGTERMでも終了処理(アクティビティ書き込みキューの書き出し)を行う
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    from wsgiref.simple_server import make_server
     PORT = os.environ.get('PORT', 8000)
-    with make_server('', int(PORT), run) as httpd:
-        print(f'Serving HTTP on 0.0.0.0 port {PORT} ...')
-        httpd.serve_forever()
+    bootstrap()
+    try:
+        with make_server('', int(PORT), run) as httpd:
+            print(f'Serving HTTP on 0.0.0.0 port {PORT} ...')
+            httpd.serve_forever()
+    finally:
+        logconfig.shutdown()
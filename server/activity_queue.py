@@ -0,0 +1,248 @@
+"""アクティビティ書き込みキュー
+
+ビューからアクティビティをキューに積み、バックグラウンドの書き込みスレッドが
+件数、経過時間のしきい値ごとに複数行INSERTでまとめて書き込む
+
+書き込みモード
+  sync: キューを使わない(呼び出し元が単語の更新と同じ文で書き込む)
+  batched: まとめて書き込まれるまで呼び出し元が待つ
+  fire_and_forget: キューに積んだら即座に戻る
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from server.dbaccess import Activity, DbOperationError
+
+
+LOGGER = logging.getLogger()
+
+MODES = ('sync', 'batched', 'fire_and_forget')
+
+
+class _Entry:
+    """ キューの1件 """
+    __slots__ = ('row', 'done', 'error')
+
+    def __init__(self, row, wait):
+        """コンストラクタ
+
+        @param row (アクティビティ日付, アクティビティ種別ID, アクティビティ詳細)
+        @param wait 論理値(Trueなら書き込み完了を通知する)
+        """
+        self.row = row
+        self.done = threading.Event() if wait else None
+        self.error = None
+
+
+class ActivityQueue:
+    """ アクティビティ書き込みキュー """
+    def __init__(self, mode='sync', max_batch=200, max_delay=0.05,
+                 max_size=10000, writer_factory=Activity, timeout=30.0):
+        """コンストラクタ
+
+        @param mode 書き込みモード(sync、batched、fire_and_forget)
+        @param max_batch 1回に書き込む最大件数
+        @param max_delay 最初の1件から書き込むまでの最大待ち時間(秒)
+        @param max_size キューの最大件数(超えた場合はtimeout秒まで空くまで待つ)
+        @param writer_factory insert_manyを持つ書き込みオブジェクトの生成関数
+        @param timeout キューが空くまで、batchedで書き込みを待つ最大時間(秒)
+        @exception ValueError 不明な書き込みモード
+        """
+        if mode not in MODES:
+            raise ValueError(f'unknown activity queue mode: {mode}')
+        self._mode = mode
+        self._max_batch = max_batch
+        self._max_delay = max_delay
+        self._writer_factory = writer_factory
+        self._timeout = timeout
+        self._queue = queue.Queue(max_size)
+        self._lock = threading.Lock()
+        # 終了の確認後、キューに積んでいる呼び出し元の数(0になったら通知する)
+        self._producers = 0
+        self._idle = threading.Condition(self._lock)
+        self._thread = None
+        self._closed = False
+        self._stopping = False
+
+    @classmethod
+    def from_env(cls):
+        """環境変数から生成
+
+        ACTIVITY_QUEUE_MODE、ACTIVITY_QUEUE_MAX_BATCH、ACTIVITY_QUEUE_MAX_DELAY_MS、
+        ACTIVITY_QUEUE_TIMEOUT_MS
+
+        @return ActivityQueue
+        """
+        return cls(
+            mode=os.environ.get('ACTIVITY_QUEUE_MODE', 'sync'),
+            max_batch=int(os.environ.get('ACTIVITY_QUEUE_MAX_BATCH', 200)),
+            max_delay=int(os.environ.get('ACTIVITY_QUEUE_MAX_DELAY_MS', 50)) / 1000,
+            timeout=int(os.environ.get('ACTIVITY_QUEUE_TIMEOUT_MS', 30000)) / 1000,
+        )
+
+    @property
+    def enabled(self):
+        """キューを使うか
+
+        @return 論理値(syncならFalse)
+        """
+        return self._mode != 'sync'
+
+    def _start(self):
+        """書き込みスレッド起動(初回のみ)
+
+        ロックを取得して呼び出すこと
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name='activity-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def put(self, date, type_id, detail):
+        """アクティビティ追加
+
+        @param date アクティビティ日付
+        @param type_id アクティビティ種別ID
+        @param detail アクティビティ詳細
+        @exception DbOperationError 書き込みエラー(batchedのみ)、タイムアウト、終了済み
+        @exception RuntimeError sync(キューを使わない)
+        """
+        self.put_many([(date, type_id, detail)])
+
+    def put_many(self, rows):
+        """アクティビティ一括追加
+
+        @param rows (アクティビティ日付, アクティビティ種別ID, アクティビティ詳細)のリスト
+        @exception DbOperationError 書き込みエラー(batchedのみ)、タイムアウト、終了済み
+        @exception RuntimeError sync(キューを使わない)
+        """
+        if not self.enabled:
+            raise RuntimeError('activity queue is disabled (sync)')
+        if not rows:
+            return
+        entries = [_Entry(row, wait=self._mode == 'batched') for row in rows]
+        deadline = time.monotonic() + self._timeout
+        # 終了の確認のみロックを取得して行い、キューが空くまでの待機中は他の呼び出し元を止めない
+        with self._lock:
+            if self._closed:
+                raise DbOperationError('activity queue is closed')
+            self._start()
+            self._producers += 1
+        try:
+            for entry in entries:
+                try:
+                    self._queue.put(entry, timeout=max(deadline - time.monotonic(), 0))
+                except queue.Full:
+                    raise DbOperationError('activity queue is full')
+        finally:
+            with self._lock:
+                self._producers -= 1
+                if not self._producers:
+                    self._idle.notify_all()
+        for entry in entries:
+            if entry.done is None:
+                continue
+            if not entry.done.wait(max(deadline - time.monotonic(), 0)):
+                raise DbOperationError('activity queue write timed out')
+            if entry.error is not None:
+                raise DbOperationError(entry.error)
+
+    def _collect(self):
+        """1回分の書き込み対象を取得
+
+        最初の1件を待ち、max_batch件またはmax_delay秒経過まで追加で取得する
+
+        @return _Entryのリスト(終了要求の場合はNone)
+        """
+        first = self._queue.get()
+        if first is None:
+            self._queue.task_done()
+            return None
+        entries = [first]
+        deadline = time.monotonic() + self._max_delay
+        while len(entries) < self._max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if entry is None:
+                # 終了要求は取得済みの分を書き込んでから処理する
+                self._queue.task_done()
+                self._stopping = True
+                break
+            entries.append(entry)
+        return entries
+
+    def _run(self):
+        """書き込みスレッド
+        """
+        writer = None
+        while True:
+            entries = self._collect()
+            if entries is None:
+                return
+            error = None
+            try:
+                if writer is None:
+                    writer = self._writer_factory()
+                writer.insert_many([entry.row for entry in entries])
+            except Exception as err:
+                # 次回は接続し直す
+                LOGGER.error(err)
+                writer, error = None, err
+            for entry in entries:
+                if entry.done is not None:
+                    entry.error = error
+                    entry.done.set()
+                self._queue.task_done()
+            if self._stopping:
+                return
+
+    def flush(self, timeout=None):
+        """キューに積んだ全件の書き込みが終わるまで待つ
+
+        @param timeout 最大待ち時間(秒)
+        @return 論理値(空になったらTrue)
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout=10):
+        """残りを書き込んで書き込みスレッドを終了
+
+        @param timeout 最大待ち時間(秒)
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+            # 終了の確認後に積んでいる呼び出し元を待ち、終了要求より後に積まれないようにする
+            while self._producers:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._idle.wait(remaining)
+        if thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=max(deadline - time.monotonic(), 0))
+        except queue.Full:
+            LOGGER.error('activity queue was not flushed: %d entries left', self._queue.qsize())
+            return
+        thread.join(max(deadline - time.monotonic(), 0))
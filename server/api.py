@@ -1,18 +1,29 @@
 """
 API
 """
-from datetime import date, timedelta
+import csv
 from functools import wraps
 import json
-import logging.config
-from random import randint, sample
+import logging
+import os
 from typing import NamedTuple
+from urllib.parse import parse_qs
 
+from server.activity_queue import ActivityQueue
+from server.autocomplete import PrefixIndex
+from server.clock import Clock
 from server.dbaccess import (
-    Word, Activity, Flag
+    Word, Activity, Flag, column_names, transaction
 )
+from server.export import encode_csv, encode_jsonl, encode_snapshot
+from server.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY
+from server.querystats import STATS as QUERY_STATS
+from server.quiz import DEFAULT_SESSION, QuizDeckCache, build_quiz, session_seed
+from server.similarity import DEFAULT_PATH as SIMILARITY_INDEX_PATH, IndexFile
+from server.srs import review_assignments
 from server.util import (
     open_file,
+    open_request_body,
     db_operation,
     convert_to_activity_type_for_display,
     convert_to_date_for_display
@@ -21,11 +32,121 @@ from server.util import (
 
 DB_FLAG = Flag()
 
-TODAY = date.today()
+# 一括更新の最大操作数
+BATCH_MAX_OPERATIONS = 1000
+
+# 一括取り込みで返却するエラー行の最大数
+IMPORT_MAX_ERRORS = 10
+
+# 学習画面で1回に出題する最大単語数
+LEARNING_MAX_WORDS = 100
+
+# 学習画面のセッション名の最大長
+LEARNING_MAX_SESSION = 64
+
+# 単語検索の既定件数、最大件数、検索文字列の最大長
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+SEARCH_MAX_LENGTH = 100
+
+# 入力補完の既定件数、最大件数
+AUTOCOMPLETE_DEFAULT_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+
+# SQL実行統計の既定件数、最大件数
+QUERY_STATS_DEFAULT_LIMIT = 10
+QUERY_STATS_MAX_LIMIT = 100
+
+# ダッシュボードの習得ログの既定の日数、指定できる日数
+LEARNING_LOG_DAYS = 7
+LEARNING_LOG_RANGES = (7, 30, 90, 365)
 
-logging.config.fileConfig('./setting/logging.conf')
 LOGGER = logging.getLogger()
 
+# 現在の日付(TIMEZONEのタイムゾーンの0時に切り替わる)
+CLOCK = Clock.from_env()
+
+
+# アクティビティ書き込みキュー
+# 無効(ACTIVITY_QUEUE_MODE=sync)の場合、単語の更新とアクティビティ登録は1文で行う
+ACTIVITY_QUEUE = ActivityQueue.from_env()
+
+
+def _split_activity_text(activity_text, *args):
+    """アクティビティ詳細を英語の前後に分割
+
+    SQL側で英語を埋め込むために使用する
+
+    @param activity_text アクティビティ詳細生成関数(第1引数が英語)
+    @param args 英語以外の引数
+    @return 英語より前、英語より後
+    """
+    marker = '\uffff'
+    prefix, suffix = activity_text(marker, *args).split(marker, 1)
+    return prefix, suffix
+
+
+# 類似語インデックス(ファイルがなければ不正解は無作為に選ぶ)
+SIMILARITY_INDEX = IndexFile(os.environ.get('SIMILARITY_INDEX', SIMILARITY_INDEX_PATH))
+
+
+def _similar():
+    """類似語検索関数取得
+
+    @return 類似語検索関数(インデックスがなければNone)
+    """
+    index = SIMILARITY_INDEX.get()
+    return index.similar if index is not None else None
+
+
+def _load_learning_deck(db_word, seed, size):
+    """出題デッキ作成
+
+    出題日時を過ぎた単語を出題日時順にsize件まで問題にする
+
+    @param db_word Word
+    @param seed 乱数シード
+    @param size 最大件数
+    @return 問題のリスト
+    """
+    return build_quiz(
+        db_word.select_due(size), db_word.select_incorrect(), _similar(), seed)
+
+
+def _load_learning_item(db_word, pkey, seed):
+    """問題作成
+
+    @param db_word Word
+    @param pkey PKEY
+    @param seed 乱数シード
+    @return 問題(出題日時前の場合はNone)
+    """
+    row = db_word.select_due_by_pkey(pkey)
+    if row is None:
+        return None
+    return build_quiz([row], db_word.select_incorrect(), _similar(), seed)[0]
+
+
+# 学習画面の出題デッキキャッシュ
+QUIZ_DECKS = QuizDeckCache.from_env(
+    _load_learning_deck, _load_learning_item, Word, LEARNING_MAX_WORDS)
+
+
+def _load_english():
+    """入力補完用の全英単語取得
+
+    @return 英単語のリスト
+    """
+    db_word = Word()
+    try:
+        return [english for english, in db_word.stream_table(['english'])]
+    finally:
+        db_word.conn.close()
+
+
+# 英単語の入力補完インデックス(初回の補完時に読み込む)
+AUTOCOMPLETE = PrefixIndex(_load_english)
+
 
 class BadRequest(NamedTuple):
     """ BadRequestレスポンス """
@@ -111,6 +232,31 @@ class StaticResponse(ResponseBase):
         super().__init__(self._content_types[suffix], open_file(req_path))
 
 
+class StreamResponse(ResponseBase):
+    """ ストリーミングレスポンス
+
+    ボディはバイト列のイテラブル
+    """
+    def __init__(self, content_type, body):
+        """コンストラクタ
+
+        @param content_type コンテンツタイプ
+        @param body バイト列のイテラブル
+        """
+        super().__init__(content_type, body)
+
+
+class TextResponse(ResponseBase):
+    """ テキストレスポンス """
+    def __init__(self, content_type, body):
+        """コンストラクタ
+
+        @param content_type コンテンツタイプ
+        @param body ボディ(文字列)
+        """
+        super().__init__(content_type, body)
+
+
 class JsonResponse(ResponseBase):
     """ JSONレスポンス """
     def __init__(self, body):
@@ -130,6 +276,17 @@ class Validate:
         """
         self._req_data = self._validate_json(req_data)
 
+    @classmethod
+    def from_object(cls, req_data):
+        """デコード済みのデータからインスタンス生成
+
+        @param req_data リクエストデータ(Python オブジェクト)
+        @return Validate
+        """
+        inst = cls.__new__(cls)
+        inst._req_data = req_data
+        return inst
+
     def _validate_json(self, req_data):
         """JSONバリデーション
 
@@ -182,6 +339,50 @@ class Validate:
             'jap_val': self._req_data['jap_val']
         }
 
+    @_validate
+    def validate_batch(self):
+        """一括更新バリデーション
+
+        1件ずつ検証し、不正な操作はValueErrorとして返却する
+
+        @return バリデート済みデータ、またはValueErrorのリスト
+        @exception ValueError 配列でない、操作数が上限を超える
+        """
+        if not isinstance(self._req_data, list) or\
+                not 0 < len(self._req_data) <= BATCH_MAX_OPERATIONS:
+            raise ValueError()
+
+        cleaned_data = []
+        for item in self._req_data:
+            try:
+                cleaned_data.append(Validate.from_object(item).validate_operation())
+            except ValueError as err:
+                cleaned_data.append(err)
+        return cleaned_data
+
+    @_validate
+    def validate_operation(self):
+        """一括更新の1操作バリデーション
+
+        @return バリデート済みデータ
+        @retval op 操作(is_correct、bookmark、register、delete)
+        @retval pkey PKEY(register以外)
+        @retval flag 論理値(is_correct、bookmark)
+        @retval eng_val 英語(register)
+        @retval jap_val 日本語(register)
+        """
+        operation = self._req_data['op']
+        if operation in ('is_correct', 'bookmark'):
+            return {'op': operation, **self.validate_pkey_flag()}
+        if operation == 'register':
+            cleaned_data = self.validate_register()
+            if not all(isinstance(val, str) for val in cleaned_data.values()):
+                raise ValueError()
+            return {'op': operation, **cleaned_data}
+        if operation == 'delete':
+            return {'op': operation, 'pkey': self.validate_pkey()}
+        raise ValueError(operation)
+
     @_validate
     def validate_pkey(self):
         """PKEYバリデーション
@@ -218,10 +419,18 @@ class Validate:
 
 
 class DashboardView:
-    """ ダッシュボード画面 """
-    def __init__(self):
+    """ ダッシュボード画面
+
+    習得ログの日数はクエリのdaysで指定する(LEARNING_LOG_RANGESのいずれか)
+    """
+    TAKES_ENVIRON = True
+
+    def __init__(self, req_data=None):
         """コンストラクタ
+
+        @param req_data リクエストデータ(WSGI環境変数)
         """
+        self._req_data = req_data or {}
         self._db_word = Word()
         self._db_activity = Activity()
 
@@ -233,13 +442,26 @@ class DashboardView:
         @retval activitys アクティビティデータ
         @retval learningLog 習得ログデータ
         """
+        days = self._validate()
         dashboard_data = {
             'total': self._count_num(),
             'activitys': self._select_activity_order_by_desc_limit_7(),
-            'learningLog': self._select_count_learning_date(),
+            'learningLog': self._select_count_learning_date(days),
         }
         return JsonResponse(dashboard_data)
 
+    def _validate(self):
+        """クエリバリデーション
+
+        @return 習得ログの日数
+        @exception ValueError
+        """
+        query = parse_qs(self._req_data.get('QUERY_STRING', ''))
+        days = int(query.get('days', [LEARNING_LOG_DAYS])[0])
+        if days not in LEARNING_LOG_RANGES:
+            raise ValueError(f'invalid days: {days}')
+        return days
+
     @db_operation
     def _count_num(self):
         """登録単語数、習得済み単語数、ブックマーク数カウント
@@ -272,16 +494,20 @@ class DashboardView:
         return rows
 
     @db_operation
-    def _select_count_learning_date(self):
+    def _select_count_learning_date(self, days=LEARNING_LOG_DAYS):
         """習得ログ取得
 
+        日ごとの集計(activity_daily)から取得するため、全プロセスで書き込みが即座に反映される
+
+        @param days 日数
         @return 習得ログ
         @retval count 習得単語数
         @retval date アクティビティ日付
         """
+        from_date, to_date = CLOCK.window(days)
         rows = self._db_activity.select_count_learning_date(
-            from_date=TODAY - timedelta(days=7),
-            to_date=TODAY
+            from_date=from_date,
+            to_date=to_date
         )
         for row in rows:
             try:
@@ -292,10 +518,20 @@ class DashboardView:
 
 
 class LearningView:
-    """ 学習画面 """
-    def __init__(self):
+    """ 学習画面
+
+    クエリのsessionごとにキャッシュした出題デッキからoffset、limitの範囲を返却する
+    乱数シードはクエリのseed、指定がなければsessionから求めるため、
+    同じクエリには同じ問題を返却する
+    """
+    TAKES_ENVIRON = True
+
+    def __init__(self, req_data=None):
         """コンストラクタ
+
+        @param req_data リクエストデータ(WSGI環境変数)
         """
+        self._req_data = req_data or {}
         self._db_word = Word()
 
     def view(self):
@@ -310,12 +546,33 @@ class LearningView:
         @retval incorrect_3 不正解の日本語
         @retval bookmark_flag 論理値
         """
-        return JsonResponse(self._select_learning())
+        return JsonResponse(self._select_learning(*self._validate()))
+
+    def _validate(self):
+        """クエリバリデーション
+
+        @return セッション、乱数シード、開始位置、最大件数
+        @exception ValueError
+        """
+        query = parse_qs(self._req_data.get('QUERY_STRING', ''))
+        session = query.get('session', [DEFAULT_SESSION])[0]
+        seed = int(query['seed'][0]) if 'seed' in query else session_seed(session)
+        offset = int(query.get('offset', [0])[0])
+        limit = int(query.get('limit', [LEARNING_MAX_WORDS])[0])
+        if not session or len(session) > LEARNING_MAX_SESSION:
+            raise ValueError('invalid session')
+        if offset < 0 or not 0 < limit <= LEARNING_MAX_WORDS:
+            raise ValueError('invalid range')
+        return session, seed, offset, limit
 
     @db_operation
-    def _select_learning(self):
+    def _select_learning(self, session, seed, offset, limit):
         """学習データ取得
 
+        @param session セッション
+        @param seed 乱数シード
+        @param offset 開始位置(未回答の問題の位置)
+        @param limit 最大件数
         @return 学習データ
         @retval id PKEY
         @retval english 英単語
@@ -325,9 +582,7 @@ class LearningView:
         @retval incorrect_3 不正解の日本語
         @retval bookmark_flag 論理値
         """
-        return self._convert_to_learning_for_display(
-            self._db_word.select_learning(), self._db_word.select_incorrect()
-        )
+        return QUIZ_DECKS.get(session, seed, offset, limit, self._db_word)
 
     def _convert_to_learning_for_display(self, corrects, incorrects):
         """学習データを表示用に変換
@@ -335,38 +590,8 @@ class LearningView:
         @param corrects 正解データ
         @param incorrects 不正解用の日本語データ
         @return 学習データ
-        @retval id PKEY
-        @retval english 英単語
-        @retval correct 正解の日本語
-        @retval incorrect_1 不正解の日本語
-        @retval incorrect_2 不正解の日本語
-        @retval incorrect_3 不正解の日本語
-        @retval bookmark_flag 論理値
         """
-        data = []
-        for correct in corrects:
-            incorrects_list = []
-
-            while True:
-                incorrect = incorrects[randint(0, len(incorrects)-1)]
-                if incorrect != correct['japanese']:
-                    incorrects_list.extend(incorrect)
-
-                if len(incorrects_list) == 3:
-                    break
-
-            answer_list = [
-                correct['japanese'], incorrects_list[0],
-                incorrects_list[1], incorrects_list[2]
-            ]
-            data.append({
-                'id': correct['id'],
-                'english': correct['english'],
-                'answers': sample(answer_list, len(answer_list)),
-                'correct': correct['japanese'],
-                'bookmark_flag': correct['bookmark']
-            })
-        return data
+        return build_quiz(corrects, incorrects, _similar())
 
 
 class EnglishListView:
@@ -400,6 +625,120 @@ class EnglishListView:
         return self._db_word.select_english_list()
 
 
+class SearchView:
+    """ 単語検索
+
+    クエリのqを、modeで指定した方法(prefix、substring、fuzzy)で
+    fieldで指定したカラム(english、japanese、both)から検索する
+    """
+    TAKES_ENVIRON = True
+
+    def __init__(self, req_data):
+        """コンストラクタ
+
+        @param req_data リクエストデータ(WSGI環境変数)
+        """
+        self._req_data = req_data
+        self._db_word = Word()
+
+    def view(self):
+        """レスポンス
+
+        @return JSONレスポンス
+        @retval id PKEY
+        @retval english 英単語
+        @retval japanese 日本語
+        @retval is_correct 論理値
+        @retval bookmark 論理値
+        """
+        return JsonResponse(self._search(*self._validate()))
+
+    def _validate(self):
+        """クエリバリデーション
+
+        @return 検索文字列、検索方法、検索対象のカラムのリスト、最大件数
+        @exception ValueError
+        """
+        query = parse_qs(self._req_data.get('QUERY_STRING', ''))
+        pattern = query.get('q', [''])[0].strip()
+        mode = query.get('mode', ['substring'])[0]
+        field = query.get('field', ['both'])[0]
+        limit = int(query.get('limit', [SEARCH_DEFAULT_LIMIT])[0])
+        if not pattern or len(pattern) > SEARCH_MAX_LENGTH:
+            raise ValueError('invalid q')
+        if mode not in Word.SEARCH_MODES:
+            raise ValueError(f'invalid mode: {mode}')
+        if field == 'both':
+            columns = list(Word.SEARCH_COLUMNS)
+        elif field in Word.SEARCH_COLUMNS:
+            columns = [field]
+        else:
+            raise ValueError(f'invalid field: {field}')
+        if not 0 < limit <= SEARCH_MAX_LIMIT:
+            raise ValueError('invalid limit')
+        return pattern, mode, columns, limit
+
+    @db_operation
+    def _search(self, pattern, mode, columns, limit):
+        """単語検索
+
+        @param pattern 検索文字列
+        @param mode 検索方法
+        @param columns 検索対象のカラムのリスト
+        @param limit 最大件数
+        @return 検索結果
+        """
+        return self._db_word.search(pattern, mode, columns, limit)
+
+
+class AutocompleteView:
+    """ 英単語の入力補完
+
+    クエリのqで始まる英単語をlimit件まで返却する(大文字小文字を区別しない)
+    """
+    TAKES_ENVIRON = True
+
+    def __init__(self, req_data):
+        """コンストラクタ
+
+        @param req_data リクエストデータ(WSGI環境変数)
+        """
+        self._req_data = req_data
+
+    def view(self):
+        """レスポンス
+
+        @return JSONレスポンス(英単語のリスト)
+        """
+        prefix, limit = self._validate()
+        return JsonResponse(self._complete(prefix, limit))
+
+    def _validate(self):
+        """クエリバリデーション
+
+        @return 入力中の文字列、最大件数
+        @exception ValueError
+        """
+        query = parse_qs(self._req_data.get('QUERY_STRING', ''))
+        prefix = query.get('q', [''])[0]
+        limit = int(query.get('limit', [AUTOCOMPLETE_DEFAULT_LIMIT])[0])
+        if not prefix or len(prefix) > SEARCH_MAX_LENGTH:
+            raise ValueError('invalid q')
+        if not 0 < limit <= AUTOCOMPLETE_MAX_LIMIT:
+            raise ValueError('invalid limit')
+        return prefix, limit
+
+    @db_operation
+    def _complete(self, prefix, limit):
+        """入力補完
+
+        @param prefix 入力中の文字列
+        @param limit 最大件数
+        @return 英単語のリスト
+        """
+        return AUTOCOMPLETE.complete(prefix, limit)
+
+
 class BookMarkView:
     """ ブックマーク画面 """
     def __init__(self):
@@ -472,7 +811,6 @@ class UpdateIsCorrectFlagView:
         """
         self._req_data = req_data
         self._db_word = Word()
-        self._db_activity = Activity()
 
     def view(self):
         """レスポンス
@@ -481,7 +819,10 @@ class UpdateIsCorrectFlagView:
         @retval msg 更新完了メッセージ
         """
         cleaned_data = self._validate()
-        return JsonResponse({'msg': self._update_is_correct_flag(cleaned_data)})
+        msg = self._update_is_correct_flag(cleaned_data)
+        QUIZ_DECKS.update_correct(
+            cleaned_data.get('pkey'), cleaned_data.get('flag') == DB_FLAG.TRUE)
+        return JsonResponse({'msg': msg})
 
     def _validate(self):
         """更新データバリデーション
@@ -493,15 +834,42 @@ class UpdateIsCorrectFlagView:
         inst = Validate(self._req_data)
         return inst.validate_pkey_flag()
 
+    @staticmethod
+    def activity_text(eng_val, flag):
+        """アクティビティ詳細
+
+        @param eng_val 英語
+        @param flag 論理値
+        @return アクティビティ詳細
+        """
+        _activity_text = '習得' if flag == DB_FLAG.TRUE else '未習得に変更'
+        return f'{eng_val}を{_activity_text}しました'
+
     @db_operation
     def _update_is_correct_flag(self, cleaned_data):
         """is_correctフラグ更新
 
+        書き込みキューが無効なら更新とアクティビティ登録を1文で行う
+        回答結果として復習状態も更新する
+
         @param cleaned_data 更新データ
         @return 更新完了メッセージ
         """
-        eng_val = self._db_word.update_is_correct_flag(**cleaned_data)
-        return self._register_activity(eng_val, cleaned_data.get('flag'))
+        flag = cleaned_data.get('flag')
+        assignments = review_assignments(flag == DB_FLAG.TRUE)
+        if ACTIVITY_QUEUE.enabled:
+            eng_val = self._db_word.update_is_correct_flag(
+                **cleaned_data, assignments=assignments)
+            return self._register_activity(eng_val, flag)
+
+        type_id, _ = Activity.TYPE[0]
+        eng_val = self._db_word.update_flag_with_activity(
+            'is_correct', cleaned_data.get('pkey'), flag,
+            (CLOCK.today(), type_id, *_split_activity_text(self.activity_text, flag)),
+            assignments=assignments)
+        activity_text = self.activity_text(eng_val, flag)
+        LOGGER.info(activity_text)
+        return activity_text
 
     @db_operation
     def _register_activity(self, eng_val, flag):
@@ -511,10 +879,9 @@ class UpdateIsCorrectFlagView:
         @param flag 論理値
         @return activity_text 更新完了メッセージ
         """
-        type_id, _ = self._db_activity.TYPE[0]
-        _activity_text = '習得' if flag == DB_FLAG.TRUE else '未習得に変更'
-        activity_text = f'{eng_val}を{_activity_text}しました'
-        self._db_activity.insert(TODAY, type_id, activity_text)
+        type_id, _ = Activity.TYPE[0]
+        activity_text = self.activity_text(eng_val, flag)
+        ACTIVITY_QUEUE.put(CLOCK.today(), type_id, activity_text)
         LOGGER.info(activity_text)
         return activity_text
 
@@ -528,7 +895,6 @@ class UpdateBookmarkView:
         """
         self._req_data = req_data
         self._db_word = Word()
-        self._db_activity = Activity()
 
     def view(self):
         """レスポンス
@@ -537,7 +903,10 @@ class UpdateBookmarkView:
         @retval msg 更新完了メッセージ
         """
         cleaned_data = self._validate()
-        return JsonResponse({'msg': self._update_bookmark_flag(cleaned_data)})
+        msg = self._update_bookmark_flag(cleaned_data)
+        QUIZ_DECKS.patch(
+            cleaned_data.get('pkey'), bookmark_flag=cleaned_data.get('flag') == DB_FLAG.TRUE)
+        return JsonResponse({'msg': msg})
 
     def _validate(self):
         """更新データバリデーション
@@ -549,15 +918,38 @@ class UpdateBookmarkView:
         inst = Validate(self._req_data)
         return inst.validate_pkey_flag()
 
+    @staticmethod
+    def activity_text(eng_val, flag):
+        """アクティビティ詳細
+
+        @param eng_val 英語
+        @param flag 論理値
+        @return アクティビティ詳細
+        """
+        _activity_text = 'ブックマーク登録' if flag == DB_FLAG.TRUE else 'ブックマーク解除'
+        return f'{eng_val}を{_activity_text}しました'
+
     @db_operation
     def _update_bookmark_flag(self, cleaned_data):
         """bookmarkフラグ更新
 
+        書き込みキューが無効なら更新とアクティビティ登録を1文で行う
+
         @param cleaned_data 更新データ
         @return 更新完了メッセージ
         """
-        eng_val = self._db_word.update_bookmark_flag(**cleaned_data)
-        return self._register_activity(eng_val, cleaned_data.get('flag'))
+        flag = cleaned_data.get('flag')
+        if ACTIVITY_QUEUE.enabled:
+            eng_val = self._db_word.update_bookmark_flag(**cleaned_data)
+            return self._register_activity(eng_val, flag)
+
+        type_id, _ = Activity.TYPE[3]
+        eng_val = self._db_word.update_flag_with_activity(
+            'bookmark', cleaned_data.get('pkey'), flag,
+            (CLOCK.today(), type_id, *_split_activity_text(self.activity_text, flag)))
+        activity_text = self.activity_text(eng_val, flag)
+        LOGGER.info(activity_text)
+        return activity_text
 
     @db_operation
     def _register_activity(self, eng_val, flag):
@@ -567,10 +959,9 @@ class UpdateBookmarkView:
         @param flag 論理値
         @return activity_text 更新完了メッセージ
         """
-        type_id, _ = self._db_activity.TYPE[3]
-        _activity_text = 'ブックマーク登録' if flag == DB_FLAG.TRUE else 'ブックマーク解除'
-        activity_text = f'{eng_val}を{_activity_text}しました'
-        self._db_activity.insert(TODAY, type_id, activity_text)
+        type_id, _ = Activity.TYPE[3]
+        activity_text = self.activity_text(eng_val, flag)
+        ACTIVITY_QUEUE.put(CLOCK.today(), type_id, activity_text)
         LOGGER.info(activity_text)
         return activity_text
 
@@ -584,7 +975,6 @@ class RegisterWordView:
         """
         self._req_data = req_data
         self._db_word = Word()
-        self._db_activity = Activity()
 
     def view(self):
         """レスポンス
@@ -593,7 +983,9 @@ class RegisterWordView:
         @retval msg 登録完了メッセージ
         """
         cleaned_data = self._validate()
-        return JsonResponse({'msg': self._insert(cleaned_data)})
+        msg = self._insert(cleaned_data)
+        AUTOCOMPLETE.add(cleaned_data.get('eng_val'))
+        return JsonResponse({'msg': msg})
 
     def _validate(self):
         """登録データバリデーション
@@ -605,18 +997,39 @@ class RegisterWordView:
         inst = Validate(self._req_data)
         return inst.validate_register()
 
+    @staticmethod
+    def activity_text(eng_val, jap_val):
+        """アクティビティ詳細
+
+        @param eng_val 英語
+        @param jap_val 日本語
+        @return アクティビティ詳細
+        """
+        return f'英語: {eng_val} 日本語: {jap_val} を登録しました'
+
     @db_operation
     def _insert(self, cleaned_data):
         """英語登録
 
+        書き込みキューが無効なら登録とアクティビティ登録を1文で行う
+
         @param cleaned_data 登録データ
         @return 登録完了メッセージ
         """
-        self._db_word.insert(**cleaned_data)
-        return self._register_activity(
-            cleaned_data.get('eng_val'),
-            cleaned_data.get('jap_val')
-        )
+        if ACTIVITY_QUEUE.enabled:
+            self._db_word.insert(**cleaned_data)
+            return self._register_activity(
+                cleaned_data.get('eng_val'),
+                cleaned_data.get('jap_val')
+            )
+
+        type_id, _ = Activity.TYPE[1]
+        activity_text = self.activity_text(
+            cleaned_data.get('eng_val'), cleaned_data.get('jap_val'))
+        self._db_word.insert_with_activity(
+            **cleaned_data, activity=(CLOCK.today(), type_id, activity_text))
+        LOGGER.info(activity_text)
+        return activity_text
 
     @db_operation
     def _register_activity(self, eng_val, jap_val):
@@ -626,9 +1039,9 @@ class RegisterWordView:
         @param jap_val 日本語
         @return activity_text 登録完了メッセージ
         """
-        type_id, _ = self._db_activity.TYPE[1]
-        activity_text = f'英語: {eng_val} 日本語: {jap_val} を登録しました'
-        self._db_activity.insert(TODAY, type_id, activity_text)
+        type_id, _ = Activity.TYPE[1]
+        activity_text = self.activity_text(eng_val, jap_val)
+        ACTIVITY_QUEUE.put(CLOCK.today(), type_id, activity_text)
         LOGGER.info(activity_text)
         return activity_text
 
@@ -642,7 +1055,6 @@ class DeleteView:
         """
         self._req_data = req_data
         self._db_word = Word()
-        self._db_activity = Activity()
 
     def view(self):
         """レスポンス
@@ -651,7 +1063,9 @@ class DeleteView:
         @retval msg 削除完了メッセージ
         """
         cleaned_data = self._validate()
-        return JsonResponse({'msg': self._delete(cleaned_data)})
+        msg = self._delete(cleaned_data)
+        QUIZ_DECKS.discard(cleaned_data)
+        return JsonResponse({'msg': msg})
 
     def _validate(self):
         """削除データバリデーション
@@ -662,15 +1076,36 @@ class DeleteView:
         inst = Validate(self._req_data)
         return inst.validate_pkey()
 
+    @staticmethod
+    def activity_text(eng_val):
+        """アクティビティ詳細
+
+        @param eng_val 英語
+        @return アクティビティ詳細
+        """
+        return f'{eng_val}を削除しました'
+
     @db_operation
     def _delete(self, pkey):
         """英語削除
 
+        書き込みキューが無効なら削除とアクティビティ登録を1文で行う
+
         @param pkey PKEY
         @return 削除完了メッセージ
         """
-        eng_val = self._db_word.delete(pkey)
-        return self._register_activity(eng_val)
+        if ACTIVITY_QUEUE.enabled:
+            eng_val = self._db_word.delete(pkey)
+            AUTOCOMPLETE.discard(eng_val)
+            return self._register_activity(eng_val)
+
+        type_id, _ = Activity.TYPE[2]
+        eng_val = self._db_word.delete_with_activity(
+            pkey, (CLOCK.today(), type_id, *_split_activity_text(self.activity_text)))
+        AUTOCOMPLETE.discard(eng_val)
+        activity_text = self.activity_text(eng_val)
+        LOGGER.info(activity_text)
+        return activity_text
 
     @db_operation
     def _register_activity(self, eng_val):
@@ -679,8 +1114,449 @@ class DeleteView:
         @param eng_val 英語
         @return activity_text 削除完了メッセージ
         """
-        type_id, _ = self._db_activity.TYPE[2]
-        activity_text = f'{eng_val}を削除しました'
-        self._db_activity.insert(TODAY, type_id, activity_text)
+        type_id, _ = Activity.TYPE[2]
+        activity_text = self.activity_text(eng_val)
+        ACTIVITY_QUEUE.put(CLOCK.today(), type_id, activity_text)
         LOGGER.info(activity_text)
         return activity_text
+
+
+class BatchView:
+    """ 一括更新
+
+    フラグ更新、単語登録、削除をまとめて1トランザクションで反映する
+    リクエストの順に、連続する同じ操作ごとにまとめて適用する
+    """
+    def __init__(self, req_data):
+        """コンストラクタ
+
+        @param req_data リクエストデータ
+        """
+        self._req_data = req_data
+        self._db_word = Word()
+        self._db_activity = Activity(self._db_word.conn)
+
+    def view(self):
+        """レスポンス
+
+        @return JSONレスポンス
+        @retval results 操作ごとの結果(ok、msg または error)
+        """
+        cleaned_data = self._validate()
+        return JsonResponse({'results': self._apply(cleaned_data)})
+
+    def _validate(self):
+        """一括更新データバリデーション
+
+        @return バリデート済みデータ、またはValueErrorのリスト
+        """
+        inst = Validate(self._req_data)
+        return inst.validate_batch()
+
+    @staticmethod
+    def _runs(cleaned_data):
+        """連続する同じ操作ごとに分割
+
+        @param cleaned_data バリデート済みデータ、またはValueErrorのリスト
+        @return (操作, (インデックス, バリデート済みデータ)のリスト)のリスト(リクエストの順)
+        """
+        runs = []
+        for index, item in enumerate(cleaned_data):
+            if isinstance(item, ValueError):
+                continue
+            if runs and runs[-1][0] == item['op']:
+                runs[-1][1].append((index, item))
+            else:
+                runs.append((item['op'], [(index, item)]))
+        return runs
+
+    @db_operation
+    def _apply(self, cleaned_data):
+        """一括更新
+
+        書き込みキューが無効ならアクティビティも同じトランザクションで登録する
+
+        @param cleaned_data バリデート済みデータ、またはValueErrorのリスト
+        @return 操作ごとの結果
+        """
+        results = [{'ok': False, 'error': 'BadRequest'}] * len(cleaned_data)
+        runs = self._runs(cleaned_data)
+
+        activities, deleted = [], {}
+        with transaction(self._db_word, self._db_activity):
+            for op, items in runs:
+                if op == 'register':
+                    self._register(items, results, activities)
+                elif op == 'is_correct':
+                    self._update_flags(
+                        op, items, results, activities,
+                        self._db_activity.TYPE[0][0], UpdateIsCorrectFlagView.activity_text)
+                elif op == 'bookmark':
+                    self._update_flags(
+                        op, items, results, activities,
+                        self._db_activity.TYPE[3][0], UpdateBookmarkView.activity_text)
+                else:
+                    deleted.update(self._delete(items, results, activities))
+            if activities and not ACTIVITY_QUEUE.enabled:
+                self._db_activity.insert_many(activities)
+        if ACTIVITY_QUEUE.enabled:
+            ACTIVITY_QUEUE.put_many(activities)
+
+        for _, _, activity_text in activities:
+            LOGGER.info(activity_text)
+        self._update_caches(runs, results, deleted)
+        return results
+
+    @staticmethod
+    def _update_caches(runs, results, deleted):
+        """成功した操作をリクエストの順に出題デッキキャッシュ、入力補完インデックスに反映
+
+        @param runs (操作, (インデックス, バリデート済みデータ)のリスト)のリスト
+        @param results 操作ごとの結果
+        @param deleted {<インデックス>: <削除した英語>}
+        """
+        for op, items in runs:
+            for index, item in items:
+                if not results[index]['ok']:
+                    continue
+                if op == 'register':
+                    AUTOCOMPLETE.add(item['eng_val'])
+                elif op == 'is_correct':
+                    QUIZ_DECKS.update_correct(item['pkey'], item['flag'] == DB_FLAG.TRUE)
+                elif op == 'bookmark':
+                    QUIZ_DECKS.patch(item['pkey'], bookmark_flag=item['flag'] == DB_FLAG.TRUE)
+                else:
+                    QUIZ_DECKS.discard(item['pkey'])
+                    AUTOCOMPLETE.discard(deleted[index])
+
+    def _register(self, items, results, activities):
+        """単語一括登録
+
+        @param items (インデックス, バリデート済みデータ)のリスト
+        @param results 操作ごとの結果
+        @param activities 登録するアクティビティのリスト
+        """
+        rows = {item['eng_val']: item['jap_val'] for _, item in items}
+        self._db_word.insert_many(list(rows.items()))
+
+        type_id, _ = self._db_activity.TYPE[1]
+        for index, item in items:
+            activity_text = RegisterWordView.activity_text(item['eng_val'], item['jap_val'])
+            activities.append((CLOCK.today(), type_id, activity_text))
+            results[index] = {'ok': True, 'msg': activity_text}
+
+    def _update_flags(self, column, items, results, activities, type_id, activity_text):
+        """フラグ一括更新
+
+        @param column カラム
+        @param items (インデックス, バリデート済みデータ)のリスト
+        @param results 操作ごとの結果
+        @param activities 登録するアクティビティのリスト
+        @param type_id アクティビティ種別ID
+        @param activity_text アクティビティ詳細生成関数
+        """
+        rows = {item['pkey']: item['flag'] for _, item in items}
+        # is_correctは回答結果として復習状態も更新する
+        assignments = review_assignments('v.flag') if column == 'is_correct' else None
+        updated = self._db_word.update_flags(column, list(rows.items()), assignments)
+
+        for index, item in items:
+            eng_val = updated.get(item['pkey'])
+            if eng_val is None:
+                results[index] = {'ok': False, 'error': 'NotFound'}
+                continue
+            text = activity_text(eng_val, item['flag'])
+            activities.append((CLOCK.today(), type_id, text))
+            results[index] = {'ok': True, 'msg': text}
+
+    def _delete(self, items, results, activities):
+        """単語一括削除
+
+        @param items (インデックス, バリデート済みデータ)のリスト
+        @param results 操作ごとの結果
+        @param activities 登録するアクティビティのリスト
+        @return {<インデックス>: <削除した英語>}
+        """
+        deleted = self._db_word.delete_many(list({item['pkey'] for _, item in items}))
+
+        type_id, _ = self._db_activity.TYPE[2]
+        eng_vals = {}
+        for index, item in items:
+            # 同じPKEYの2件目以降は削除済み
+            eng_val = deleted.pop(item['pkey'], None)
+            if eng_val is None:
+                results[index] = {'ok': False, 'error': 'NotFound'}
+                continue
+            activity_text = DeleteView.activity_text(eng_val)
+            activities.append((CLOCK.today(), type_id, activity_text))
+            results[index] = {'ok': True, 'msg': activity_text}
+            eng_vals[index] = eng_val
+        return eng_vals
+
+
+class ImportView:
+    """ 単語一括取り込み
+
+    CSV、TSV(1列目: 英語、2列目: 日本語)のボディを逐次読み込み、
+    COPYでステージングテーブルに取り込んでからwordにマージする
+    """
+    TAKES_ENVIRON = True
+
+    def __init__(self, req_data):
+        """コンストラクタ
+
+        @param req_data リクエストデータ(WSGI環境変数)
+        """
+        self._req_data = req_data
+        self._errors = []
+        self._rejected = 0
+        self._db_word = Word()
+        self._db_activity = Activity(self._db_word.conn)
+
+    def view(self):
+        """レスポンス
+
+        @return JSONレスポンス
+        @retval msg 取り込み完了メッセージ
+        @retval imported 取り込んだ単語数
+        @retval rejected 不正な行数
+        @retval errors 不正な行(先頭IMPORT_MAX_ERRORS件)
+        """
+        if self._req_data.get('REQUEST_METHOD') != 'POST':
+            raise ValueError('POST only')
+        rows = self._validate(self._reader())
+        imported = self._import(rows)
+        return JsonResponse({
+            'msg': self._activity_text(imported),
+            'imported': imported,
+            'rejected': self._rejected,
+            'errors': self._errors,
+        })
+
+    def _reader(self):
+        """CSV、TSVリーダー生成
+
+        クエリのformat=tsv、またはContent-Typeがtext/tab-separated-valuesならTSV
+
+        @return csv.reader
+        @exception ValueError Content-Lengthが不正
+        """
+        query = parse_qs(self._req_data.get('QUERY_STRING', ''))
+        content_type = self._req_data.get('CONTENT_TYPE', '')
+        is_tsv = query.get('format', [''])[0] == 'tsv' or\
+            content_type.startswith('text/tab-separated-values')
+        return csv.reader(open_request_body(self._req_data), delimiter='\t' if is_tsv else ',')
+
+    def _validate(self, reader):
+        """取り込みデータを1行ずつバリデーション
+
+        不正な行は読み飛ばして件数を記録する
+
+        @param reader csv.reader
+        @return (英語, 日本語)のジェネレータ
+        """
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as err:
+                raise ValueError(f'line {reader.line_num}: {err}')
+            if reader.line_num == 1 and [col.strip().lower() for col in row] ==\
+                    ['english', 'japanese']:
+                # ヘッダー行
+                continue
+            if not row:
+                continue
+            try:
+                if len(row) != 2:
+                    raise ValueError(f'expected 2 columns, got {len(row)}')
+                cleaned_data = Validate.from_object(
+                    {'eng_val': row[0], 'jap_val': row[1]}).validate_register()
+            except ValueError as err:
+                self._rejected += 1
+                if len(self._errors) < IMPORT_MAX_ERRORS:
+                    self._errors.append({'line': reader.line_num, 'error': str(err)})
+                continue
+            yield cleaned_data['eng_val'], cleaned_data['jap_val']
+
+    @db_operation
+    def _import(self, rows):
+        """一括取り込み
+
+        0件の場合はアクティビティを登録しない
+
+        @param rows (英語, 日本語)のイテラブル
+        @return 取り込んだ単語数
+        """
+        with transaction(self._db_word, self._db_activity):
+            imported = self._db_word.import_rows(rows)
+            if not imported:
+                return 0
+            type_id, _ = self._db_activity.TYPE[1]
+            self._db_activity.insert(CLOCK.today(), type_id, self._activity_text(imported))
+        LOGGER.info(self._activity_text(imported))
+        # 取り込んだ単語は次回の補完時に読み込み直す
+        AUTOCOMPLETE.invalidate()
+        return imported
+
+    def _activity_text(self, imported):
+        """アクティビティ詳細
+
+        @param imported 取り込んだ単語数
+        @return アクティビティ詳細
+        """
+        return f'{imported}件の単語を一括登録しました'
+
+
+class ExportBody:
+    """ エクスポートのレスポンスボディ(WSGIのイテラブル)
+
+    WSGIサーバは送信完了、中断、送信前の破棄(HEADリクエストなど)のいずれでも
+    close()を呼び出すため、close()でカーソル、接続を閉じる
+    (未開始のジェネレータはclose()でfinallyが実行されないため、ジェネレータでは閉じない)
+    """
+    def __init__(self, db_table, rows, chunks):
+        """コンストラクタ
+
+        @param db_table テーブルクラスのインスタンス
+        @param rows 行のジェネレータ
+        @param chunks バイト列のジェネレータ
+        """
+        self._db_table = db_table
+        self._rows = rows
+        self._chunks = chunks
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._closed:
+            raise StopIteration
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            self.close()
+            raise
+
+    def close(self):
+        """カーソル、接続を閉じる(2回目以降は何もしない)
+        """
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._chunks.close()
+            self._rows.close()
+        finally:
+            self._db_table.conn.close()
+
+
+class ExportView:
+    """ エクスポート基底
+
+    クエリのformatでcsv、jsonl、bin(バイナリスナップショット)を指定する
+    サーバサイドカーソルから逐次変換して返却する
+    """
+    TAKES_ENVIRON = True
+    # 形式: (コンテンツタイプ, 変換関数)
+    FORMATS = {
+        'csv': ('text/csv; charset=utf-8', lambda table, columns, rows: encode_csv(columns, rows)),
+        'jsonl': ('application/x-ndjson', lambda table, columns, rows: encode_jsonl(columns, rows)),
+        'bin': ('application/octet-stream', encode_snapshot),
+    }
+    # テーブルクラス(Word、Activity)
+    TABLE = None
+
+    def __init__(self, req_data):
+        """コンストラクタ
+
+        @param req_data リクエストデータ(WSGI環境変数)
+        """
+        self._req_data = req_data
+
+    def view(self):
+        """レスポンス
+
+        @return ストリーミングレスポンス
+        """
+        content_type, encode = self._validate()
+        db_table = self.TABLE()
+        columns = column_names(db_table.table)
+        rows = db_table.stream_table(columns)
+        return StreamResponse(
+            content_type, ExportBody(db_table, rows, encode(db_table.table, columns, rows)))
+
+    def _validate(self):
+        """形式バリデーション
+
+        @return コンテンツタイプ、変換関数
+        @exception ValueError 不明な形式
+        """
+        query = parse_qs(self._req_data.get('QUERY_STRING', ''))
+        try:
+            return self.FORMATS[query.get('format', ['csv'])[0]]
+        except KeyError as err:
+            raise ValueError(err)
+
+
+class WordExportView(ExportView):
+    """ 単語エクスポート """
+    TABLE = Word
+
+
+class ActivityExportView(ExportView):
+    """ アクティビティエクスポート """
+    TABLE = Activity
+
+
+class MetricsView:
+    """ メトリクス(Prometheusのテキスト形式) """
+    def view(self):
+        """レスポンス
+
+        @return テキストレスポンス
+        """
+        return TextResponse(METRICS_CONTENT_TYPE, REGISTRY.render())
+
+
+class QueryStatsView:
+    """ SQL実行統計
+
+    合計実行時間の上位limit件を返却する(format=textならテキストの表)
+    """
+    TAKES_ENVIRON = True
+
+    def __init__(self, req_data):
+        """コンストラクタ
+
+        @param req_data リクエストデータ(WSGI環境変数)
+        """
+        self._req_data = req_data
+
+    def view(self):
+        """レスポンス
+
+        @return JSONレスポンス(querystats.QueryStats.top参照)
+        @return テキストレスポンス
+        """
+        limit, text = self._validate()
+        if text:
+            return TextResponse('text/plain; charset=utf-8', QUERY_STATS.report(limit) + '\n')
+        return JsonResponse(QUERY_STATS.top(limit))
+
+    def _validate(self):
+        """クエリバリデーション
+
+        @return 最大件数、論理値(テキストならTrue)
+        @exception ValueError
+        """
+        query = parse_qs(self._req_data.get('QUERY_STRING', ''))
+        limit = int(query.get('limit', [QUERY_STATS_DEFAULT_LIMIT])[0])
+        output_format = query.get('format', ['json'])[0]
+        if not 0 < limit <= QUERY_STATS_MAX_LIMIT:
+            raise ValueError('invalid limit')
+        if output_format not in ('json', 'text'):
+            raise ValueError(f'invalid format: {output_format}')
+        return limit, output_format == 'text'
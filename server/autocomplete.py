@@ -0,0 +1,226 @@
+"""英単語の入力補完
+
+英単語を小文字にしたキーの昇順に1つのUTF-8バイト列と終端位置の配列へ詰め、
+二分探索で前方一致する範囲を求める(Pythonオブジェクトを単語ごとに持たない)
+
+読み込み後の登録、削除は差分に記録して検索時に合わせ、
+差分が一定数を超えたら配列を作り直す
+"""
+from array import array
+from bisect import bisect_left, insort
+import logging
+import sys
+import threading
+
+
+LOGGER = logging.getLogger()
+
+# 差分がこの件数を超えたら配列を作り直す
+COMPACT_THRESHOLD = 4096
+
+
+class PrefixIndex:
+    """ 前方一致インデックス """
+    def __init__(self, load):
+        """コンストラクタ
+
+        @param load 英単語のイテラブルを返す関数(初回の検索時に呼び出す)
+        """
+        self._load = load
+        self._blob = b''
+        self._ends = array('I')
+        # キーと異なる(大文字を含む)英単語 {<行番号>: <英単語>}
+        self._originals = {}
+        # 差分(登録は(キー, 英単語)の昇順リスト、削除は英単語の集合)
+        self._added = []
+        self._removed = set()
+        self._loaded = False
+        self._loading = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def _build(self, words):
+        """配列作成
+
+        @param words 英単語のイテラブル
+        @return バイト列、終端位置の配列、キーと異なる英単語
+        """
+        blob, ends, originals = bytearray(), array('I'), {}
+        for row, word in enumerate(sorted(set(words), key=lambda word: (word.lower(), word))):
+            key = word.lower()
+            if key != word:
+                originals[row] = word
+            blob += key.encode('UTF-8')
+            ends.append(len(blob))
+        return bytes(blob), ends, originals
+
+    def ensure_loaded(self):
+        """未読み込みなら読み込む
+
+        読み込み中の登録、削除は差分に記録する
+        """
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            with self._lock:
+                self._loading = True
+            try:
+                blob, ends, originals = self._build(self._load())
+            finally:
+                with self._lock:
+                    self._loading = False
+            with self._lock:
+                self._blob, self._ends, self._originals = blob, ends, originals
+                self._loaded = True
+            LOGGER.info('入力補完インデックス: %s', self.memory_usage())
+
+    def invalidate(self):
+        """破棄(次回の検索時に読み込み直す)
+        """
+        with self._load_lock, self._lock:
+            self._blob, self._ends, self._originals = b'', array('I'), {}
+            self._added, self._removed = [], set()
+            self._loaded = False
+
+    def _key(self, row):
+        """キー取得
+
+        @param row 行番号
+        @return キー(バイト列)
+        """
+        return self._blob[self._ends[row - 1] if row else 0:self._ends[row]]
+
+    def _word(self, row):
+        """英単語取得
+
+        @param row 行番号
+        @return 英単語
+        """
+        word = self._originals.get(row)
+        return word if word is not None else self._key(row).decode('UTF-8')
+
+    def _lower_bound(self, key):
+        """キー以上の最初の行番号
+
+        @param key キー(バイト列)
+        @return 行番号
+        """
+        low, high = 0, len(self._ends)
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _contains(self, word):
+        """配列に含まれるか
+
+        @param word 英単語
+        @return 論理値
+        """
+        key = word.lower().encode('UTF-8')
+        row = self._lower_bound(key)
+        while row < len(self._ends) and self._key(row) == key:
+            if self._word(row) == word:
+                return True
+            row += 1
+        return False
+
+    def add(self, word):
+        """登録を反映
+
+        @param word 英単語
+        """
+        with self._lock:
+            if not self._loaded and not self._loading:
+                return
+            self._removed.discard(word)
+            entry = (word.lower(), word)
+            position = bisect_left(self._added, entry)
+            if position < len(self._added) and self._added[position] == entry:
+                return
+            if not self._loaded or not self._contains(word):
+                insort(self._added, entry)
+            self._compact()
+
+    def discard(self, word):
+        """削除を反映
+
+        @param word 英単語
+        """
+        with self._lock:
+            if not self._loaded and not self._loading:
+                return
+            entry = (word.lower(), word)
+            position = bisect_left(self._added, entry)
+            if position < len(self._added) and self._added[position] == entry:
+                del self._added[position]
+            if not self._loaded or self._contains(word):
+                self._removed.add(word)
+            self._compact()
+
+    def _compact(self):
+        """差分が多ければ配列を作り直す
+
+        ロックを取得して呼び出すこと
+        """
+        if not self._loaded or len(self._added) + len(self._removed) <= COMPACT_THRESHOLD:
+            return
+        words = [self._word(row) for row in range(len(self._ends))]
+        words = [word for word in words if word not in self._removed]
+        words.extend(word for _, word in self._added)
+        self._blob, self._ends, self._originals = self._build(words)
+        self._added, self._removed = [], set()
+
+    def complete(self, prefix, k=10):
+        """入力補完
+
+        @param prefix 入力中の文字列(大文字小文字を区別しない)
+        @param k 最大件数
+        @return キーの昇順の英単語のリスト
+        """
+        self.ensure_loaded()
+        key = prefix.lower()
+        key_bytes = key.encode('UTF-8')
+        with self._lock:
+            base = []
+            row = self._lower_bound(key_bytes)
+            while len(base) < k and row < len(self._ends) \
+                    and self._key(row).startswith(key_bytes):
+                word = self._word(row)
+                if word not in self._removed:
+                    base.append((word.lower(), word))
+                row += 1
+
+            position = bisect_left(self._added, (key, ''))
+            added = []
+            while len(added) < k and position < len(self._added) \
+                    and self._added[position][0].startswith(key):
+                added.append(self._added[position])
+                position += 1
+
+        result = []
+        for _, word in sorted(set(base + added)):
+            result.append(word)
+            if len(result) == k:
+                break
+        return result
+
+    def memory_usage(self):
+        """使用メモリ(差分を除く)
+
+        @return 件数、バイト数、100万件あたりのバイト数
+        """
+        size = len(self._blob) + self._ends.itemsize * len(self._ends) \
+            + sys.getsizeof(self._originals) \
+            + sum(sys.getsizeof(word) for word in self._originals.values())
+        entries = len(self._ends)
+        return {
+            'entries': entries,
+            'bytes': size,
+            'bytes_per_million': round(size * 1000000 / entries) if entries else 0,
+        }
@@ -0,0 +1,377 @@
+"""APIのエンドツーエンドベンチマーク
+
+--wordsの単語、--activitiesのアクティビティを合成して登録し、END_POINTの全ルートを
+WSGIアプリ(main.run)経由で--concurrencyの並列数で呼び出して、ルートごとの
+レイテンシ(p50、p95、p99)、スループット、エラー数、最大RSSをJSONに書き出す
+合成したデータはword、activityテーブルに登録するため、検証用のデータベースで実行すること
+
+リポジトリのルートで実行する
+PSQL_DB_NAME=wordbook_bench python server/benchmarks/bench_api.py \\
+    --words 100000 --activities 1000000 --output bench_api.json
+python server/benchmarks/bench_api.py --baseline bench_api.json --output bench_api_new.json
+python server/benchmarks/bench_api.py --compare bench_api.json bench_api_new.json
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import count
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from main import bootstrap, run as wsgi_app
+from server.api import LEARNING_LOG_RANGES
+from server.dbaccess import Word
+from server.urls import END_POINT
+
+
+# 合成したデータの接頭辞(英単語、アクティビティの詳細)
+PREFIX = 'bench'
+# 比較時に劣化とみなす既定の割合(%)
+DEFAULT_THRESHOLD = 10.0
+
+
+def seed(db_word, words, activities):
+    """合成したデータを登録(登録済みの分は登録しない)
+
+    @param db_word Word
+    @param words 単語数
+    @param activities アクティビティ数
+    @return 登録後の合成した単語数、アクティビティ数
+    """
+    db_word.execute(
+        'INSERT INTO word (english, japanese, bookmark) '
+        "SELECT %s || i, '試験' || md5(i::text), i %% 10 = 0 "
+        'FROM generate_series(1, %s) AS i ON CONFLICT (english) DO NOTHING;', (PREFIX, words))
+    db_word.execute(
+        'SELECT COUNT(*) FROM activity WHERE detail LIKE %s;', (f'{PREFIX}%',))
+    existing = db_word.cur.fetchone()[0]
+    if existing < activities:
+        db_word.execute(
+            'INSERT INTO activity (date, type, detail) '
+            "SELECT current_date - (i %% 365), (i %% 5)::text, %s || i || 'を習得しました' "
+            'FROM generate_series(%s, %s) AS i;', (PREFIX, existing + 1, activities))
+    db_word.execute('ANALYZE word;')
+    db_word.execute('ANALYZE activity;')
+    db_word.execute('SELECT COUNT(*) FROM word WHERE english LIKE %s;', (f'{PREFIX}%',))
+    word_count = db_word.cur.fetchone()[0]
+    return word_count, max(existing, activities)
+
+
+def cleanup(db_word):
+    """合成したデータを削除
+
+    @param db_word Word
+    @return 削除した単語数、アクティビティ数
+    """
+    db_word.execute('DELETE FROM word WHERE english LIKE %s;', (f'{PREFIX}%',))
+    words = db_word.cur.rowcount
+    db_word.execute('DELETE FROM activity WHERE detail LIKE %s;', (f'{PREFIX}%',))
+    return words, db_word.cur.rowcount
+
+
+def bench_pkeys(db_word):
+    """合成した単語のPKEY
+
+    @param db_word Word
+    @return PKEYのリスト
+    """
+    db_word.execute('SELECT id FROM word WHERE english LIKE %s ORDER BY id;', (f'{PREFIX}%',))
+    return [row[0] for row in db_word.cur.fetchall()]
+
+
+def disposable_pkeys(db_word, rows):
+    """削除用の単語を登録
+
+    @param db_word Word
+    @param rows 件数
+    @return PKEYのリスト
+    """
+    db_word.execute(
+        'INSERT INTO word (english, japanese) '
+        "SELECT %s || 'del-' || md5(random()::text || i), '削除' "
+        'FROM generate_series(1, %s) AS i RETURNING id;', (PREFIX, rows))
+    return [row[0] for row in db_word.cur.fetchall()]
+
+
+class RequestFactory:
+    """ ルートごとのリクエスト生成 """
+    def __init__(self, pkeys, disposable, rng):
+        """コンストラクタ
+
+        @param pkeys 更新に使用するPKEYのリスト
+        @param disposable 削除に使用するPKEYのリスト
+        @param rng random.Random
+        """
+        self._pkeys = pkeys
+        self._disposable = disposable
+        self._rng = rng
+        self._seq = count()
+        self._lock = threading.Lock()
+
+    def _pkey(self):
+        """更新するPKEY
+
+        @return PKEY
+        """
+        with self._lock:
+            return self._rng.choice(self._pkeys)
+
+    def _flag(self):
+        """フラグ
+
+        @return TRUE、FALSE
+        """
+        with self._lock:
+            return self._rng.choice(['TRUE', 'FALSE'])
+
+    def _number(self):
+        """合成した単語の番号
+
+        @return 番号
+        """
+        with self._lock:
+            return self._rng.randint(1, len(self._pkeys))
+
+    def build(self, path):
+        """リクエスト生成
+
+        @param path ルート
+        @return メソッド、クエリ、ボディ、コンテンツタイプ
+        """
+        if path == '/':
+            with self._lock:
+                return 'GET', f'days={self._rng.choice(LEARNING_LOG_RANGES)}', b'', ''
+        if path == '/search':
+            return 'GET', f'q={PREFIX}{self._number()}', b'', ''
+        if path == '/autocomplete':
+            return 'GET', f'q={PREFIX}{self._number()}', b'', ''
+        if path in ('/update/is_correct', '/update/bookmark'):
+            body = {'pkey': self._pkey(), 'flag': self._flag()}
+            return 'POST', '', json.dumps(body).encode(), 'application/json'
+        if path == '/register':
+            body = {'eng_val': f'{PREFIX}reg-{os.getpid()}-{next(self._seq)}', 'jap_val': '登録'}
+            return 'POST', '', json.dumps(body).encode(), 'application/json'
+        if path == '/delete':
+            with self._lock:
+                pkey = self._disposable.pop() if self._disposable else self._rng.choice(self._pkeys)
+            return 'POST', '', json.dumps({'pkey': pkey}).encode(), 'application/json'
+        if path == '/batch':
+            body = [{'op': self._rng.choice(['is_correct', 'bookmark']),
+                     'pkey': self._pkey(), 'flag': self._flag()} for _ in range(10)]
+            return 'POST', '', json.dumps(body).encode(), 'application/json'
+        if path == '/import':
+            rows = ''.join(f'{PREFIX}{self._number()},取り込み\n' for _ in range(10))
+            return 'POST', '', rows.encode(), 'text/csv'
+        if path == '/metrics/queries':
+            return 'GET', 'limit=10', b'', ''
+        return 'GET', '', b'', ''
+
+
+def call(path, method, query, body, content_type):
+    """WSGIアプリ呼び出し(レスポンスボディを全て読み込む)
+
+    @param path ルート
+    @param method メソッド
+    @param query クエリ
+    @param body ボディ
+    @param content_type コンテンツタイプ
+    @return ステータス、レスポンスのバイト数
+    """
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'CONTENT_TYPE': content_type,
+        'CONTENT_LENGTH': str(len(body)),
+        'SERVER_NAME': 'bench',
+        'SERVER_PORT': '0',
+        'wsgi.input': io.BytesIO(body),
+    }
+    statuses = []
+    chunks = wsgi_app(environ, lambda status, headers: statuses.append(status))
+    try:
+        size = sum(len(chunk) for chunk in chunks)
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+    return statuses[0], size
+
+
+def percentile(values, rate):
+    """パーセンタイル
+
+    @param values 昇順の値のリスト
+    @param rate 0〜1
+    @return 値
+    """
+    return values[min(int(len(values) * rate), len(values) - 1)] if values else 0.0
+
+
+def peak_rss_kb():
+    """最大RSS
+
+    @return KB
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_route(path, factory, requests, concurrency, warmup):
+    """1ルートの計測
+
+    @param path ルート
+    @param factory RequestFactory
+    @param requests リクエスト数
+    @param concurrency 並列数
+    @param warmup 計測前のリクエスト数
+    @return 結果({<項目>: <値>})
+    """
+    def _one(_):
+        request = factory.build(path)
+        begin = time.perf_counter()
+        status, size = call(path, *request)
+        return (time.perf_counter() - begin) * 1000, status, size
+
+    for i in range(warmup):
+        _one(i)
+    rss_before = peak_rss_kb()
+    begin = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(_one, range(requests)))
+    elapsed = time.perf_counter() - begin
+
+    latencies = sorted(latency for latency, _, _ in results)
+    return {
+        'requests': requests,
+        'errors': sum(1 for _, status, _ in results if not status.startswith('2')),
+        'p50_ms': round(percentile(latencies, 0.5), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'throughput_rps': round(requests / elapsed, 2),
+        'response_bytes': sum(size for _, _, size in results),
+        'peak_rss_kb': peak_rss_kb(),
+        'peak_rss_growth_kb': peak_rss_kb() - rss_before,
+    }
+
+
+def git_commit():
+    """計測したコミット
+
+    @return コミットID(取得できなければNone)
+    """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(base, current, threshold):
+    """結果の比較
+
+    p50、p95、p99が閾値を超えて増加、またはスループットが閾値を超えて減少したルートを劣化とする
+
+    @param base 基準の結果
+    @param current 比較する結果
+    @param threshold 閾値(%)
+    @return 出力行のリスト、劣化したルートのリスト
+    """
+    lines, regressions = [], []
+    for path, result in current['routes'].items():
+        before = base['routes'].get(path)
+        if before is None:
+            lines.append(f'{path:<20} (new)')
+            continue
+        changes = []
+        regressed = False
+        for key, higher_is_worse in (
+                ('p50_ms', True), ('p95_ms', True), ('p99_ms', True), ('throughput_rps', False)):
+            change = (result[key] - before[key]) * 100 / before[key] if before[key] else 0.0
+            if (change if higher_is_worse else -change) > threshold:
+                regressed = True
+            changes.append(f'{key}={result[key]} ({change:+.1f}%)')
+        if regressed:
+            regressions.append(path)
+        lines.append(f'{path:<20} {" ".join(changes)}{"  REGRESSION" if regressed else ""}')
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='APIのエンドツーエンドベンチマーク')
+    parser.add_argument('--words', type=int, default=1000, help='合成して登録する単語数')
+    parser.add_argument('--activities', type=int, default=10000, help='合成して登録するアクティビティ数')
+    parser.add_argument('--requests', type=int, default=200, help='ルートごとのリクエスト数')
+    parser.add_argument('--concurrency', type=int, default=8, help='並列数')
+    parser.add_argument('--warmup', type=int, default=5, help='ルートごとの計測前のリクエスト数')
+    parser.add_argument('--routes', nargs='*', help='計測するルート(省略時は全ルート)')
+    parser.add_argument('--output', help='結果の出力ファイル(JSON)')
+    parser.add_argument('--baseline', help='計測後に比較する結果ファイル')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'CURRENT'),
+                        help='計測せずに2つの結果ファイルを比較')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='劣化とみなす割合(%%)')
+    parser.add_argument('--cleanup', action='store_true', help='合成したデータを削除して終了')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as base_file, open(args.compare[1]) as current_file:
+            lines, regressions = compare(
+                json.load(base_file), json.load(current_file), args.threshold)
+        print('\n'.join(lines))
+        sys.exit(1 if regressions else 0)
+
+    bootstrap()
+    db_word = Word()
+    if args.cleanup:
+        words, activities = cleanup(db_word)
+        print(f'単語{words}件、アクティビティ{activities}件削除しました')
+        return
+
+    word_count, activity_count = seed(db_word, args.words, args.activities)
+    print(f'合成した単語: {word_count}件、アクティビティ: {activity_count}件')
+    routes = args.routes or list(END_POINT)
+    disposable = disposable_pkeys(db_word, args.requests + args.warmup) \
+        if '/delete' in routes else []
+    factory = RequestFactory(bench_pkeys(db_word), disposable, random.Random(0))
+
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'words': word_count,
+            'activities': activity_count,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+        },
+        'routes': {},
+    }
+    for path in routes:
+        result = run_route(path, factory, args.requests, args.concurrency, args.warmup)
+        results['routes'][path] = result
+        print(f'{path:<20} p50={result["p50_ms"]:.2f}ms p95={result["p95_ms"]:.2f}ms '
+              f'p99={result["p99_ms"]:.2f}ms {result["throughput_rps"]:.1f}req/s '
+              f'errors={result["errors"]} rss={result["peak_rss_kb"]}KB')
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            lines, regressions = compare(json.load(file), results, args.threshold)
+        print('\n'.join(lines))
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
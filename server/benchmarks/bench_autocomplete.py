@@ -0,0 +1,57 @@
+"""入力補完インデックスのベンチマーク
+
+合成した英単語で前方一致インデックスを作成し、
+使用メモリ(100万件あたり)と補完1回あたりの時間を計測する
+
+python server/benchmarks/bench_autocomplete.py --entries 1000000
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from autocomplete import PrefixIndex
+
+
+def words(entries, seed):
+    """合成した英単語
+
+    @param entries 件数
+    @param seed 乱数シード
+    @return 英単語のリスト
+    """
+    rng = random.Random(seed)
+    letters = string.ascii_lowercase
+    return [''.join(rng.choices(letters, k=rng.randint(3, 12))) for _ in range(entries)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='入力補完インデックスのベンチマーク')
+    parser.add_argument('--entries', type=int, default=1000000, help='英単語数')
+    parser.add_argument('--queries', type=int, default=100000, help='補完回数')
+    parser.add_argument('--limit', type=int, default=10, help='最大件数')
+    parser.add_argument('--seed', type=int, default=0, help='乱数シード')
+    args = parser.parse_args()
+
+    entries = words(args.entries, args.seed)
+    begin = time.perf_counter()
+    index = PrefixIndex(lambda: entries)
+    index.ensure_loaded()
+    print(f'build: {time.perf_counter() - begin:.2f}s')
+    for key, value in index.memory_usage().items():
+        print(f'{key}: {value}')
+
+    rng = random.Random(args.seed + 1)
+    prefixes = [word[:rng.randint(1, 4)] for word in rng.choices(entries, k=args.queries)]
+    begin = time.perf_counter()
+    for prefix in prefixes:
+        index.complete(prefix, args.limit)
+    elapsed = time.perf_counter() - begin
+    print(f'complete: {elapsed / args.queries * 1000000:.1f}us/query')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""Python処理部分のマイクロベンチマーク
+
+DBに接続せず、データ件数(--scales)ごとに作成したデータで各処理をtimeitで計測し、
+1回あたりの最小時間を出力する
+--baselineを指定すると、基準の結果より--threshold(%)を超えて遅くなった処理があれば
+終了コード1で終了する
+
+リポジトリのルートで実行する
+python server/benchmarks/bench_micro.py --output bench_micro.json
+python server/benchmarks/bench_micro.py --baseline bench_micro.json
+"""
+import argparse
+from datetime import date, timedelta
+import json
+import os
+import sys
+import timeit
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from server.api import JsonResponse, LearningView, Validate
+from server.dbaccess import Common
+from server.util import convert_to_date_for_display
+
+
+# 既定のデータ件数
+DEFAULT_SCALES = (10, 1000, 100000)
+# 劣化とみなす既定の割合(%)
+DEFAULT_THRESHOLD = 20.0
+# 計測の繰り返し回数(最小値を採用する)
+REPEAT = 5
+
+
+def _words(n):
+    """単語データ作成
+
+    @param n 件数
+    @return 単語データのリスト
+    """
+    return [{
+        'id': i,
+        'english': f'word{i}',
+        'japanese': f'単語{i}',
+        'is_correct': i % 2 == 0,
+        'bookmark': i % 10 == 0,
+    } for i in range(n)]
+
+
+def bench_learning_display(n):
+    """学習データを表示用に変換(問題作成)
+
+    @param n 正解データ、不正解用データの件数
+    @return 計測する関数
+    """
+    view = LearningView.__new__(LearningView)
+    corrects = _words(n)
+    incorrects = [[f'誤答{i}'] for i in range(n)]
+    return lambda: view._convert_to_learning_for_display(corrects, incorrects)
+
+
+def bench_concat_columns(n):
+    """SQL文用にカラムを結合
+
+    @param n カラム数
+    @return 計測する関数
+    """
+    columns = [f'column_{i} text NOT NULL' for i in range(n)]
+    return lambda: Common.concat_columns(None, columns)
+
+
+def bench_validate_pkey_flag(n):
+    """フラグ更新バリデーション(JSONのデコードを含む)
+
+    @param n リクエスト数
+    @return 計測する関数
+    """
+    bodies = [json.dumps({'pkey': i, 'flag': 'TRUE'}) for i in range(n)]
+    return lambda: [Validate(body).validate_pkey_flag() for body in bodies]
+
+
+def bench_validate_batch(n):
+    """一括更新バリデーション
+
+    @param n 操作数(上限で切り詰める)
+    @return 計測する関数
+    """
+    body = json.dumps([
+        {'op': 'is_correct', 'pkey': i, 'flag': 'TRUE'} if i % 3 else
+        {'op': 'register', 'eng_val': f'word{i}', 'jap_val': f'単語{i}'}
+        for i in range(min(n, 1000))])
+    return lambda: Validate(body).validate_batch()
+
+
+def bench_convert_to_date_for_display(n):
+    """アクティビティ日付を表示用に変換
+
+    @param n 件数
+    @return 計測する関数
+    """
+    start = date(2020, 1, 1)
+    dates = [start + timedelta(days=i % 3650) for i in range(n)]
+    return lambda: [convert_to_date_for_display(value) for value in dates]
+
+
+def bench_json_response(n):
+    """JSONレスポンス作成
+
+    @param n 行数
+    @return 計測する関数
+    """
+    rows = _words(n)
+    return lambda: JsonResponse(rows)
+
+
+BENCHMARKS = {
+    'learning_display': bench_learning_display,
+    'concat_columns': bench_concat_columns,
+    'validate_pkey_flag': bench_validate_pkey_flag,
+    'validate_batch': bench_validate_batch,
+    'convert_to_date_for_display': bench_convert_to_date_for_display,
+    'json_response': bench_json_response,
+}
+
+
+def measure(func, repeat=REPEAT):
+    """1回あたりの時間を計測
+
+    @param func 計測する関数
+    @param repeat 繰り返し回数
+    @return 1回あたりの最小時間(秒)
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def compare(base, current, threshold):
+    """結果の比較
+
+    @param base 基準の結果
+    @param current 比較する結果
+    @param threshold 閾値(%)
+    @return 出力行のリスト、劣化した(処理名, 件数)のリスト
+    """
+    lines, regressions = [], []
+    for name, scales in current.items():
+        for scale, seconds in scales.items():
+            before = base.get(name, {}).get(scale)
+            if not before:
+                continue
+            change = (seconds - before) * 100 / before
+            regressed = change > threshold
+            if regressed:
+                regressions.append((name, scale))
+            lines.append(f'{name:<28} n={scale:<7} {before * 1e6:>12.2f}us -> '
+                         f'{seconds * 1e6:>12.2f}us ({change:+.1f}%)'
+                         f'{"  REGRESSION" if regressed else ""}')
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Python処理部分のマイクロベンチマーク')
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES,
+                        help='データ件数')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help='計測する処理')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='繰り返し回数')
+    parser.add_argument('--output', help='結果の出力ファイル(JSON)')
+    parser.add_argument('--baseline', help='比較する結果ファイル')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='劣化とみなす割合(%%)')
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.only or BENCHMARKS:
+        results[name] = {}
+        for scale in args.scales:
+            seconds = measure(BENCHMARKS[name](scale), args.repeat)
+            # JSONのキーに合わせて件数は文字列にする
+            results[name][str(scale)] = seconds
+            print(f'{name:<28} n={scale:<7} {seconds * 1e6:>12.2f}us')
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            lines, regressions = compare(json.load(file), results, args.threshold)
+        print('\n'.join(lines))
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
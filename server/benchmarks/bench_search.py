@@ -0,0 +1,100 @@
+"""単語検索のレイテンシベンチマーク
+
+--seedで合成した単語を登録し、検索方法、検索対象ごとにWord.searchの
+レイテンシ(p50、p95、p99)を計測する
+合成した単語はwordテーブルに登録するため、検証用のデータベースで実行すること
+
+PSQL_DB_NAME=wordbook_bench python server/benchmarks/bench_search.py --seed 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from dbaccess import Word
+
+
+# 合成した単語の接頭辞
+PREFIX = 'bench'
+
+
+def seed(db_word, rows):
+    """合成した単語を登録
+
+    @param db_word Word
+    @param rows 件数
+    @return 登録後の合成した単語数
+    """
+    db_word.execute(
+        'INSERT INTO word (english, japanese) '
+        "SELECT %s || i || '-' || md5(i::text), '試験' || md5(i::text) "
+        'FROM generate_series(1, %s) AS i ON CONFLICT (english) DO NOTHING;', (PREFIX, rows))
+    db_word.execute('ANALYZE word;')
+    db_word.execute('SELECT COUNT(*) FROM word WHERE english LIKE %s;', (f'{PREFIX}%',))
+    return db_word.cur.fetchone()[0]
+
+
+def percentile(values, rate):
+    """パーセンタイル
+
+    @param values 昇順の値のリスト
+    @param rate 0〜1
+    @return 値
+    """
+    return values[min(int(len(values) * rate), len(values) - 1)]
+
+
+def measure(db_word, patterns, mode, columns, limit):
+    """レイテンシ計測
+
+    @param db_word Word
+    @param patterns 検索文字列のリスト
+    @param mode 検索方法
+    @param columns 検索対象のカラムのリスト
+    @param limit 最大件数
+    @return ミリ秒のリスト(昇順)
+    """
+    latencies = []
+    for pattern in patterns:
+        begin = time.perf_counter()
+        db_word.search(pattern, mode, columns, limit)
+        latencies.append((time.perf_counter() - begin) * 1000)
+    return sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='単語検索のベンチマーク')
+    parser.add_argument('--seed', type=int, default=0, help='合成して登録する単語数')
+    parser.add_argument('--queries', type=int, default=200, help='検索方法ごとの検索回数')
+    parser.add_argument('--limit', type=int, default=20, help='最大件数')
+    parser.add_argument('--cleanup', action='store_true', help='合成した単語を削除して終了')
+    args = parser.parse_args()
+
+    db_word = Word()
+    if args.cleanup:
+        db_word.execute('DELETE FROM word WHERE english LIKE %s;', (f'{PREFIX}%',))
+        print(f'{db_word.cur.rowcount}件削除しました')
+        return
+    if args.seed:
+        print(f'合成した単語: {seed(db_word, args.seed)}件')
+
+    rng = random.Random(0)
+    numbers = [rng.randint(1, max(args.seed, 1)) for _ in range(args.queries)]
+    patterns = {
+        'prefix': [f'{PREFIX}{number}' for number in numbers],
+        'substring': [f'{number}-' for number in numbers],
+        'fuzzy': [f'{PREFIX}{number}-' for number in numbers],
+    }
+    for mode, mode_patterns in patterns.items():
+        for columns in (['english'], ['english', 'japanese']):
+            latencies = measure(db_word, mode_patterns, mode, columns, args.limit)
+            print(f'{mode:<9} {"+".join(columns):<16} '
+                  f'p50={percentile(latencies, 0.5):.2f}ms '
+                  f'p95={percentile(latencies, 0.95):.2f}ms '
+                  f'p99={percentile(latencies, 0.99):.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""間隔反復スケジューラのシミュレーションベンチマーク
+
+cards件の単語を出題日時順に取り出して回答、再スケジュールを繰り返し、
+reviews回の復習にかかる時間を計測する
+
+python server/benchmarks/bench_srs.py --cards 10000 --reviews 1000000
+"""
+import argparse
+from datetime import datetime, timezone
+import heapq
+import os
+import random
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import srs
+
+
+def simulate(cards, reviews, accuracy, seed):
+    """シミュレーション
+
+    @param cards 単語数
+    @param reviews 復習回数
+    @param accuracy 正解率
+    @param seed 乱数シード
+    @return 結果({<項目>: <値>})
+    """
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    states = [srs.Card(due_at=start) for _ in range(cards)]
+    queue = [(start, pkey) for pkey in range(cards)]
+    heapq.heapify(queue)
+    correct, incorrect = srs.QUALITY_CORRECT, srs.QUALITY_INCORRECT
+    review, heapreplace = srs.review, heapq.heapreplace
+
+    begin = time.perf_counter()
+    for _ in range(reviews):
+        now, pkey = queue[0]
+        state = review(states[pkey], correct if rng.random() < accuracy else incorrect, now)
+        states[pkey] = state
+        heapreplace(queue, (state.due_at, pkey))
+    elapsed = time.perf_counter() - begin
+
+    return {
+        'cards': cards,
+        'reviews': reviews,
+        'seconds': round(elapsed, 3),
+        'reviews_per_second': round(reviews / elapsed),
+        'simulated_days': (queue[0][0] - start).days,
+        'mean_interval': round(sum(state.interval for state in states) / cards, 2),
+        'mean_ease': round(sum(state.ease for state in states) / cards, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='間隔反復スケジューラのベンチマーク')
+    parser.add_argument('--cards', type=int, default=10000, help='単語数')
+    parser.add_argument('--reviews', type=int, default=1000000, help='復習回数')
+    parser.add_argument('--accuracy', type=float, default=0.85, help='正解率')
+    parser.add_argument('--seed', type=int, default=0, help='乱数シード')
+    args = parser.parse_args()
+
+    for key, value in simulate(args.cards, args.reviews, args.accuracy, args.seed).items():
+        print(f'{key}: {value}')
+
+
+if __name__ == '__main__':
+    main()
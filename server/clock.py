@@ -0,0 +1,76 @@
+"""日付
+
+現在の日付、集計期間を返却する
+日付は設定したタイムゾーンの0時に切り替わる
+"""
+from datetime import datetime, time as dt_time, timedelta
+import os
+import threading
+import time
+
+
+class Clock:
+    """ 日付サービス """
+    def __init__(self, tz=None, now=time.time):
+        """コンストラクタ
+
+        @param tz タイムゾーン(tzinfo、Noneならシステムのタイムゾーン)
+        @param now 現在時刻(UNIX時間)を返す関数
+        """
+        self._tz = tz
+        self._now = now
+        self._today = None
+        # 現在の日付の開始、終了(UNIX時間)
+        self._day_start = 0.0
+        self._day_end = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """環境変数TIMEZONE(IANAのタイムゾーン名)から生成
+
+        @return Clock
+        @exception KeyError 不明なタイムゾーン
+        """
+        name = os.environ.get('TIMEZONE')
+        if not name:
+            return cls()
+        try:
+            from zoneinfo import ZoneInfo
+        except ImportError:
+            # Python 3.8以前
+            from backports.zoneinfo import ZoneInfo
+        return cls(ZoneInfo(name))
+
+    def _midnight(self, day):
+        """日付の0時
+
+        @param day 日付
+        @return UNIX時間
+        """
+        return datetime.combine(day, dt_time.min, tzinfo=self._tz).timestamp()
+
+    def today(self):
+        """現在の日付
+
+        @return 日付
+        """
+        now = self._now()
+        if self._day_start <= now < self._day_end:
+            return self._today
+        with self._lock:
+            today = datetime.fromtimestamp(now, self._tz).date()
+            if today != self._today:
+                self._today = today
+                self._day_start = self._midnight(today)
+                self._day_end = self._midnight(today + timedelta(days=1))
+            return today
+
+    def window(self, days):
+        """今日までの集計期間
+
+        @param days 日数
+        @return 開始日(days日前)、終了日(今日)
+        """
+        today = self.today()
+        return today - timedelta(days=days), today
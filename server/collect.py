@@ -2,57 +2,507 @@
 
 collect_target.txt内のURLをスクレイピング
 スクレイピングした英語はWordテーブルに格納
+
+処理済みのURLはバッチ単位でチェックポイントジャーナルに記録し、
+中断後の再実行では未処理のURLから再開する
 """
-from concurrent.futures import ThreadPoolExecutor
+import argparse
+from array import array
+from hashlib import blake2b
+import json
+import logging
+import os
 import re
 import sys
+import time
+import unicodedata
 
 from bs4 import BeautifulSoup
 import requests
+import soupsieve
 
+from corpus import CorpusReader, CorpusWriter
+from crawl import CrawlScheduler
 from dbaccess import Word, DbOperationError
+import logconfig
+
+
+LOGGER = logging.getLogger()
+
+# スクレイピング対象URL格納ファイル
+TARGET_FILE = './setting/collect_target.txt'
+# チェックポイントジャーナル
+CHECKPOINT_FILE = './setting/collect_checkpoint.jsonl'
+# サイト定義ファイル
+SOURCES_FILE = './setting/collect_sources.json'
+# 1バッチあたりのURL数
+BATCH_SIZE = 20
+
+
+class CollectError(Exception):
+    """ スクレイピングエラー """
+    pass
 
 
 def _get_urls(file_path):
     """スクレイピング対象URLを取得
 
     @param file_path URL格納ファイル
+    @return URLのリスト(空行を除く)
+    @exception CollectError URL格納ファイルが存在しない
     """
     try:
         with open(file_path, 'r') as file:
-            return list(map(lambda file: file.rstrip('\n'), file.readlines()))
-    except FileNotFoundError:
-        sys.exit()
+            return [line.strip() for line in file if line.strip()]
+    except FileNotFoundError as err:
+        raise CollectError(f'URL格納ファイルが存在しません: {file_path}') from err
+
 
-def _request(urls):
+def _fetch(url):
+    """1件リクエスト
+
+    @param url スクレイピング対象URL
+    @return Responseオブジェクト(接続エラー時はNone)
+    """
+    try:
+        return requests.get(url, timeout=3)
+    except requests.RequestException as err:
+        LOGGER.error(err)
+        return None
+
+
+def _request(urls, scheduler):
     """リクエスト
 
-    @param urls スクレイピング対象URLのリスト
-    @return Responseオブジェクト
+    @param urls スクレイピング対象の(URL, 優先度)のリスト
+    @param scheduler クロールスケジューラ
+    @return Responseオブジェクトのリスト(未取得はNone)
+    """
+    return scheduler.run(urls)
+
+
+class Checkpoint:
+    """ チェックポイントジャーナル
+
+    1行1バッチのJSON Linesで処理済みURLを追記する
+    """
+    def __init__(self, file_path):
+        """コンストラクタ
+
+        @param file_path ジャーナルファイル(Noneならファイルに記録しない)
+        """
+        self._file_path = file_path
+        self._completed = set()
+        self._batch = 0
+        self._load()
+
+    def _load(self):
+        """ジャーナル読み込み
+        """
+        if self._file_path is None:
+            return
+        try:
+            with open(self._file_path, 'r') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 書き込み途中で中断された行
+                        continue
+                    self._completed.update(entry['urls'])
+                    self._batch = max(self._batch, entry['batch'])
+        except FileNotFoundError:
+            pass
+
+    @property
+    def batch(self):
+        """記録済みバッチ数を返却
+
+        @return 記録済みバッチ数
+        """
+        return self._batch
+
+    def is_completed(self, url):
+        """処理済み判定
+
+        @param url URL
+        @return 論理値
+        """
+        return url in self._completed
+
+    def pending(self, urls):
+        """未処理URL取得
+
+        @param urls URLのリスト
+        @return 未処理URLのリスト(重複を除く)
+        """
+        seen = set()
+        result = []
+        for url in urls:
+            if url in self._completed or url in seen:
+                continue
+            seen.add(url)
+            result.append(url)
+        return result
+
+    def commit(self, urls, words):
+        """バッチ完了を記録
+
+        @param urls 処理済みURLのリスト
+        @param words 書き込んだ単語数
+        """
+        self._batch += 1
+        self._completed.update(urls)
+        if self._file_path is None:
+            return
+        entry = {'batch': self._batch, 'urls': list(urls), 'words': words}
+        with open(self._file_path, 'a') as file:
+            file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+
+    def clear(self):
+        """ジャーナル削除
+        """
+        self._completed.clear()
+        self._batch = 0
+        if self._file_path is None:
+            return
+        try:
+            os.remove(self._file_path)
+        except FileNotFoundError:
+            pass
+
+
+def pair_elements(elements, is_english):
+    """英語、日本語要素を文書順に対応付け
+
+    英語要素の直後の日本語要素のみを対にするため、
+    要素が欠けても以降の対がずれない
+
+    @param elements 英語、日本語の要素(文書順)
+    @param is_english 英語要素判定関数
+    @return (英語, 日本語)のリスト、対にならず破棄した要素数
+    """
+    pairs, unpaired, eng = [], 0, None
+    for element in elements:
+        if is_english(element):
+            if eng is not None:
+                unpaired += 1
+            eng = element.text
+        elif eng is None:
+            unpaired += 1
+        else:
+            pairs.append((eng, element.text))
+            eng = None
+    if eng is not None:
+        unpaired += 1
+    return pairs, unpaired
+
+
+class Source:
+    """ スクレイピング対象サイト定義
+
+    URLパターン、セレクタ、正規化ルールは生成時に一度だけコンパイルする
+    """
+    # 正規化ルール
+    NORMALIZERS = {
+        'strip': str.strip,
+        'lower': str.lower,
+        'collapse_space': lambda text: ' '.join(text.split()),
+        'nfkc': lambda text: unicodedata.normalize('NFKC', text),
+    }
+
+    def __init__(self, name, url_patterns, english, japanese,
+                 english_filter=r'[a-zA-Z\s]+', normalize=None, priority=0):
+        """コンストラクタ
+
+        @param name サイト名
+        @param url_patterns 対象URLの正規表現のリスト
+        @param english 英語要素のCSSセレクタ
+        @param japanese 日本語要素のCSSセレクタ
+        @param english_filter 英語判定の正規表現
+        @param normalize 正規化ルール名のリスト({'english': [...], 'japanese': [...]})
+        @param priority 取得優先度(小さいほど先)
+        @exception CollectError 定義エラー
+        """
+        normalize = normalize or {'english': ['strip'], 'japanese': []}
+        self.name = name
+        self.priority = priority
+        try:
+            self._url_patterns = [re.compile(pattern) for pattern in url_patterns]
+            self._english_filter = re.compile(english_filter)
+            self._is_english = soupsieve.compile(english).match
+            self._targets = soupsieve.compile(f'{english}, {japanese}')
+            self._eng_normalizers = [self.NORMALIZERS[n] for n in normalize.get('english', [])]
+            self._jap_normalizers = [self.NORMALIZERS[n] for n in normalize.get('japanese', [])]
+        except (re.error, soupsieve.SelectorSyntaxError, KeyError) as err:
+            raise CollectError(f'サイト定義が不正です: {name}: {err}') from err
+
+    def matches(self, url):
+        """対象URL判定
+
+        @param url URL
+        @return 論理値
+        """
+        return any(pattern.search(url) for pattern in self._url_patterns)
+
+    def extract(self, bs_obj):
+        """英語、日本語の対を抽出
+
+        @param bs_obj 解析済みのページ
+        @return 正規化済みの(英語, 日本語)のリスト、破棄した要素数
+        """
+        pairs, unpaired = pair_elements(self._targets.select(bs_obj), self._is_english)
+        result = []
+        for eng, jap in pairs:
+            if self._english_filter.match(eng) is None:
+                # 英語以外
+                continue
+            for normalizer in self._eng_normalizers:
+                eng = normalizer(eng)
+            for normalizer in self._jap_normalizers:
+                jap = normalizer(jap)
+            result.append((eng, jap))
+        return result, unpaired
+
+
+# サイト定義ファイルがない場合のサイト定義
+DEFAULT_SOURCES = [
+    {
+        'name': 'default',
+        'url_patterns': ['.*'],
+        'english': '.eng',
+        'japanese': '.jap',
+    },
+]
+
+
+def load_sources(file_path):
+    """サイト定義読み込み
+
+    @param file_path サイト定義ファイル(JSON)
+    @return Sourceのリスト
+    @exception CollectError 定義エラー
+    """
+    try:
+        with open(file_path, 'r') as file:
+            definitions = json.load(file)
+    except FileNotFoundError:
+        definitions = DEFAULT_SOURCES
+    except json.JSONDecodeError as err:
+        raise CollectError(f'サイト定義ファイルが不正です: {file_path}: {err}') from err
+
+    try:
+        return [Source(**definition) for definition in definitions]
+    except TypeError as err:
+        raise CollectError(f'サイト定義ファイルが不正です: {file_path}: {err}') from err
+
+
+class WordSet:
+    """ 重複判定用の英単語集合
+
+    英単語そのものではなく8バイトのハッシュ値のみ、オープンアドレス法のハッシュ表
+    (array('Q')、0は空き)に保持する(1件あたり12〜24バイト)
     """
-    with ThreadPoolExecutor() as executor:
-        return executor.map(requests.get, urls, timeout=3)
+    # 初期のスロット数(2のべき乗)
+    INITIAL_SLOTS = 1024
+
+    def __init__(self):
+        """コンストラクタ
+        """
+        self._slots = array('Q', bytes(8 * self.INITIAL_SLOTS))
+        self._size = 0
+        self._collisions = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def collisions(self):
+        """重複数を返却
+
+        @return 重複数
+        """
+        return self._collisions
+
+    @staticmethod
+    def _insert(slots, digest):
+        """ハッシュ表に追加(線形探索)
+
+        @param slots ハッシュ表
+        @param digest ハッシュ値(0以外)
+        @return 論理値(既に存在した場合はFalse)
+        """
+        mask = len(slots) - 1
+        index = digest & mask
+        while True:
+            value = slots[index]
+            if value == 0:
+                slots[index] = digest
+                return True
+            if value == digest:
+                return False
+            index = (index + 1) & mask
+
+    def _grow(self):
+        """ハッシュ表を2倍に拡張
+        """
+        slots = array('Q', bytes(16 * len(self._slots)))
+        for digest in self._slots:
+            if digest:
+                self._insert(slots, digest)
+        self._slots = slots
+
+    def add(self, eng_val):
+        """追加
+
+        @param eng_val 英語
+        @return 論理値(既に存在した場合はFalse)
+        """
+        # 0は空きを表すため1として扱う
+        digest = int.from_bytes(
+            blake2b(eng_val.encode('UTF-8'), digest_size=8).digest(), 'big') or 1
+        # 使用率を2/3以下に保つ
+        if (self._size + 1) * 3 > len(self._slots) * 2:
+            self._grow()
+        if not self._insert(self._slots, digest):
+            self._collisions += 1
+            return False
+        self._size += 1
+        return True
+
+    def unique(self, pairs):
+        """初出の英単語のみ抽出
+
+        @param pairs (英語, 日本語)のイテラブル
+        @return (英語, 日本語)のリスト
+        """
+        return [(eng, jap) for eng, jap in pairs if self.add(eng)]
 
 
 class Collector:
     """ 英単語のスクレイピング """
-    def __init__(self):
+    def __init__(self, urls, checkpoint, sources, scheduler=None,
+                 dry_run=False, batch_size=BATCH_SIZE, fetch_in_dry_run=False):
         """コンストラクタ
+
+        @param urls スクレイピング対象URLのリスト
+        @param checkpoint チェックポイントジャーナル
+        @param sources Sourceのリスト(先にマッチしたものを使用)
+        @param scheduler クロールスケジューラ
+        @param dry_run 論理値(TrueならDB、ジャーナルに書き込まない)
+        @param batch_size 1バッチあたりのURL数
+        @param fetch_in_dry_run 論理値(Trueならdry-runでも取得して書き込む予定の単語数を数える、
+                                アーカイブから再生する場合など、ネットワークに接続しない場合に指定する)
+        @exception DbOperationError データベース操作エラー
         """
-        self._markups = _request(_get_urls('./setting/collect_target.txt'))
-        try:
-            self._db_word = Word()
-        except DbOperationError:
-            sys.exit()
+        self._urls = urls
+        self._checkpoint = checkpoint
+        self._sources = sources
+        self._scheduler = scheduler or CrawlScheduler(_fetch)
+        self._dry_run = dry_run
+        self._fetch_in_dry_run = fetch_in_dry_run
+        self._batch_size = batch_size
+        self._db_word = None if dry_run else Word()
+        self._seen = WordSet()
 
     def collect(self):
         """スクレイピング
 
+        @return 実行結果
+        @retval skipped 処理済みとしてスキップしたURL数
+        @retval unmatched サイト定義がなくスキップしたURL数
+        @retval fetched 取得に成功したURL数
+        @retval failed 取得に失敗したURL数
+        @retval disallowed robots.txtにより除外したURL数(処理済みとして記録する)
+        @retval words 書き込んだ(dry-runでは書き込む予定の、取得しない場合はNone)単語数
+        @retval unpaired 対になる日本語(英語)がなく破棄した要素数
+        @retval duplicates 実行中に重複した英単語数
+        @retval batches 処理したバッチ数
+        @retval timings 処理時間(秒)
+        @retval planned 取得予定の{'url': URL, 'source': サイト定義名}のリスト(dry-runのみ)
+        """
+        pending = self._checkpoint.pending(self._urls)
+        targets = [(url, self.find_source(url)) for url in pending]
+        targets = [(url, source) for url, source in targets if source is not None]
+        report = {
+            'skipped': len(self._urls) - len(pending),
+            'unmatched': len(pending) - len(targets),
+            'fetched': 0,
+            'failed': 0,
+            'disallowed': 0,
+            'words': 0,
+            'unpaired': 0,
+            'duplicates': 0,
+            'batches': 0,
+            'timings': {'fetch': 0.0, 'parse': 0.0, 'insert': 0.0},
+        }
+        if self._dry_run:
+            report['planned'] = [{'url': url, 'source': source.name} for url, source in targets]
+            if not self._fetch_in_dry_run:
+                report['words'] = None
+                return report
+        timings = report['timings']
+        for start in range(0, len(targets), self._batch_size):
+            batch = targets[start:start + self._batch_size]
+            urls = [url for url, _ in batch]
+            started = time.perf_counter()
+            responses = _request(
+                [(url, source.priority) for url, source in batch], self._scheduler)
+            fetched_at = time.perf_counter()
+            fetched, pairs, unpaired = self.parse(
+                zip(urls, (source for _, source in batch), responses))
+            disallowed = [url for url in urls if url in self._scheduler.disallowed]
+            duplicates = self._seen.collisions
+            pairs = self._seen.unique(pairs)
+            parsed_at = time.perf_counter()
+
+            if self._dry_run:
+                words = len(pairs)
+            else:
+                words = self.insert_db(pairs)
+                # 除外したURLは再実行しても取得できないため処理済みとする
+                self._checkpoint.commit(fetched + disallowed, words)
+
+            timings['fetch'] += fetched_at - started
+            timings['parse'] += parsed_at - fetched_at
+            timings['insert'] += time.perf_counter() - parsed_at
+
+            report['fetched'] += len(fetched)
+            report['failed'] += len(batch) - len(fetched) - len(disallowed)
+            report['disallowed'] += len(disallowed)
+            report['words'] += words
+            report['unpaired'] += unpaired
+            report['duplicates'] += self._seen.collisions - duplicates
+            report['batches'] += 1
+        return report
+
+    def find_source(self, url):
+        """サイト定義検索
+
+        @param url URL
+        @return Source(該当なしの場合はNone)
+        """
+        for source in self._sources:
+            if source.matches(url):
+                return source
+        return None
+
+    def parse(self, markups):
+        """レスポンス解析
+
+        ページは1回だけ解析し、URLに対応するサイト定義で抽出する
+
+        @param markups (URL, Source, Responseオブジェクト)のイテラブル
+        @return 取得に成功したURLのリスト、(英語, 日本語)のリスト、破棄した要素数
         @exception HTTPError 接続エラー
         @exception AttributeError 要素取得エラー
         """
-        eng_list, jap_list = [], []
-        for markup in self._markups:
+        fetched, pairs, unpaired = [], [], 0
+        for url, source, markup in markups:
+            if markup is None:
+                continue
             try:
                 markup.raise_for_status()
             except requests.HTTPError:
@@ -60,33 +510,106 @@ class Collector:
 
             bs_obj = BeautifulSoup(markup.content, 'lxml')
             try:
-                eng = [i.text for i in bs_obj.find_all(class_="eng")]
-                jap = [i.text for i in bs_obj.find_all(class_="jap")]
+                page_pairs, page_unpaired = source.extract(bs_obj)
             except AttributeError:
                 continue
-            eng_list.extend(eng)
-            jap_list.extend(jap)
+            fetched.append(url)
+            pairs.extend(page_pairs)
+            unpaired += page_unpaired
+        return fetched, pairs, unpaired
 
-        self.insert_db(eng_list, jap_list)
-
-    def insert_db(self, eng_list, jap_list):
+    def insert_db(self, pairs):
         """DBに挿入
 
-        @param eng_list 英単語リスト
-        @param jap_list 日本語リスト
+        @param pairs (英語, 日本語)のリスト
+        @return 挿入した単語数
         @exception DbOperationError データベース操作エラー
         """
-        reg = re.compile(r'[a-z|A-Z|\s]+')
-        for eng, jap in zip(eng_list, jap_list):
+        count = 0
+        for eng, jap in pairs:
             try:
-                if reg.match(eng) is None:
-                    # 英語以外
-                    continue
-                self._db_word.insert(eng.strip(), jap)
+                self._db_word.insert(eng, jap)
+                count += 1
             except DbOperationError:
                 continue
+        return count
+
+
+def main(argv=None):
+    """コマンドライン実行
+
+    @param argv コマンドライン引数
+    @return 実行結果
+    """
+    parser = argparse.ArgumentParser(description='英単語のスクレイピング')
+    parser.add_argument('--target', default=TARGET_FILE, help='URL格納ファイル')
+    parser.add_argument('--sources', default=SOURCES_FILE, help='サイト定義ファイル')
+    parser.add_argument('--checkpoint', default=CHECKPOINT_FILE, help='チェックポイントジャーナル')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='1バッチあたりのURL数')
+    parser.add_argument('--rate', type=float, default=1.0, help='ドメインあたりの1秒間のリクエスト数')
+    parser.add_argument('--burst', type=int, default=1, help='ドメインあたりのバースト数')
+    parser.add_argument('--concurrency', type=int, default=8, help='全体の同時リクエスト数上限')
+    parser.add_argument('--ignore-robots', action='store_true', help='robots.txtを無視')
+    parser.add_argument('--record', metavar='ARCHIVE',
+                        help='取得したレスポンスをアーカイブに記録'
+                             '(上書きするため、ジャーナルがあれば--restartが必要)')
+    parser.add_argument('--replay', metavar='ARCHIVE',
+                        help='ネットワークの代わりにアーカイブから再生'
+                             '(ジャーナル、robots.txtは使用しない)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='取得予定のURLのみ表示(取得しない、--replayでは書き込み予定の単語数も表示)')
+    parser.add_argument('--restart', action='store_true', help='ジャーナルを破棄して最初から実行')
+    args = parser.parse_args(argv)
+    logconfig.load()
+    if args.record and args.replay:
+        parser.error('--recordと--replayは同時に指定できません')
+
+    try:
+        urls = _get_urls(args.target)
+        sources = load_sources(args.sources)
+    except CollectError as err:
+        LOGGER.error(err)
+        sys.exit(str(err))
+
+    if args.replay:
+        # 再生時は毎回全URLを処理し、待機なしで取得する
+        # robots.txtは記録時に尊重済みのため使用しない(記録されていない場合がある)
+        corpus = CorpusReader(args.replay)
+        fetch, rate, checkpoint = corpus.fetch, None, Checkpoint(None)
+    else:
+        fetch, rate, checkpoint = _fetch, args.rate, Checkpoint(args.checkpoint)
+        # アーカイブは上書きされるため、ジャーナルの続きから記録すると処理済みURLが失われる
+        if args.record and checkpoint.batch and not args.restart and not args.dry_run:
+            parser.error('ジャーナルの続きからは記録できません(--restartを指定してください)')
+        corpus = CorpusWriter(args.record) if args.record and not args.dry_run else None
+        if corpus is not None:
+            fetch = corpus.wrap(fetch)
+    if args.restart and not args.dry_run:
+        checkpoint.clear()
+
+    scheduler = CrawlScheduler(
+        fetch, rate=rate, burst=args.burst,
+        concurrency=args.concurrency, robots=not (args.ignore_robots or args.replay))
+    try:
+        inst = Collector(
+            urls, checkpoint, sources, scheduler,
+            dry_run=args.dry_run, batch_size=args.batch_size,
+            fetch_in_dry_run=bool(args.replay))
+        report = inst.collect()
+    except DbOperationError as err:
+        sys.exit(str(err))
+    finally:
+        if corpus is not None:
+            corpus.close()
+
+    timings = report['timings']
+    report['throughput'] = {
+        'pages_per_sec': report['fetched'] / timings['parse'] if timings['parse'] else None,
+        'words_per_sec': report['words'] / timings['insert'] if timings['insert'] else None,
+    }
+    print(json.dumps(report))
+    return report
 
 
 if __name__ == '__main__':
-    inst = Collector()
-    inst.collect()
+    main()
@@ -0,0 +1,163 @@
+"""レスポンスコーパス
+
+スクレイピングで取得したレスポンスをZIPアーカイブに記録し、
+ネットワークなしで再生する
+"""
+from hashlib import sha1
+import json
+import threading
+import zipfile
+
+import requests
+
+
+# URLとエントリの対応表
+MANIFEST = 'manifest.json'
+
+
+def _entry_name(url):
+    """エントリ名
+
+    @param url URL
+    @return エントリ名
+    """
+    return sha1(url.encode('UTF-8')).hexdigest()
+
+
+class ReplayResponse:
+    """ 再生用Responseオブジェクト """
+    def __init__(self, url, status_code, content, encoding):
+        """コンストラクタ
+
+        @param url URL
+        @param status_code ステータスコード
+        @param content ボディ
+        @param encoding 文字コード
+        """
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.encoding = encoding
+
+    @property
+    def text(self):
+        """ボディを文字列で返却
+
+        @return ボディ
+        """
+        return self.content.decode(self.encoding or 'UTF-8', errors='replace')
+
+    def raise_for_status(self):
+        """ステータスコード確認
+
+        @exception HTTPError 4xx、5xx
+        """
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'{self.status_code} for url: {self.url}', response=self)
+
+
+class CorpusWriter:
+    """ コーパス記録 """
+    def __init__(self, file_path):
+        """コンストラクタ
+
+        @param file_path アーカイブファイル
+        """
+        self._archive = zipfile.ZipFile(file_path, 'w', zipfile.ZIP_DEFLATED)
+        self._manifest = {}
+        # 書き込み済みのエントリ名(ZIPは上書きできないため)
+        self._names = set()
+        self._lock = threading.Lock()
+
+    def record(self, url, response):
+        """記録
+
+        同じURLは最初に取得できたレスポンスのみ記録する
+
+        @param url URL
+        @param response Responseオブジェクト(接続エラー時はNone)
+        """
+        with self._lock:
+            name = _entry_name(url)
+            if name in self._names:
+                return
+            if response is None:
+                self._manifest[url] = None
+                return
+            self._names.add(name)
+            self._archive.writestr(name, response.content)
+            self._manifest[url] = {
+                'name': name,
+                'status_code': response.status_code,
+                'encoding': response.encoding,
+            }
+
+    def wrap(self, fetch):
+        """取得関数に記録処理を追加
+
+        @param fetch URLを受け取りResponseオブジェクト(失敗時はNone)を返す関数
+        @return 取得関数
+        """
+        def _fetch(url):
+            response = fetch(url)
+            self.record(url, response)
+            return response
+        return _fetch
+
+    def close(self):
+        """対応表を書き込みアーカイブを閉じる
+        """
+        with self._lock:
+            self._archive.writestr(MANIFEST, json.dumps(self._manifest))
+            self._archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CorpusReader:
+    """ コーパス再生 """
+    def __init__(self, file_path):
+        """コンストラクタ
+
+        @param file_path アーカイブファイル
+        @exception FileNotFoundError アーカイブが存在しない
+        """
+        self._archive = zipfile.ZipFile(file_path, 'r')
+        self._manifest = json.loads(self._archive.read(MANIFEST))
+        self._lock = threading.Lock()
+
+    @property
+    def urls(self):
+        """記録済みURLを返却
+
+        @return URLのリスト
+        """
+        return list(self._manifest)
+
+    def fetch(self, url):
+        """再生
+
+        @param url URL
+        @return ReplayResponse(未記録、接続エラーの場合はNone)
+        """
+        entry = self._manifest.get(url)
+        if entry is None:
+            return None
+        with self._lock:
+            content = self._archive.read(entry['name'])
+        return ReplayResponse(url, entry['status_code'], content, entry['encoding'])
+
+    def close(self):
+        """アーカイブを閉じる
+        """
+        self._archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
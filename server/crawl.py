@@ -0,0 +1,262 @@
+"""クロールスケジューラ
+
+ドメイン単位のトークンバケットでリクエスト間隔を制御し、
+robots.txtを尊重しながら優先度順にURLを取得する
+"""
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+
+LOGGER = logging.getLogger()
+
+# User-Agent
+USER_AGENT = 'english-wordbook-collector'
+# robots.txtのキャッシュ有効期間(秒)
+ROBOTS_TTL = 3600
+
+
+class TokenBucket:
+    """ トークンバケット """
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        """コンストラクタ
+
+        @param rate 1秒あたりに補充するトークン数(Noneなら制限なし)
+        @param capacity バケット容量(バースト数)
+        @param clock 時刻取得関数
+        """
+        self._rate = rate
+        self._capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        """1秒あたりに補充するトークン数を返却
+
+        @return 1秒あたりに補充するトークン数
+        """
+        return self._rate
+
+    @rate.setter
+    def rate(self, rate):
+        """1秒あたりに補充するトークン数を変更
+
+        @param rate 1秒あたりに補充するトークン数
+        """
+        with self._lock:
+            self._refill()
+            self._rate = rate
+
+    def _refill(self):
+        """経過時間分のトークンを補充
+        """
+        now = self._clock()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """トークン取得
+
+        @return 0(取得成功)、またはトークンが補充されるまでの秒数
+        """
+        if self._rate is None:
+            return 0
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self._rate
+
+    def consume(self):
+        """トークンを強制的に消費(不足分は以降の取得を遅らせる)
+        """
+        if self._rate is None:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+
+
+class RobotsCache:
+    """ robots.txtキャッシュ """
+    def __init__(self, fetch, user_agent=USER_AGENT, ttl=ROBOTS_TTL, clock=time.monotonic):
+        """コンストラクタ
+
+        @param fetch URLを受け取りResponseオブジェクト(失敗時はNone)を返す関数
+        @param user_agent User-Agent
+        @param ttl キャッシュ有効期間(秒)
+        @param clock 時刻取得関数
+        """
+        self._fetch = fetch
+        self._user_agent = user_agent
+        self._ttl = ttl
+        self._clock = clock
+        self._parsers = {}
+        self._lock = threading.Lock()
+
+    def _load(self, origin):
+        """robots.txt取得
+
+        4xxは制限なし、接続エラー、5xxは全て拒否として扱う
+
+        @param origin スキーム://ホスト
+        @return RobotFileParser
+        """
+        parser = RobotFileParser(f'{origin}/robots.txt')
+        response = self._fetch(f'{origin}/robots.txt')
+        if response is None or response.status_code >= 500:
+            parser.disallow_all = True
+        elif response.status_code >= 400:
+            parser.allow_all = True
+        else:
+            parser.parse(response.text.splitlines())
+        return parser
+
+    def get(self, url):
+        """URLに対応するrobots.txt取得
+
+        @param url URL
+        @return RobotFileParser、取得したか(キャッシュでないか)の論理値
+        """
+        parts = urlsplit(url)
+        origin = f'{parts.scheme}://{parts.netloc}'
+        with self._lock:
+            cached = self._parsers.get(origin)
+            if cached is not None and self._clock() - cached[0] < self._ttl:
+                return cached[1], False
+            parser = self._load(origin)
+            self._parsers[origin] = (self._clock(), parser)
+            return parser, True
+
+    def can_fetch(self, url):
+        """取得可否
+
+        @param url URL
+        @return 論理値
+        """
+        parser, _ = self.get(url)
+        return parser.can_fetch(self._user_agent, url)
+
+    def crawl_delay(self, url):
+        """Crawl-delay取得
+
+        @param url URL
+        @return Crawl-delay(秒、指定なしの場合はNone)
+        """
+        parser, _ = self.get(url)
+        return parser.crawl_delay(self._user_agent)
+
+
+class CrawlScheduler:
+    """ クロールスケジューラ """
+    def __init__(self, fetch, rate=1.0, burst=1, concurrency=8, rates=None,
+                 robots=True, user_agent=USER_AGENT, clock=time.monotonic, sleep=time.sleep):
+        """コンストラクタ
+
+        @param fetch URLを受け取りResponseオブジェクト(失敗時はNone)を返す関数
+        @param rate ドメインあたりの1秒間のリクエスト数(Noneなら制限なし)
+        @param burst ドメインあたりのバースト数
+        @param concurrency 全体の同時リクエスト数上限
+        @param rates ドメイン別の1秒間のリクエスト数({<ホスト>: <リクエスト数>})
+        @param robots 論理値(Trueならrobots.txtを尊重)
+        @param user_agent User-Agent
+        @param clock 時刻取得関数
+        @param sleep 待機関数
+        """
+        self._fetch = fetch
+        self._rate = rate
+        self._burst = burst
+        self._concurrency = concurrency
+        self._rates = rates or {}
+        self._robots = RobotsCache(fetch, user_agent, clock=clock) if robots else None
+        self._clock = clock
+        self._sleep = sleep
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.stats = {'requested': 0, 'disallowed': 0, 'failed': 0}
+        # robots.txtにより除外したURL
+        self.disallowed = set()
+
+    def _bucket(self, url):
+        """ドメインのトークンバケット取得
+
+        初回はrobots.txtを取得し、Crawl-delayがあればレートに反映する
+
+        @param url URL
+        @return TokenBucket
+        """
+        host = urlsplit(url).netloc
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = TokenBucket(self._rates.get(host, self._rate), self._burst, self._clock)
+            self._buckets[host] = bucket
+        if self._robots is not None:
+            _, fetched = self._robots.get(url)
+            if fetched:
+                bucket.consume()
+                delay = self._robots.crawl_delay(url)
+                if delay and bucket.rate is not None:
+                    bucket.rate = min(bucket.rate, 1 / delay)
+        return bucket
+
+    def run(self, urls):
+        """取得
+
+        @param urls URL、または(URL, 優先度)のリスト(優先度は小さいほど先)
+        @return Responseオブジェクトのリスト(入力順、未取得、robots.txtによる除外はNone)
+        """
+        items = [url if isinstance(url, tuple) else (url, 0) for url in urls]
+        results = [None] * len(items)
+        ready = [(priority, seq, url) for seq, (url, priority) in enumerate(items)]
+        heapq.heapify(ready)
+        deferred = []
+        slots = threading.BoundedSemaphore(self._concurrency)
+
+        def _fetch(seq, url):
+            try:
+                results[seq] = self._fetch(url)
+            except Exception:
+                # Futureは参照しないため、ここで記録しないと例外が失われる
+                LOGGER.exception('取得に失敗: %s', url)
+            finally:
+                if results[seq] is None:
+                    with self._lock:
+                        self.stats['failed'] += 1
+                slots.release()
+
+        with ThreadPoolExecutor(max_workers=self._concurrency) as executor:
+            while ready or deferred:
+                now = self._clock()
+                while deferred and deferred[0][0] <= now:
+                    _, priority, seq, url = heapq.heappop(deferred)
+                    heapq.heappush(ready, (priority, seq, url))
+
+                if not ready:
+                    self._sleep(max(deferred[0][0] - now, 0))
+                    continue
+
+                priority, seq, url = heapq.heappop(ready)
+                bucket = self._bucket(url)
+                if self._robots is not None and not self._robots.can_fetch(url):
+                    LOGGER.info('robots.txtにより除外: %s', url)
+                    self.stats['disallowed'] += 1
+                    self.disallowed.add(url)
+                    continue
+
+                wait = bucket.try_acquire()
+                if wait:
+                    heapq.heappush(deferred, (now + wait, priority, seq, url))
+                    continue
+
+                slots.acquire()
+                self.stats['requested'] += 1
+                executor.submit(_fetch, seq, url)
+        return results
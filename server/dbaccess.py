@@ -2,15 +2,38 @@
 
 PostgreSQLサーバにアクセス
 """
-import logging.config
+from contextlib import contextmanager
+import importlib.util
+from itertools import count
+import logging
 import os
+import sys
+import threading
+import time
 from typing import NamedTuple
 
-import psycopg2
-from psycopg2.extras import DictCursor
 
+def _lazy_import(name):
+    """初回の属性参照時に読み込むモジュール
+
+    @param name モジュール名
+    @return モジュール
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+# 接続時に読み込む(DBを使わない処理、テストでの読み込みを速くする)
+psycopg2 = _lazy_import('psycopg2')
 
-logging.config.fileConfig('./setting/logging.conf')
 LOGGER = logging.getLogger()
 
 # データベース定義
@@ -20,7 +43,12 @@ DATABASE = {
         ('english text UNIQUE NOT NULL'),
         ('japanese text NOT NULL'),
         ('is_correct boolean DEFAULT FALSE'),
-        ('bookmark boolean DEFAULT FALSE')
+        ('bookmark boolean DEFAULT FALSE'),
+        # 間隔反復の復習状態(srs.py参照)
+        ('interval_days integer NOT NULL DEFAULT 0'),
+        ('ease double precision NOT NULL DEFAULT 2.5'),
+        ('repetitions integer NOT NULL DEFAULT 0'),
+        ('due_at timestamptz NOT NULL DEFAULT now()'),
     ],
     'activity': [
         ('id serial PRIMARY KEY'),
@@ -28,8 +56,208 @@ DATABASE = {
         ('type text NOT NULL'),
         ('detail text NOT NULL'),
     ],
+    # アクティビティの日ごと、イベントごとの件数(activityのトリガーで更新する)
+    'activity_daily': [
+        ('date date NOT NULL'),
+        ('event text NOT NULL'),
+        ('count integer NOT NULL DEFAULT 0'),
+    ],
+}
+
+# 拡張機能(テーブル作成前に作成する)
+# (拡張機能名, 拡張機能を使用するインデックス定義に含まれる文字列)
+# 権限がないなどで作成できない場合は該当するインデックスを作成せず、代替の方法で検索する
+EXTENSIONS = [
+    # 単語検索のトライグラムインデックス、あいまい検索
+    ('pg_trgm', 'gin_trgm_ops'),
+]
+
+# インデックス定義
+INDEXES = {
+    'word': [
+        # 学習画面の出題順
+        'word_due_at_idx ON word (due_at, id)',
+        # 単語検索(前方一致、部分一致、あいまい検索)
+        'word_english_trgm_idx ON word USING gin (english gin_trgm_ops)',
+        'word_japanese_trgm_idx ON word USING gin (japanese gin_trgm_ops)',
+    ],
+    'activity_daily': [
+        # 集計の更新(ON CONFLICT)、期間の取得(Index Only Scan)
+        'UNIQUE activity_daily_event_date_idx ON activity_daily (event, date) INCLUDE (count)',
+    ],
 }
 
+# 習得のイベント(習得に変更したアクティビティ)
+LEARNED_EVENT = 'learned'
+
+# 関数定義(全テーブル作成後に作成する)
+FUNCTIONS = [
+    # アクティビティのイベント(習得以外はアクティビティ種別ID)
+    "activity_event(type text, detail text) RETURNS text LANGUAGE sql IMMUTABLE AS $$ "
+    f"SELECT CASE WHEN type = '0' AND detail LIKE '%習得しました' THEN '{LEARNED_EVENT}' "
+    "ELSE type END $$",
+    # 挿入したアクティビティをactivity_dailyに加算
+    'activity_daily_insert() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN '
+    'INSERT INTO activity_daily (event, date, count) '
+    'SELECT activity_event(type, detail), date, COUNT(*) FROM changed GROUP BY 1, 2 '
+    'ON CONFLICT (event, date) DO UPDATE SET count = activity_daily.count + EXCLUDED.count; '
+    'RETURN NULL; END $$',
+    # 削除したアクティビティをactivity_dailyから減算
+    'activity_daily_delete() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN '
+    'UPDATE activity_daily SET count = activity_daily.count - removed.count FROM ('
+    'SELECT activity_event(type, detail) AS event, date, COUNT(*) AS count FROM changed '
+    'GROUP BY 1, 2) AS removed '
+    'WHERE activity_daily.event = removed.event AND activity_daily.date = removed.date; '
+    'RETURN NULL; END $$',
+]
+
+# トリガー定義(文ごとに1回、変更した行をまとめて集計する)
+# UPDATE、TRUNCATEは集計に反映しないため、行った場合はActivity.rebuild_dailyで作り直す
+TRIGGERS = {
+    'activity': [
+        ('activity_daily_insert', 'AFTER INSERT ON activity REFERENCING NEW TABLE AS changed '
+                                  'FOR EACH STATEMENT EXECUTE FUNCTION activity_daily_insert()'),
+        ('activity_daily_delete', 'AFTER DELETE ON activity REFERENCING OLD TABLE AS changed '
+                                  'FOR EACH STATEMENT EXECUTE FUNCTION activity_daily_delete()'),
+    ],
+}
+
+# activity_dailyの作り直し(集計中のアクティビティの書き込みは待たせる)
+ACTIVITY_DAILY_REBUILD = 'LOCK TABLE activity IN SHARE MODE; DELETE FROM activity_daily; '\
+    'INSERT INTO activity_daily (event, date, count) '\
+    'SELECT activity_event(type, detail), date, COUNT(*) FROM activity GROUP BY 1, 2;'
+
+# 既存テーブルにカラム、トリガーを追加した際の初期値設定
+BACKFILL = {
+    # 習得済みの単語は一斉に出題されないよう翌日から復習する
+    ('word', 'due_at'): 'UPDATE word SET interval_days = 1, repetitions = 1, '
+                        "due_at = now() + interval '1 day' WHERE is_correct = TRUE;",
+    # 既存のアクティビティを集計する
+    ('activity', 'activity_daily_insert'): ACTIVITY_DAILY_REBUILD,
+}
+
+# スキーマ作成済みか(プロセスごとに初回のみ作成する)
+_SCHEMA_READY = False
+_SCHEMA_LOCK = threading.Lock()
+
+# 使用できる拡張機能名
+_EXTENSIONS_READY = set()
+
+# SQL実行の通知先(QueryEventを受け取る関数)
+QUERY_OBSERVERS = []
+
+# 実行計画を取得できる文の先頭のキーワード
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'VALUES')
+
+# サーバサイドカーソルの1回の取得行数
+STREAM_ITERSIZE = 2000
+
+# サーバサイドカーソル名の連番
+_CURSOR_SEQ = count()
+
+
+def escape_like(value):
+    """LIKEパターンの特殊文字をエスケープ
+
+    @param value 文字列
+    @return エスケープした文字列(ESCAPE '\\'で使用する)
+    """
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def column_names(table):
+    """カラム名取得
+
+    @param table テーブル
+    @return カラム名のリスト
+    """
+    return [column.split()[0] for column in DATABASE[table]]
+
+
+def create_index(table, index):
+    """インデックス作成(UNIQUEで始まる定義は一意インデックス)
+
+    @param table 接続済みのテーブルクラスのインスタンス
+    @param index インデックス定義
+    @exception DbOperationError DB操作エラー
+    """
+    if index.startswith('UNIQUE '):
+        table.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {index[len("UNIQUE "):]};')
+    else:
+        table.execute(f'CREATE INDEX IF NOT EXISTS {index};')
+
+
+def ensure_extensions(table):
+    """拡張機能作成
+
+    作成済みでなければ作成し、作成できない場合はログを出力して続ける
+
+    @param table 接続済みのテーブルクラスのインスタンス
+    @return 使用できる拡張機能名のセット
+    """
+    table.execute('SELECT extname FROM pg_extension;')
+    available = {row[0] for row in table.cur.fetchall()}
+    for extension, _ in EXTENSIONS:
+        if extension in available:
+            continue
+        try:
+            table.execute(f'CREATE EXTENSION IF NOT EXISTS {extension};')
+        except DbOperationError as err:
+            LOGGER.warning(f'extension {extension} is unavailable: {err}')
+            continue
+        available.add(extension)
+    return available
+
+
+def ensure_schema(table):
+    """拡張機能、全テーブル、不足カラム、インデックス、関数、トリガー作成
+
+    プロセスごとに初回のみ実行する
+
+    @param table 接続済みのテーブルクラスのインスタンス
+    @exception DbOperationError DB操作エラー
+    """
+    global _SCHEMA_READY
+    with _SCHEMA_LOCK:
+        if _SCHEMA_READY:
+            return
+        _EXTENSIONS_READY.update(ensure_extensions(table))
+        unavailable = [
+            marker for extension, marker in EXTENSIONS if extension not in _EXTENSIONS_READY]
+        for name, columns in DATABASE.items():
+            table.execute(
+                f'CREATE TABLE IF NOT EXISTS {name} ({table.concat_columns(columns)});')
+            table.execute(
+                'SELECT column_name FROM information_schema.columns WHERE table_name = %s;',
+                (name,))
+            existing = {row[0] for row in table.cur.fetchall()}
+            for column in columns:
+                column_name = column.split()[0]
+                if column_name in existing:
+                    continue
+                table.execute(f'ALTER TABLE {name} ADD COLUMN IF NOT EXISTS {column};')
+                backfill = BACKFILL.get((name, column_name))
+                if backfill:
+                    table.execute(backfill)
+            for index in INDEXES.get(name, []):
+                if any(marker in index for marker in unavailable):
+                    continue
+                create_index(table, index)
+        for function in FUNCTIONS:
+            table.execute(f'CREATE OR REPLACE FUNCTION {function};')
+        for name, triggers in TRIGGERS.items():
+            table.execute(
+                'SELECT tgname FROM pg_trigger WHERE tgrelid = %s::regclass;', (name,))
+            existing = {row[0] for row in table.cur.fetchall()}
+            for trigger_name, definition in triggers:
+                if trigger_name in existing:
+                    continue
+                table.execute(f'CREATE TRIGGER {trigger_name} {definition};')
+                backfill = BACKFILL.get((name, trigger_name))
+                if backfill:
+                    table.execute(backfill)
+        _SCHEMA_READY = True
+
 
 class Flag(NamedTuple):
     """ フラグ用コンテナ """
@@ -37,27 +265,103 @@ class Flag(NamedTuple):
     FALSE: str = 'FALSE'
 
 
+class QueryEvent(NamedTuple):
+    """ SQL実行の通知内容 """
+    sql: str
+    data: object
+    # 実行時間、コミット時間(秒)
+    elapsed: float
+    commit_elapsed: float
+    # 取得、更新した行数(不明なら-1)
+    rows: int
+    # SQL文、プレースホルダーの値を受け取り実行計画の行のリストを返す関数(取得できない場合はNone)
+    explain: object = None
+
+
 class DbOperationError(Exception):
     """ データベース操作エラー """
     pass
 
 
+@contextmanager
+def transaction(*tables):
+    """トランザクション
+
+    同一接続を共有するテーブルクラスの操作をまとめてコミットする
+
+    @param tables テーブルクラスのインスタンス
+    @exception DbOperationError データベース操作エラー
+    """
+    conn = tables[0].conn
+    for table in tables:
+        table.autocommit = False
+    try:
+        yield
+        conn.commit()
+    except psycopg2.Error as err:
+        conn.rollback()
+        LOGGER.error(err)
+        raise DbOperationError(err)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        for table in tables:
+            table.autocommit = True
+
+
+class CopyStream:
+    """ COPY FROM STDIN 用のストリーム
+
+    行のイテラブルをテキスト形式に変換しながら逐次読み込ませる
+    """
+    _escapes = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+    def __init__(self, rows):
+        """コンストラクタ
+
+        @param rows 値のタプルのイテラブル
+        """
+        self._rows = iter(rows)
+        self._buffer = b''
+
+    def read(self, size=-1):
+        """読み込み
+
+        @param size 読み込むバイト数(負数なら全て)
+        @return テキスト形式の行データ
+        """
+        while size < 0 or len(self._buffer) < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            line = '\t'.join(str(val).translate(self._escapes) for val in row) + '\n'
+            self._buffer += line.encode('UTF-8')
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
 class Common:
     """ 基底クラス """
-    def __init__(self, table):
-        """データベース接続及びテーブル作成
+    def __init__(self, table, conn=None):
+        """データベース接続及びスキーマ作成
 
         @param table テーブル
+        @param conn 共有する接続(Noneなら新規に接続)
         """
-        self.conn = psycopg2.connect(
+        self.table = table
+        self.autocommit = True
+        self.conn = conn or psycopg2.connect(
             host=os.environ['PSQL_HOST'],
             dbname=os.environ['PSQL_DB_NAME'],
             user=os.environ['PSQL_USER'],
             password=os.environ['PSQL_PASSWORD'],
         )
+        from psycopg2.extras import DictCursor
         self.cur = self.conn.cursor(cursor_factory=DictCursor)
-        self.execute(
-            f'CREATE TABLE IF NOT EXISTS {table} ({self.concat_columns(DATABASE[table])});')
+        ensure_schema(self)
 
     def generator_dict_factory(self, rows):
         """取得データをジェネレータに変換
@@ -89,6 +393,42 @@ class Common:
                 concat_column += ', '
         return concat_column
 
+    def _observe(self, sql, data, start, executed, rows, explainable=True):
+        """SQL実行を通知
+
+        @param sql SQL文
+        @param data プレースホルダーの値
+        @param start 実行開始時刻(time.perf_counter)
+        @param executed 実行終了(コミット開始)時刻(time.perf_counter)
+        @param rows 行数
+        @param explainable 論理値(Falseなら実行計画を取得しない)
+        """
+        if not QUERY_OBSERVERS:
+            return
+        end = time.perf_counter()
+        # トランザクション中は実行計画の取得に失敗するとトランザクションが中断されるため取得しない
+        explain = self.explain if explainable and self.autocommit \
+            and sql.lstrip().upper().startswith(EXPLAINABLE) else None
+        event = QueryEvent(
+            sql, data, executed - start, end - executed if self.autocommit else 0.0, rows, explain)
+        for observer in QUERY_OBSERVERS:
+            observer(event)
+
+    def explain(self, sql, data=None):
+        """実行計画取得(実行はしない)
+
+        @param sql SQL文
+        @param data プレースホルダーの値
+        @return 実行計画の行のリスト
+        @exception psycopg2.Error DB操作エラー
+        """
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(f'EXPLAIN {sql}', data)
+                return [row[0] for row in cur.fetchall()]
+        finally:
+            self.conn.rollback()
+
     def execute(self, sql, data=None):
         """SQL実行
 
@@ -96,9 +436,94 @@ class Common:
         @param data プレースホルダーの値
         @exception psycopg2.Error DB操作エラー
         """
+        start = time.perf_counter()
         try:
             self.cur.execute(sql, data)
-            self.conn.commit()
+            executed = time.perf_counter()
+            if self.autocommit:
+                self.conn.commit()
+            self._observe(sql, data, start, executed, self.cur.rowcount)
+        except psycopg2.Error as err:
+            self.conn.rollback()
+            LOGGER.error(err)
+            raise DbOperationError(err)
+
+    def stream(self, sql, data=None, itersize=STREAM_ITERSIZE):
+        """サーバサイドカーソルで逐次取得
+
+        取得完了、または中断(close)時にカーソルを閉じてトランザクションを終了する
+
+        @param sql SQL文
+        @param data プレースホルダーの値
+        @param itersize 1回の取得行数
+        @return 行タプルのジェネレータ
+        @exception psycopg2.Error DB操作エラー
+        """
+        cur = self.conn.cursor(name=f'stream_{next(_CURSOR_SEQ)}')
+        cur.itersize = itersize
+        try:
+            cur.execute(sql, data)
+            yield from cur
+        except psycopg2.Error as err:
+            LOGGER.error(err)
+            raise DbOperationError(err)
+        finally:
+            try:
+                cur.close()
+            finally:
+                self.conn.rollback()
+
+    def stream_table(self, columns):
+        """テーブル全件をPKEY順に逐次取得
+
+        @param columns カラム名のリスト
+        @return 行タプルのジェネレータ
+        """
+        return self.stream(f'SELECT {", ".join(columns)} FROM {self.table} ORDER BY id;')
+
+    def copy_from(self, sql, stream):
+        """COPY ... FROM STDIN 実行
+
+        @param sql COPY文
+        @param stream 読み込み元(read()を持つオブジェクト)
+        @return 読み込んだ行数
+        @exception psycopg2.Error DB操作エラー
+        """
+        start = time.perf_counter()
+        try:
+            self.cur.copy_expert(sql, stream)
+            executed = time.perf_counter()
+            if self.autocommit:
+                self.conn.commit()
+            self._observe(sql, None, start, executed, self.cur.rowcount, explainable=False)
+            return self.cur.rowcount
+        except psycopg2.Error as err:
+            self.conn.rollback()
+            LOGGER.error(err)
+            raise DbOperationError(err)
+
+    def execute_values(self, sql, rows, template=None, fetch=False):
+        """複数行をまとめてSQL実行
+
+        @param sql SQL文(VALUES %s を含む)
+        @param rows プレースホルダーの値のリスト
+        @param template 1行分のテンプレート
+        @param fetch 論理値(TrueならRETURNINGの結果を返却)
+        @return 取得結果
+        @exception psycopg2.Error DB操作エラー
+        """
+        if not rows:
+            return []
+        from psycopg2.extras import execute_values
+        start = time.perf_counter()
+        try:
+            result = execute_values(
+                self.cur, sql, rows, template=template, page_size=len(rows), fetch=fetch)
+            executed = time.perf_counter()
+            if self.autocommit:
+                self.conn.commit()
+            self._observe(sql, rows, start, executed, self.cur.rowcount, explainable=False)
+            return result or []
         except psycopg2.Error as err:
             self.conn.rollback()
             LOGGER.error(err)
@@ -107,10 +532,18 @@ class Common:
 
 class Word(Common):
     """ wordテーブルクラス """
-    def __init__(self):
+    # 一括更新可能なフラグ
+    FLAG_COLUMNS = ('is_correct', 'bookmark')
+    # 検索方法、検索対象のカラム
+    SEARCH_MODES = ('prefix', 'substring', 'fuzzy')
+    SEARCH_COLUMNS = ('english', 'japanese')
+
+    def __init__(self, conn=None):
         """コンストラクタ
+
+        @param conn 共有する接続
         """
-        super().__init__('word')
+        super().__init__('word', conn)
 
     def insert(self, eng_val, jap_val):
         """挿入
@@ -132,6 +565,33 @@ class Word(Common):
         )
         return super().generator_dict_factory(self.cur.fetchall())
 
+    def select_due(self, limit):
+        """出題日時を過ぎた単語を出題日時順に取得
+
+        word_due_at_idxの範囲スキャンで先頭limit件のみ読む
+
+        @param limit 最大件数
+        @return 学習データ
+        """
+        super().execute(
+            'SELECT id, english, japanese, bookmark FROM word '
+            'WHERE due_at <= now() ORDER BY due_at, id LIMIT %s;', (limit,)
+        )
+        return super().generator_dict_factory(self.cur.fetchall())
+
+    def select_due_by_pkey(self, pkey):
+        """出題日時を過ぎた単語を1件取得
+
+        @param pkey PKEY
+        @return 学習データ(出題日時前、存在しない場合はNone)
+        """
+        super().execute(
+            'SELECT id, english, japanese, bookmark FROM word '
+            'WHERE id = %s AND due_at <= now();', (pkey,)
+        )
+        row = self.cur.fetchone()
+        return None if row is None else dict(row)
+
     def select_incorrect(self):
         """不正解用データ取得
 
@@ -148,6 +608,38 @@ class Word(Common):
         super().execute('SELECT english, japanese, is_correct FROM word ORDER BY id;')
         return super().dict_factory(self.cur.fetchall())
 
+    def search(self, pattern, mode, columns, limit):
+        """単語検索
+
+        prefix、substringは大文字小文字を区別しないLIKE、fuzzyはトライグラムの
+        類似度(pg_trgm.similarity_threshold以上)で、いずれもトライグラムインデックスを使用する
+        pg_trgmを使用できない場合、fuzzyはsubstringで検索する
+
+        @param pattern 検索文字列
+        @param mode 検索方法(prefix、substring、fuzzy)
+        @param columns 検索対象のカラムのリスト(english、japanese)
+        @param limit 最大件数
+        @return 検索結果(前方一致、部分一致は短い順、あいまい検索は類似度順)
+        """
+        if mode not in self.SEARCH_MODES or not set(columns) <= set(self.SEARCH_COLUMNS):
+            raise DbOperationError(f'unknown search: {mode} {columns}')
+        if mode == 'fuzzy' and 'pg_trgm' not in _EXTENSIONS_READY:
+            mode = 'substring'
+        if mode == 'fuzzy':
+            where = ' OR '.join(f'{column} %% %(pattern)s' for column in columns)
+            order = 'GREATEST({}) DESC'.format(
+                ', '.join(f'similarity({column}, %(pattern)s)' for column in columns))
+            data = {'pattern': pattern, 'limit': limit}
+        else:
+            where = ' OR '.join(f"{column} ILIKE %(pattern)s ESCAPE '\\'" for column in columns)
+            order = f'LEAST({", ".join(f"char_length({column})" for column in columns)})'
+            like = escape_like(pattern)
+            data = {'pattern': f'{like}%' if mode == 'prefix' else f'%{like}%', 'limit': limit}
+        sql = 'SELECT id, english, japanese, is_correct, bookmark FROM word '\
+            f'WHERE {where} ORDER BY {order}, id LIMIT %(limit)s;'
+        super().execute(sql, data)
+        return super().dict_factory(self.cur.fetchall())
+
     def select_bookmark(self):
         """ブックマーク一覧データ取得
 
@@ -180,14 +672,16 @@ class Word(Common):
         super().execute('SELECT COUNT(*) FROM word WHERE bookmark = TRUE;')
         return self.cur.fetchone()[0]
 
-    def update_is_correct_flag(self, pkey, flag):
+    def update_is_correct_flag(self, pkey, flag, assignments=None):
         """is_correctフラグ更新
 
         @param pkey PKEY
         @param flag 論理値
+        @param assignments 同時に更新するSET句(復習状態の更新など)
         @return 更新した英語
         """
-        sql = 'UPDATE word SET is_correct = %s WHERE id = %s RETURNING english;'
+        extra = f', {assignments}' if assignments else ''
+        sql = f'UPDATE word SET is_correct = %s{extra} WHERE id = %s RETURNING english;'
         super().execute(sql, (flag, pkey))
         return self.cur.fetchone()[0]
 
@@ -212,6 +706,112 @@ class Word(Common):
         super().execute(sql, (pkey,))
         return self.cur.fetchone()[0]
 
+    def insert_with_activity(self, eng_val, jap_val, activity):
+        """挿入とアクティビティ登録を1文で実行
+
+        @param eng_val 英語
+        @param jap_val 日本語
+        @param activity (アクティビティ日付, アクティビティ種別ID, アクティビティ詳細)
+        """
+        sql = 'WITH w AS (INSERT INTO word (english, japanese) VALUES (%s, %s) '\
+            'ON CONFLICT (english) DO UPDATE SET japanese = EXCLUDED.japanese RETURNING english) '\
+            'INSERT INTO activity (date, type, detail) SELECT %s, %s, %s FROM w;'
+        super().execute(sql, (eng_val, jap_val, *activity))
+
+    def update_flag_with_activity(self, column, pkey, flag, activity, assignments=None):
+        """フラグ更新とアクティビティ登録を1文で実行
+
+        @param column カラム(is_correct、bookmark)
+        @param pkey PKEY
+        @param flag 論理値
+        @param activity (アクティビティ日付, アクティビティ種別ID, 詳細の英語より前, 詳細の英語より後)
+        @param assignments 同時に更新するSET句(復習状態の更新など)
+        @return 更新した英語
+        """
+        if column not in self.FLAG_COLUMNS:
+            raise DbOperationError(f'unknown column: {column}')
+        extra = f', {assignments}' if assignments else ''
+        sql = f'WITH w AS (UPDATE word SET {column} = %s{extra} WHERE id = %s RETURNING english), '\
+            'a AS (INSERT INTO activity (date, type, detail) '\
+            'SELECT %s, %s, %s || english || %s FROM w) '\
+            'SELECT english FROM w;'
+        super().execute(sql, (flag, pkey, *activity))
+        return self.cur.fetchone()[0]
+
+    def delete_with_activity(self, pkey, activity):
+        """削除とアクティビティ登録を1文で実行
+
+        @param pkey PKEY
+        @param activity (アクティビティ日付, アクティビティ種別ID, 詳細の英語より前, 詳細の英語より後)
+        @return 削除した英語
+        """
+        sql = 'WITH w AS (DELETE FROM word WHERE id = %s RETURNING english), '\
+            'a AS (INSERT INTO activity (date, type, detail) '\
+            'SELECT %s, %s, %s || english || %s FROM w) '\
+            'SELECT english FROM w;'
+        super().execute(sql, (pkey, *activity))
+        return self.cur.fetchone()[0]
+
+    def insert_many(self, rows):
+        """一括挿入
+
+        @param rows (英語, 日本語)のリスト(英語の重複不可)
+        """
+        sql = 'INSERT INTO word (english, japanese) VALUES %s '\
+            'ON CONFLICT (english) DO UPDATE SET japanese = EXCLUDED.japanese;'
+        super().execute_values(sql, rows)
+
+    def import_rows(self, rows):
+        """ステージングテーブル経由で一括取り込み
+
+        COPYで一時テーブルに読み込み、英語ごとに最後の行をwordにマージする
+        トランザクション内で呼び出すこと
+
+        @param rows (英語, 日本語)のイテラブル
+        @return 取り込んだ単語数
+        """
+        super().execute(
+            'CREATE TEMP TABLE word_import '
+            '(line bigserial, english text NOT NULL, japanese text NOT NULL) ON COMMIT DROP;'
+        )
+        super().copy_from(
+            'COPY word_import (english, japanese) FROM STDIN;', CopyStream(rows))
+        super().execute(
+            'INSERT INTO word (english, japanese) '
+            'SELECT DISTINCT ON (english) english, japanese FROM word_import '
+            'ORDER BY english, line DESC '
+            'ON CONFLICT (english) DO UPDATE SET japanese = EXCLUDED.japanese;'
+        )
+        return self.cur.rowcount
+
+    def update_flags(self, column, rows, assignments=None):
+        """フラグ一括更新
+
+        @param column カラム(is_correct、bookmark)
+        @param rows (PKEY, 論理値)のリスト(PKEYの重複不可)
+        @param assignments 同時に更新するSET句(v.flagで各行の論理値を参照できる)
+        @return {<PKEY>: <更新した英語>}
+        """
+        if column not in self.FLAG_COLUMNS:
+            raise DbOperationError(f'unknown column: {column}')
+        extra = f', {assignments}' if assignments else ''
+        sql = f'UPDATE word SET {column} = v.flag{extra} FROM (VALUES %s) AS v (id, flag) '\
+            'WHERE word.id = v.id RETURNING word.id, word.english;'
+        rows = super().execute_values(
+            sql, rows, template='(%s::integer, %s::boolean)', fetch=True)
+        return {row[0]: row[1] for row in rows}
+
+    def delete_many(self, pkeys):
+        """一括削除
+
+        @param pkeys PKEYのリスト
+        @return {<PKEY>: <削除した英語>}
+        """
+        if not pkeys:
+            return {}
+        super().execute('DELETE FROM word WHERE id = ANY(%s) RETURNING id, english;', (pkeys,))
+        return {row[0]: row[1] for row in self.cur.fetchall()}
+
 
 class Activity(Common):
     """ activityテーブルクラス """
@@ -223,10 +823,12 @@ class Activity(Common):
         (4, 'bookmark'),
     )
 
-    def __init__(self):
+    def __init__(self, conn=None):
         """コンストラクタ
+
+        @param conn 共有する接続
         """
-        super().__init__('activity')
+        super().__init__('activity', conn)
 
     def insert(self, date, type_id, detail):
         """挿入
@@ -238,6 +840,14 @@ class Activity(Common):
         sql = 'INSERT INTO activity (date, type, detail) VALUES (%s, %s, %s);'
         super().execute(sql, (date, type_id, detail))
 
+    def insert_many(self, rows):
+        """一括挿入
+
+        @param rows (アクティビティ日付, アクティビティ種別ID, アクティビティ詳細)のリスト
+        """
+        sql = 'INSERT INTO activity (date, type, detail) VALUES %s;'
+        super().execute_values(sql, rows)
+
     def select_all(self):
         """全アクティビティ取得
 
@@ -257,11 +867,44 @@ class Activity(Common):
     def select_count_learning_date(self, from_date, to_date):
         """習得済み単語数取得
 
+        activity_dailyの集計から取得する
+
+        @param from_date 開始日
+        @param to_date 終了日
         @return 習得済み単語数データ
         """
-        sql = 'SELECT COUNT(date), date FROM activity '\
-            'WHERE type = %s AND date >= %s AND date <= %s AND detail LIKE %s '\
-            'GROUP BY date ORDER BY date;'
-        super().execute(
-            sql, (str(self.TYPE[0][0]), from_date, to_date, '%習得しました'))
+        return self.select_count_event_date(LEARNED_EVENT, from_date, to_date)
+
+    def select_count_event_date(self, event, from_date, to_date):
+        """日ごとのイベント件数取得
+
+        @param event イベント(LEARNED_EVENT、アクティビティ種別ID)
+        @param from_date 開始日
+        @param to_date 終了日
+        @return [{'count': <件数>, 'date': <日付>}](件数が0の日は含まない)
+        """
+        sql = 'SELECT count, date FROM activity_daily '\
+            'WHERE event = %s AND date >= %s AND date <= %s AND count > 0 ORDER BY date;'
+        super().execute(sql, (event, from_date, to_date))
+        return super().dict_factory(self.cur.fetchall())
+
+    def rebuild_daily(self):
+        """日ごとのイベント件数を全アクティビティから作り直す
+
+        @return 集計した行数
+        """
+        super().execute(ACTIVITY_DAILY_REBUILD)
+        return self.cur.rowcount
+
+    def select_daily_drift(self):
+        """日ごとのイベント件数と全アクティビティの集計の差分取得
+
+        @return [{'date': <日付>, 'event': <イベント>, 'count': <集計>, 'actual': <実際の件数>}]
+        """
+        sql = 'SELECT date, event, COALESCE(d.count, 0) AS count, COALESCE(a.count, 0) AS actual '\
+            'FROM activity_daily AS d FULL JOIN ('\
+            'SELECT date, activity_event(type, detail) AS event, COUNT(*) AS count '\
+            'FROM activity GROUP BY 1, 2) AS a USING (date, event) '\
+            'WHERE COALESCE(d.count, 0) <> COALESCE(a.count, 0) ORDER BY date, event;'
+        super().execute(sql)
         return super().dict_factory(self.cur.fetchall())
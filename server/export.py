@@ -0,0 +1,279 @@
+"""エクスポート
+
+取得結果の行イテラブルをCSV、JSON Lines、バイナリスナップショットに
+逐次変換する(行全体をメモリに保持しない)
+"""
+import csv
+from datetime import date, datetime
+import io
+import json
+import struct
+
+
+# 1チャンクあたりの目安バイト数
+CHUNK_SIZE = 64 * 1024
+
+# バイナリスナップショット
+SNAPSHOT_MAGIC = b'EWBK'
+SNAPSHOT_VERSION = 1
+_TAG_END = 0
+_TAG_NONE = 1
+_TAG_FALSE = 2
+_TAG_TRUE = 3
+_TAG_INT = 4
+_TAG_TEXT = 5
+_TAG_DATE = 6
+_TAG_DATETIME = 7
+_TAG_FLOAT = 8
+_DOUBLE = struct.Struct('<d')
+
+
+def _chunks(lines):
+    """文字列をまとめてUTF-8のチャンクに変換
+
+    @param lines 文字列のイテラブル
+    @return バイト列のジェネレータ
+    """
+    buffer, size = [], 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield ''.join(buffer).encode('UTF-8')
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode('UTF-8')
+
+
+def encode_csv(columns, rows):
+    """CSV変換
+
+    @param columns カラム名のリスト
+    @param rows 行のイテラブル
+    @return バイト列のジェネレータ
+    """
+    def _lines():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        for row in _prepend(columns, rows):
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    return _chunks(_lines())
+
+
+def _prepend(first, rows):
+    """先頭に1行追加
+
+    @param first 先頭行
+    @param rows 行のイテラブル
+    @return 行のジェネレータ
+    """
+    yield first
+    yield from rows
+
+
+def _json_default(value):
+    """JSON変換できない値の変換
+
+    @param value 値
+    @return ISO 8601文字列
+    @exception TypeError 変換できない値
+    """
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def encode_jsonl(columns, rows):
+    """JSON Lines変換
+
+    @param columns カラム名のリスト
+    @param rows 行のイテラブル
+    @return バイト列のジェネレータ
+    """
+    return _chunks(
+        json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=_json_default) + '\n'
+        for row in rows
+    )
+
+
+def _varint(value):
+    """符号なし可変長整数
+
+    @param value 0以上の整数
+    @return バイト列
+    """
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _text(value):
+    """長さ付きUTF-8文字列
+
+    @param value 文字列
+    @return バイト列
+    """
+    data = value.encode('UTF-8')
+    return _varint(len(data)) + data
+
+
+def _encode_value(value):
+    """値を型タグ付きで変換
+
+    @param value 値
+    @return バイト列
+    @exception TypeError 未対応の型
+    """
+    if value is None:
+        return bytes((_TAG_NONE,))
+    if value is True:
+        return bytes((_TAG_TRUE,))
+    if value is False:
+        return bytes((_TAG_FALSE,))
+    if isinstance(value, int):
+        # zigzag
+        return bytes((_TAG_INT,)) + _varint(value * 2 if value >= 0 else -value * 2 - 1)
+    if isinstance(value, str):
+        return bytes((_TAG_TEXT,)) + _text(value)
+    if isinstance(value, datetime):
+        return bytes((_TAG_DATETIME,)) + _text(value.isoformat())
+    if isinstance(value, date):
+        return bytes((_TAG_DATE,)) + _varint(value.toordinal())
+    if isinstance(value, float):
+        return bytes((_TAG_FLOAT,)) + _DOUBLE.pack(value)
+    raise TypeError(f'{type(value).__name__} is not supported')
+
+
+def encode_snapshot(table, columns, rows):
+    """バイナリスナップショット変換
+
+    ヘッダー(マジック、バージョン、テーブル名、カラム名)に続き、
+    1行ごとに型タグ付きの値を並べ、終端タグで閉じる
+
+    @param table テーブル名
+    @param columns カラム名のリスト
+    @param rows 行のイテラブル
+    @return バイト列のジェネレータ
+    """
+    header = bytearray(SNAPSHOT_MAGIC)
+    header.append(SNAPSHOT_VERSION)
+    header += _text(table) + _varint(len(columns))
+    for column in columns:
+        header += _text(column)
+    yield bytes(header)
+
+    buffer = bytearray()
+    for row in rows:
+        for value in row:
+            buffer += _encode_value(value)
+        if len(buffer) >= CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer.append(_TAG_END)
+    yield bytes(buffer)
+
+
+class _SnapshotReader:
+    """ バイナリスナップショット読み込み """
+    def __init__(self, stream):
+        """コンストラクタ
+
+        @param stream バイナリストリーム
+        """
+        self._stream = stream
+
+    def read(self, size):
+        """指定バイト数読み込み
+
+        @param size バイト数
+        @return バイト列
+        @exception ValueError データが途切れている
+        """
+        data = self._stream.read(size)
+        if len(data) != size:
+            raise ValueError('truncated snapshot')
+        return data
+
+    def tag(self):
+        """型タグ読み込み
+
+        @return 型タグ
+        """
+        return self.read(1)[0]
+
+    def varint(self):
+        """符号なし可変長整数読み込み
+
+        @return 整数
+        """
+        result, shift = 0, 0
+        while True:
+            byte = self.tag()
+            result |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def text(self):
+        """長さ付きUTF-8文字列読み込み
+
+        @return 文字列
+        """
+        return self.read(self.varint()).decode('UTF-8')
+
+    def value(self, tag):
+        """型タグに対応する値読み込み
+
+        @param tag 型タグ
+        @return 値
+        @exception ValueError 不明な型タグ
+        """
+        if tag == _TAG_NONE:
+            return None
+        if tag in (_TAG_TRUE, _TAG_FALSE):
+            return tag == _TAG_TRUE
+        if tag == _TAG_INT:
+            value = self.varint()
+            return value >> 1 if not value & 1 else -(value >> 1) - 1
+        if tag == _TAG_TEXT:
+            return self.text()
+        if tag == _TAG_DATE:
+            return date.fromordinal(self.varint())
+        if tag == _TAG_DATETIME:
+            return datetime.fromisoformat(self.text())
+        if tag == _TAG_FLOAT:
+            return _DOUBLE.unpack(self.read(_DOUBLE.size))[0]
+        raise ValueError(f'unknown tag: {tag}')
+
+
+def decode_snapshot(stream):
+    """バイナリスナップショット読み込み
+
+    @param stream バイナリストリーム
+    @return テーブル名、カラム名のリスト、行タプルのジェネレータ
+    @exception ValueError スナップショットでない、データが途切れている
+    """
+    reader = _SnapshotReader(stream)
+    if reader.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+        raise ValueError('not a snapshot')
+    if reader.tag() != SNAPSHOT_VERSION:
+        raise ValueError('unsupported snapshot version')
+    table = reader.text()
+    columns = [reader.text() for _ in range(reader.varint())]
+
+    def _rows():
+        while True:
+            tag = reader.tag()
+            if tag == _TAG_END:
+                return
+            row = [reader.value(tag)]
+            for _ in range(len(columns) - 1):
+                row.append(reader.value(reader.tag()))
+            yield tuple(row)
+    return table, columns, _rows()
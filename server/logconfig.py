@@ -0,0 +1,207 @@
+"""ログ設定
+
+起動時にsetup()を1回呼び出す(モジュールの読み込み時にはログを設定しない)
+
+setting/logging.confで設定したルートロガーのハンドラーをQueueListenerに移し、
+ルートロガーにはQueueHandlerのみを付ける(リクエスト処理中のスレッドはキューに
+入れるのみで、ファイルへの書き込みはバックグラウンドのスレッドで行う)
+
+LOG_FORMAT=jsonなら1行1JSONで出力する
+LOG_MAX_BYTES、LOG_BACKUP_COUNTでRotatingFileHandlerのローテーション設定を上書きする
+"""
+from datetime import datetime, timezone
+import json
+import logging
+import logging.config
+import logging.handlers
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+
+
+# ログ設定ファイル(作業ディレクトリによらずリポジトリのsetting/logging.conf)
+CONFIG_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'setting', 'logging.conf')
+
+# 受け付けるX-Request-Idヘッダーの値
+_REQUEST_ID = re.compile(r'[\w.-]{1,64}')
+
+_local = threading.local()
+_LOADED = False
+_LISTENER = None
+# QueueListenerに移す前のハンドラー、QueueHandlerを付けたロガー
+_RESTORE = None
+_LOCK = threading.Lock()
+
+
+def load(config_file=CONFIG_FILE):
+    """ログ設定ファイルの読み込み(2回目以降は何もしない)
+
+    @param config_file ログ設定ファイル
+    """
+    global _LOADED
+    with _LOCK:
+        if _LOADED:
+            return
+        logging.config.fileConfig(config_file, disable_existing_loggers=False)
+        _LOADED = True
+
+
+def setup(config_file=CONFIG_FILE):
+    """ログ設定ファイルを読み込み、非同期のログ出力を開始
+
+    @param config_file ログ設定ファイル
+    @return QueueListener
+    """
+    load(config_file)
+    return configure()
+
+
+def start_request(environ):
+    """リクエストの開始(このスレッドのログにリクエストIDと経過時間を付ける)
+
+    @param environ WSGI環境変数
+    @return リクエストID(X-Request-Idヘッダーの値、なければ生成する)
+    """
+    request_id = environ.get('HTTP_X_REQUEST_ID', '')
+    if not _REQUEST_ID.fullmatch(request_id):
+        request_id = uuid.uuid4().hex
+    _local.request = (request_id, time.perf_counter())
+    return request_id
+
+
+def end_request():
+    """リクエストの終了
+    """
+    _local.request = None
+
+
+class RequestContextFilter(logging.Filter):
+    """ ログにリクエストID(request_id)、リクエスト開始からの経過時間(duration_ms)を付ける
+
+    ログを出力したスレッドで実行するため、QueueHandlerに付ける
+    """
+    def filter(self, record):
+        """フィルター
+
+        @param record ログレコード
+        @return True
+        """
+        request = getattr(_local, 'request', None)
+        if request is None:
+            record.request_id = None
+            record.duration_ms = None
+        else:
+            record.request_id = request[0]
+            record.duration_ms = round((time.perf_counter() - request[1]) * 1000, 3)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """ 1行1JSONのフォーマッター """
+    def format(self, record):
+        """フォーマット
+
+        @param record ログレコード
+        @return JSON文字列
+        """
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'lineno': record.lineno,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+            'duration_ms': getattr(record, 'duration_ms', None),
+        }
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exc_info'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """ キューに入れる前にメッセージを展開するQueueHandler
+
+    既定のprepareは例外情報をメッセージに連結するため、
+    フォーマッターが例外情報を別に出力できるようexc_textに入れる
+    """
+    def prepare(self, record):
+        """キューに入れるレコード作成
+
+        @param record ログレコード
+        @return ログレコード
+        """
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # 例外オブジェクト(トレースバック)は別スレッドに渡さない
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure(json_format=None, max_bytes=None, backup_count=None, logger=None):
+    """非同期のログ出力を開始(2回目以降は何もしない)
+
+    @param json_format 論理値(NoneならLOG_FORMAT=jsonか)
+    @param max_bytes ローテーションするファイルサイズ(NoneならLOG_MAX_BYTES)
+    @param backup_count 残す世代数(NoneならLOG_BACKUP_COUNT)
+    @param logger 対象のロガー(Noneならルートロガー)
+    @return QueueListener
+    """
+    global _LISTENER, _RESTORE
+    with _LOCK:
+        if _LISTENER is not None:
+            return _LISTENER
+        if json_format is None:
+            json_format = os.environ.get('LOG_FORMAT', '').lower() == 'json'
+        if max_bytes is None and os.environ.get('LOG_MAX_BYTES'):
+            max_bytes = int(os.environ['LOG_MAX_BYTES'])
+        if backup_count is None and os.environ.get('LOG_BACKUP_COUNT'):
+            backup_count = int(os.environ['LOG_BACKUP_COUNT'])
+
+        logger = logger or logging.getLogger()
+        handlers = list(logger.handlers)
+        for handler in handlers:
+            if isinstance(handler, logging.handlers.RotatingFileHandler):
+                if max_bytes is not None:
+                    handler.maxBytes = max_bytes
+                if backup_count is not None:
+                    handler.backupCount = backup_count
+            if json_format:
+                handler.setFormatter(JsonFormatter())
+            logger.removeHandler(handler)
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = _QueueHandler(log_queue)
+        queue_handler.addFilter(RequestContextFilter())
+        logger.addHandler(queue_handler)
+        _LISTENER = logging.handlers.QueueListener(
+            log_queue, *handlers, respect_handler_level=True)
+        _LISTENER.start()
+        _RESTORE = (logger, queue_handler, handlers)
+        return _LISTENER
+
+
+def shutdown():
+    """非同期のログ出力を停止
+
+    キューに残ったログを書き出し、ロガーのハンドラーを元に戻す
+    """
+    global _LISTENER, _RESTORE
+    with _LOCK:
+        if _LISTENER is None:
+            return
+        logger, queue_handler, handlers = _RESTORE
+        logger.removeHandler(queue_handler)
+        _LISTENER.stop()
+        for handler in handlers:
+            logger.addHandler(handler)
+        _LISTENER = _RESTORE = None
@@ -0,0 +1,343 @@
+"""メトリクス
+
+カウンター、ゲージ、ヒストグラムをメモリ上で集計し、
+Prometheusのテキスト形式で出力する
+
+リクエストごとのDBクエリ数、時間はスレッドローカルに積算し、
+リクエスト終了時にまとめて反映する
+"""
+from bisect import bisect_left
+import threading
+import time
+
+
+# ヒストグラムの既定の区切り(秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# リクエストあたりのDBクエリ数の区切り
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    """ラベル値のエスケープ
+
+    @param value ラベル値
+    @return エスケープした文字列
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=''):
+    """ラベル出力
+
+    @param names ラベル名のタプル
+    @param values ラベル値のタプル
+    @param extra 追加のラベル(le="..."など)
+    @return {...}形式の文字列(ラベルがなければ空文字列)
+    """
+    labels = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+def _format_value(value):
+    """値出力
+
+    @param value 値
+    @return 文字列
+    """
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """ メトリクス基底 """
+    TYPE = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        """コンストラクタ
+
+        @param name メトリクス名
+        @param documentation 説明
+        @param labelnames ラベル名のタプル
+        @param registry 登録先(Noneなら既定のREGISTRY)
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        (REGISTRY if registry is None else registry).register(self)
+
+    def _samples(self):
+        """出力する行
+
+        @return (サフィックス, ラベル値のタプル, 追加のラベル, 値)のリスト
+        """
+        with self._lock:
+            return [('', labels, '', value) for labels, value in sorted(self._values.items())]
+
+    def render(self):
+        """テキスト形式で出力
+
+        @return 行のリスト
+        """
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.TYPE}']
+        for suffix, labels, extra, value in self._samples():
+            lines.append(
+                f'{self.name}{suffix}{_format_labels(self.labelnames, labels, extra)} '
+                f'{_format_value(value)}')
+        return lines
+
+
+class Counter(_Metric):
+    """ カウンター """
+    TYPE = 'counter'
+
+    def inc(self, *labels, amount=1):
+        """加算
+
+        @param labels ラベル値
+        @param amount 加算する値
+        """
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        """値取得
+
+        @param labels ラベル値
+        @return 値
+        """
+        return self._values.get(labels, 0)
+
+
+class Gauge(Counter):
+    """ ゲージ """
+    TYPE = 'gauge'
+
+    def dec(self, *labels, amount=1):
+        """減算
+
+        @param labels ラベル値
+        @param amount 減算する値
+        """
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    """ ヒストグラム """
+    TYPE = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS,
+                 registry=None):
+        """コンストラクタ
+
+        @param name メトリクス名
+        @param documentation 説明
+        @param labelnames ラベル名のタプル
+        @param buckets 区切りの昇順タプル(+Infは自動で追加する)
+        @param registry 登録先(Noneなら既定のREGISTRY)
+        """
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, *labels):
+        """値を記録
+
+        @param value 値
+        @param labels ラベル値
+        """
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # [区切りごとの件数..., 合計, 件数]
+                state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0, 0]
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def _samples(self):
+        """出力する行(区切りごとの累積件数、合計、件数)
+
+        @return (サフィックス, ラベル値のタプル, 追加のラベル, 値)のリスト
+        """
+        samples = []
+        with self._lock:
+            items = sorted((labels, list(state)) for labels, state in self._values.items())
+        for labels, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state):
+                cumulative += count
+                samples.append(('_bucket', labels, f'le="{_format_value(bound)}"', cumulative))
+            samples.append(('_sum', labels, '', state[-2]))
+            samples.append(('_count', labels, '', state[-1]))
+        return samples
+
+
+class Registry:
+    """ メトリクスの登録先 """
+    def __init__(self):
+        """コンストラクタ
+        """
+        self._metrics = []
+
+    def register(self, metric):
+        """登録
+
+        @param metric メトリクス
+        """
+        self._metrics.append(metric)
+
+    def render(self):
+        """全メトリクスをテキスト形式で出力
+
+        @return 文字列
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUESTS = Counter(
+    'http_requests_total', 'Total HTTP requests.', ('endpoint', 'status'))
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency.', ('endpoint',))
+REQUEST_BYTES = Counter(
+    'http_request_bytes_total', 'Total HTTP request body bytes.', ('endpoint',))
+RESPONSE_BYTES = Counter(
+    'http_response_bytes_total', 'Total HTTP response body bytes.', ('endpoint',))
+IN_FLIGHT = Gauge(
+    'http_requests_in_flight', 'HTTP requests currently being served.')
+ERRORS = Counter(
+    'http_errors_total', 'HTTP error responses by class.', ('endpoint', 'class'))
+DB_QUERIES = Counter(
+    'db_queries_total', 'Total SQL statements executed.', ('endpoint',))
+DB_QUERY_SECONDS = Counter(
+    'db_query_seconds_total', 'Total time spent executing SQL statements.', ('endpoint',))
+DB_QUERIES_PER_REQUEST = Histogram(
+    'db_queries_per_request', 'SQL statements executed per HTTP request.', ('endpoint',),
+    buckets=QUERY_COUNT_BUCKETS)
+
+# エラーとして数えるレスポンスのクラス名
+ERROR_CLASSES = ('BadRequest', 'NotFound', 'InternalServerError')
+
+_local = threading.local()
+
+
+def observe_query(event):
+    """DBクエリ実行を記録(dbaccess.QUERY_OBSERVERSに登録する)
+
+    @param event dbaccess.QueryEvent
+    """
+    request = getattr(_local, 'request', None)
+    if request is not None:
+        request.queries += 1
+        request.query_seconds += event.elapsed + event.commit_elapsed
+
+
+class RequestTracker:
+    """ 1リクエストの計測 """
+    __slots__ = ('endpoint', 'start', 'queries', 'query_seconds', 'response_bytes')
+
+    def __init__(self, endpoint, request_bytes):
+        """コンストラクタ(計測開始)
+
+        @param endpoint エンドポイントのラベル
+        @param request_bytes リクエストボディのバイト数
+        """
+        self.endpoint = endpoint
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.response_bytes = 0
+        IN_FLIGHT.inc()
+        if request_bytes:
+            REQUEST_BYTES.inc(endpoint, amount=request_bytes)
+        _local.request = self
+
+    def finish(self, response):
+        """計測終了
+
+        @param response レスポンス
+        """
+        if getattr(_local, 'request', None) is self:
+            _local.request = None
+        endpoint = self.endpoint
+        IN_FLIGHT.dec()
+        REQUEST_DURATION.observe(time.perf_counter() - self.start, endpoint)
+        REQUESTS.inc(endpoint, response.status.split(' ', 1)[0])
+        RESPONSE_BYTES.inc(endpoint, amount=self.response_bytes)
+        DB_QUERIES.inc(endpoint, amount=self.queries)
+        DB_QUERY_SECONDS.inc(endpoint, amount=self.query_seconds)
+        DB_QUERIES_PER_REQUEST.observe(self.queries, endpoint)
+        error_class = type(response).__name__
+        if error_class in ERROR_CLASSES:
+            ERRORS.inc(endpoint, error_class)
+
+    def stream(self, response, chunks):
+        """ストリーミングレスポンスの送信完了(中断、送信前の破棄を含む)で計測終了
+
+        @param response レスポンス
+        @param chunks バイト列のイテラブル
+        @return StreamBody
+        """
+        return StreamBody(self, response, chunks)
+
+
+class StreamBody:
+    """ 計測するストリーミングレスポンスのボディ(WSGIのイテラブル)
+
+    WSGIサーバは送信完了、中断、送信前の破棄のいずれでもclose()を呼び出すため、
+    close()で計測を終了する(最後まで取得した場合はその時点で終了する)
+    """
+    def __init__(self, tracker, response, chunks):
+        """コンストラクタ
+
+        @param tracker RequestTracker
+        @param response レスポンス
+        @param chunks バイト列のイテラブル
+        """
+        self._tracker = tracker
+        self._response = response
+        self._chunks = chunks
+        self._iterator = None
+        self._finished = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._finished:
+            raise StopIteration
+        if self._iterator is None:
+            self._iterator = iter(self._chunks)
+        # 送信中(次のチャンクの取得中)のDBクエリもこのリクエストに記録する
+        _local.request = self._tracker
+        try:
+            chunk = next(self._iterator)
+        except StopIteration:
+            self.close()
+            raise
+        self._tracker.response_bytes += len(chunk)
+        return chunk
+
+    def close(self):
+        """元のイテラブルを閉じて計測終了(2回目以降は何もしない)
+        """
+        if self._finished:
+            return
+        self._finished = True
+        try:
+            close = getattr(self._chunks, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self._tracker.finish(self._response)
@@ -0,0 +1,361 @@
+"""リクエストのプロファイリング
+
+dispatchを包み、PROFILE_SAMPLE_RATEの割合のリクエスト、またはX-Profileヘッダーの値が
+PROFILE_TOKENと一致するリクエストのみプロファイルを取得し、1リクエスト1ファイルで
+PROFILE_DIRに書き出す(どちらも未設定ならdispatchをそのまま呼び出す)
+
+PROFILE_MODE
+  sample: 別スレッドから一定間隔でスタックを取得し、collapsed-stack形式(.folded)で書き出す
+  cprofile: cProfileの結果をpstats形式(.prof)で書き出す
+            mergeでは呼び出し元ごとの時間からスタックを近似してcollapsed-stack形式に変換する
+
+ストリーミングレスポンスのボディの生成はdispatchの後に行われるため含まれない
+
+python server/profiling.py merge profiles/*.folded profiles/*.prof --output merged.folded
+python server/profiling.py stats profiles/*.prof
+"""
+import argparse
+from collections import Counter
+from itertools import count
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+
+LOGGER = logging.getLogger()
+
+# プロファイルの既定の出力先
+DEFAULT_DIR = './profiles'
+# スタック取得の既定の間隔(秒)
+DEFAULT_INTERVAL = 0.005
+# pstatsから変換する際の1回あたりの時間(秒)
+PSTATS_UNIT = 0.000001
+# pstatsから変換するスタックの最大の深さ
+PSTATS_MAX_DEPTH = 100
+MODES = ('sample', 'cprofile')
+
+# ファイル名の連番
+_FILE_SEQ = count()
+
+
+def frame_name(code):
+    """スタックのフレーム名
+
+    @param code コードオブジェクト
+    @return 関数名 (ファイル名:行番号)
+    """
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'\
+        .replace(';', ':')
+
+
+class StackSampler:
+    """ スタックサンプラー
+
+    対象のスレッドのスタックを一定間隔で取得し、スタックごとの回数を数える
+    """
+    def __init__(self, thread_id=None, interval=DEFAULT_INTERVAL):
+        """コンストラクタ
+
+        @param thread_id 対象のスレッドID(Noneなら生成したスレッド)
+        @param interval 取得間隔(秒)
+        """
+        self._thread_id = threading.get_ident() if thread_id is None else thread_id
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.stacks = Counter()
+
+    def _sample(self):
+        """スタック取得(1回)
+        """
+        frame = sys._current_frames().get(self._thread_id)
+        names = []
+        while frame is not None:
+            names.append(frame_name(frame.f_code))
+            frame = frame.f_back
+        if names:
+            self.stacks[';'.join(reversed(names))] += 1
+
+    def _run(self):
+        """停止までスタックを取得
+        """
+        while not self._stop.wait(self._interval):
+            self._sample()
+
+    def start(self):
+        """開始
+        """
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止
+
+        @return {<スタック>: <回数>}
+        """
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+
+def write_folded(stacks, file, root=None):
+    """collapsed-stack形式で書き出す
+
+    @param stacks {<スタック>: <回数>}
+    @param file 出力先(write()を持つオブジェクト)
+    @param root 全スタックの先頭に付けるフレーム名
+    """
+    prefix = f'{root.replace(";", ":")};' if root else ''
+    for stack, samples in sorted(stacks.items()):
+        file.write(f'{prefix}{stack} {samples}\n')
+
+
+def read_folded(file):
+    """collapsed-stack形式の読み込み
+
+    @param file 入力元(行のイテラブル)
+    @return {<スタック>: <回数>}
+    """
+    stacks = Counter()
+    for line in file:
+        stack, _, samples = line.rstrip('\n').rpartition(' ')
+        if stack and samples.isdigit():
+            stacks[stack] += int(samples)
+    return stacks
+
+
+def pstats_frame_name(func):
+    """pstatsの関数のフレーム名(frame_nameと同じ形式)
+
+    @param func (ファイル名, 行番号, 関数名)
+    @return 関数名 (ファイル名:行番号)
+    """
+    file_name, line, name = func
+    return f'{name} ({os.path.basename(file_name)}:{line})'.replace(';', ':')
+
+
+def fold_pstats(stats, unit=PSTATS_UNIT):
+    """pstatsの呼び出し関係をcollapsed-stack形式に変換
+
+    cProfileは呼び出し元ごとの累積時間しか記録しないため、関数の内部時間を
+    呼び出し元からの累積時間の割合で呼び出し経路ごとに配分する(近似値)
+    再帰呼び出しは経路に含めない
+
+    @param stats pstats.Stats.stats({<関数>: (呼び出し回数, ..., 内部時間, 累積時間, 呼び出し元)})
+    @param unit 1回あたりの時間(秒)
+    @return {<スタック>: <回数(内部時間 / unit)>}
+    """
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+    stacks = Counter()
+    path, visiting = [], set()
+
+    def _visit(func, share):
+        _, _, inline, _, _ = stats[func]
+        path.append(pstats_frame_name(func))
+        visiting.add(func)
+        samples = round(inline * share / unit)
+        if samples:
+            stacks[';'.join(path)] += samples
+        if len(path) < PSTATS_MAX_DEPTH:
+            for callee, edge_total in callees.get(func, []):
+                callee_total = stats[callee][3]
+                # 配分される時間が1回に満たない経路は辿らない
+                if callee in visiting or callee_total * share < unit:
+                    continue
+                _visit(callee, share * min(edge_total / callee_total, 1.0))
+        visiting.discard(func)
+        path.pop()
+
+    for func, (_, _, _, _, callers) in stats.items():
+        if not callers:
+            _visit(func, 1.0)
+    return stacks
+
+
+def merge_folded(paths):
+    """collapsed-stack形式(.prof以外)、pstats形式(.prof)のファイルを合算
+
+    @param paths ファイルパスのリスト
+    @return {<スタック>: <回数>}
+    """
+    stacks = Counter()
+    for path in paths:
+        if path.endswith('.prof'):
+            import pstats
+            stacks.update(fold_pstats(pstats.Stats(path).stats))
+            continue
+        with open(path, encoding='UTF-8') as file:
+            stacks.update(read_folded(file))
+    return stacks
+
+
+class ProfilingMiddleware:
+    """ プロファイリングミドルウェア """
+    def __init__(self, app, sample_rate=0.0, token=None, directory=DEFAULT_DIR,
+                 mode='sample', interval=DEFAULT_INTERVAL, rng=random.random):
+        """コンストラクタ
+
+        @param app WSGI環境変数を受け取りレスポンスを返す関数(dispatch)
+        @param sample_rate プロファイルを取得するリクエストの割合(0〜1)
+        @param token X-Profileヘッダーで指定する値(Noneならヘッダーを無視する)
+        @param directory 出力先
+        @param mode sample、cprofile
+        @param interval sampleのスタック取得間隔(秒)
+        @param rng 0以上1未満の乱数を返す関数
+        @exception ValueError modeが不正
+        """
+        if mode not in MODES:
+            raise ValueError(f'invalid profile mode: {mode}')
+        self._app = app
+        self._sample_rate = sample_rate
+        self._token = token or None
+        self._directory = directory
+        self._mode = mode
+        self._interval = interval
+        self._rng = rng
+        self.enabled = sample_rate > 0 or self._token is not None
+
+    @classmethod
+    def from_env(cls, app):
+        """環境変数から生成
+
+        PROFILE_SAMPLE_RATE、PROFILE_TOKEN、PROFILE_DIR、PROFILE_MODE、PROFILE_INTERVAL_MS
+
+        @param app WSGI環境変数を受け取りレスポンスを返す関数(dispatch)
+        @return ProfilingMiddleware
+        """
+        return cls(
+            app,
+            sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+            token=os.environ.get('PROFILE_TOKEN'),
+            directory=os.environ.get('PROFILE_DIR', DEFAULT_DIR),
+            mode=os.environ.get('PROFILE_MODE', 'sample'),
+            interval=float(os.environ.get('PROFILE_INTERVAL_MS', DEFAULT_INTERVAL * 1000)) / 1000,
+        )
+
+    def should_profile(self, environ):
+        """プロファイルを取得するか
+
+        @param environ WSGI環境変数
+        @return 論理値
+        """
+        if self._token is not None and environ.get('HTTP_X_PROFILE') == self._token:
+            return True
+        return self._sample_rate > 0 and self._rng() < self._sample_rate
+
+    def __call__(self, environ):
+        """割り当て(必要ならプロファイルを取得)
+
+        @param environ WSGI環境変数
+        @return レスポンス
+        """
+        if not self.enabled or not self.should_profile(environ):
+            return self._app(environ)
+        label = f'{environ.get("REQUEST_METHOD", "GET")} {environ.get("PATH_INFO", "")}'
+        if self._mode == 'cprofile':
+            return self._cprofile(environ, label)
+        return self._sample(environ, label)
+
+    def _sample(self, environ, label):
+        """スタックサンプラーで取得
+
+        @param environ WSGI環境変数
+        @param label リクエストの表示名
+        @return レスポンス
+        """
+        sampler = StackSampler(interval=self._interval)
+        sampler.start()
+        try:
+            return self._app(environ)
+        finally:
+            stacks = sampler.stop()
+            self._write(label, 'folded', lambda path: self._write_folded(path, stacks, label))
+
+    @staticmethod
+    def _write_folded(path, stacks, label):
+        """collapsed-stack形式のファイル出力
+
+        @param path ファイルパス
+        @param stacks {<スタック>: <回数>}
+        @param label リクエストの表示名(先頭のフレーム名)
+        """
+        with open(path, 'w', encoding='UTF-8') as file:
+            write_folded(stacks, file, root=label)
+
+    def _cprofile(self, environ, label):
+        """cProfileで取得
+
+        @param environ WSGI環境変数
+        @param label リクエストの表示名
+        @return レスポンス
+        """
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as err:
+            # 他のプロファイラが動作中
+            LOGGER.warning('profiling skipped: %s', err)
+            return self._app(environ)
+        try:
+            return self._app(environ)
+        finally:
+            profile.disable()
+            self._write(label, 'prof', profile.dump_stats)
+
+    def _write(self, label, suffix, write):
+        """プロファイル出力(失敗してもレスポンスには影響させない)
+
+        @param label リクエストの表示名
+        @param suffix 拡張子
+        @param write ファイルパスを受け取り出力する関数
+        """
+        name = re.sub(r'[^\w.-]+', '_', label).strip('_')
+        path = os.path.join(
+            self._directory,
+            f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{next(_FILE_SEQ)}-{name}.{suffix}')
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            write(path)
+        except OSError as err:
+            LOGGER.error(err)
+
+
+def main():
+    """コマンドライン実行
+
+    mergeはcollapsed-stackファイルに合算し、statsは.profファイルを合算して上位を表示する
+    """
+    parser = argparse.ArgumentParser(description='リクエストのプロファイル集計')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    merge = subparsers.add_parser(
+        'merge', help='.folded、.profファイルを1つのcollapsed-stackファイルに合算')
+    merge.add_argument('files', nargs='+', help='.folded、.profファイル')
+    merge.add_argument('--output', default='-', help='出力ファイル(-なら標準出力)')
+    stats = subparsers.add_parser('stats', help='.profファイルを合算して上位を表示')
+    stats.add_argument('files', nargs='+', help='.profファイル')
+    stats.add_argument('--sort', default='cumulative', help='並び順(pstatsのキー)')
+    stats.add_argument('--limit', type=int, default=30, help='表示件数')
+    args = parser.parse_args()
+
+    if args.command == 'merge':
+        stacks = merge_folded(args.files)
+        if args.output == '-':
+            write_folded(stacks, sys.stdout)
+        else:
+            with open(args.output, 'w', encoding='UTF-8') as file:
+                write_folded(stacks, file)
+    else:
+        import pstats
+        pstats.Stats(*args.files).sort_stats(args.sort).print_stats(args.limit)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""SQL実行統計
+
+dbaccess.QUERY_OBSERVERSに登録し、SQL文の指紋(リテラル、プレースホルダーを?に置き換え、
+空白をまとめたもの)ごとに実行回数、実行時間、コミット時間、行数を集計する
+
+実行時間がSLOW_QUERY_MS(ミリ秒)以上のSQLは、SQL文と実行計画をログに出力する
+(負の値なら出力しない、0なら全て出力する)
+"""
+from functools import lru_cache
+import logging
+import os
+import re
+import threading
+import time
+
+
+LOGGER = logging.getLogger()
+
+# スロークエリの既定の閾値(ミリ秒)
+DEFAULT_SLOW_QUERY_MS = 500
+# 同じ指紋の実行計画を再取得するまでの秒数
+EXPLAIN_INTERVAL = 60
+# 集計する最大指紋数(超えた分はOTHERにまとめる)
+MAX_FINGERPRINTS = 1000
+OTHER = '<other>'
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%(?:\(\w+\))?s')
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql):
+    """SQL文の指紋
+
+    @param sql SQL文
+    @return 指紋
+    """
+    result = _STRING.sub('?', sql)
+    result = _PLACEHOLDER.sub('?', result)
+    result = _NUMBER.sub('?', result)
+    result = _LIST.sub('(?)', result)
+    return _SPACE.sub(' ', result).strip().rstrip(';')
+
+
+class _Entry:
+    """ 指紋ごとの集計 """
+    __slots__ = ('calls', 'total', 'max', 'commit', 'rows')
+
+    def __init__(self):
+        """コンストラクタ
+        """
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.commit = 0.0
+        self.rows = 0
+
+
+class QueryStats:
+    """ SQL実行統計 """
+    def __init__(self, slow_query_ms=DEFAULT_SLOW_QUERY_MS, logger=LOGGER):
+        """コンストラクタ
+
+        @param slow_query_ms スロークエリの閾値(ミリ秒、負の値なら出力しない)
+        @param logger スロークエリの出力先
+        """
+        self.slow_query_ms = slow_query_ms
+        self._logger = logger
+        self._entries = {}
+        self._explained = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """環境変数SLOW_QUERY_MSから生成
+
+        @return QueryStats
+        """
+        return cls(float(os.environ.get('SLOW_QUERY_MS', DEFAULT_SLOW_QUERY_MS)))
+
+    def observe(self, event):
+        """SQL実行を記録(dbaccess.QUERY_OBSERVERSに登録する)
+
+        @param event dbaccess.QueryEvent
+        """
+        key = fingerprint(event.sql)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if len(self._entries) >= MAX_FINGERPRINTS:
+                    key = OTHER
+                entry = self._entries.setdefault(key, _Entry())
+            entry.calls += 1
+            entry.total += event.elapsed
+            entry.commit += event.commit_elapsed
+            if event.elapsed > entry.max:
+                entry.max = event.elapsed
+            if event.rows > 0:
+                entry.rows += event.rows
+        if 0 <= self.slow_query_ms <= event.elapsed * 1000:
+            self._log_slow(key, event)
+
+    def _log_slow(self, key, event):
+        """スロークエリ出力
+
+        実行計画は指紋ごとにEXPLAIN_INTERVAL秒に1回のみ取得する
+
+        @param key 指紋
+        @param event dbaccess.QueryEvent
+        """
+        plan = None
+        if event.explain is not None:
+            now = time.monotonic()
+            with self._lock:
+                due = now - self._explained.get(key, -EXPLAIN_INTERVAL) >= EXPLAIN_INTERVAL
+                if due:
+                    self._explained[key] = now
+            if due:
+                try:
+                    plan = event.explain(event.sql, event.data)
+                except Exception as err:
+                    plan = [f'(EXPLAIN failed: {err})']
+        message = 'slow query: %.1fms commit=%.1fms rows=%d: %s'
+        args = [event.elapsed * 1000, event.commit_elapsed * 1000, event.rows, key]
+        if plan:
+            message += '\n%s'
+            args.append('\n'.join(plan))
+        self._logger.warning(message, *args)
+
+    def top(self, n=10):
+        """合計実行時間の上位
+
+        @param n 件数
+        @return 合計実行時間の降順のリスト
+        @retval fingerprint 指紋
+        @retval calls 実行回数
+        @retval total_ms 合計実行時間(ミリ秒)
+        @retval mean_ms 平均実行時間(ミリ秒)
+        @retval max_ms 最大実行時間(ミリ秒)
+        @retval commit_ms 合計コミット時間(ミリ秒)
+        @retval rows 合計行数
+        """
+        with self._lock:
+            items = sorted(self._entries.items(), key=lambda item: item[1].total, reverse=True)[:n]
+            return [{
+                'fingerprint': key,
+                'calls': entry.calls,
+                'total_ms': round(entry.total * 1000, 3),
+                'mean_ms': round(entry.total * 1000 / entry.calls, 3),
+                'max_ms': round(entry.max * 1000, 3),
+                'commit_ms': round(entry.commit * 1000, 3),
+                'rows': entry.rows,
+            } for key, entry in items]
+
+    def report(self, n=10):
+        """合計実行時間の上位をテキストで出力
+
+        @param n 件数
+        @return 文字列
+        """
+        lines = [f'{"total_ms":>12} {"calls":>8} {"mean_ms":>10} {"max_ms":>10} '
+                 f'{"commit_ms":>10} {"rows":>10}  fingerprint']
+        for row in self.top(n):
+            lines.append(
+                f'{row["total_ms"]:>12.1f} {row["calls"]:>8} {row["mean_ms"]:>10.3f} '
+                f'{row["max_ms"]:>10.3f} {row["commit_ms"]:>10.3f} {row["rows"]:>10}  '
+                f'{row["fingerprint"]}')
+        return '\n'.join(lines)
+
+    def reset(self):
+        """集計を破棄
+        """
+        with self._lock:
+            self._entries.clear()
+            self._explained.clear()
+
+
+STATS = QueryStats.from_env()
@@ -0,0 +1,316 @@
+"""学習画面の出題デッキ
+
+出題デッキ(出題順の問題リスト)を(セッション, 乱数シード)ごとにメモリ上にキャッシュし、
+要求された範囲のみを返却する
+
+残りが少なくなったデッキはバックグラウンドで作り直し、
+単語の更新時は該当する問題のみを差し替える
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
+from itertools import islice
+import logging
+import os
+from random import Random
+import threading
+import time
+
+
+LOGGER = logging.getLogger()
+
+# 既定のセッション
+DEFAULT_SESSION = 'default'
+
+
+def session_seed(session):
+    """セッション名から乱数シードを求める(プロセスをまたいで同じ値)
+
+    @param session セッション
+    @return 乱数シード
+    """
+    return int.from_bytes(blake2b(session.encode('UTF-8'), digest_size=8).digest(), 'big')
+
+
+def sample_distractors(answer, pool, k, rng):
+    """不正解選択
+
+    poolから正解以外の異なる文字列をk件選ぶ
+    候補がk件に満たない場合は候補のみ返却する
+
+    @param answer 正解
+    @param pool 候補のシーケンス(重複なし)
+    @param k 件数
+    @param rng random.Random
+    @return 不正解のリスト
+    """
+    # 正解が含まれていてもk件残るよう1件多く選ぶ
+    picked = rng.sample(pool, min(k + 1, len(pool)))
+    return [value for value in picked if value != answer][:k]
+
+
+def build_quiz(corrects, incorrects, similar=None, seed=0):
+    """問題作成
+
+    類似語検索関数があれば類似した日本語を不正解にし、
+    3件に満たない分は不正解用の日本語データから選ぶ
+    乱数は(シード, PKEY)ごとに初期化するため、同じ入力からは同じ問題を作成する
+
+    @param corrects 正解データ({id, english, japanese, bookmark}のイテラブル)
+    @param incorrects 不正解用の日本語データ
+    @param similar 日本語、件数を受け取り類似した日本語のリストを返す関数
+    @param seed 乱数シード
+    @return 問題のリスト
+    @retval id PKEY
+    @retval english 英単語
+    @retval answers 選択肢(正解と不正解3件をシャッフル)
+    @retval correct 正解の日本語
+    @retval bookmark_flag 論理値
+    """
+    pool = sorted({row[0] for row in incorrects})
+    data = []
+    for correct in corrects:
+        rng = Random(f'{seed}:{correct["id"]}')
+        answer = correct['japanese']
+        distractors = [] if similar is None else similar(answer, 3)[:3]
+        if len(distractors) < 3:
+            excluded = set(distractors)
+            distractors += [
+                value for value in sample_distractors(answer, pool, 3 + len(excluded), rng)
+                if value not in excluded
+            ][:3 - len(distractors)]
+
+        answer_list = [answer, *distractors]
+        data.append({
+            'id': correct['id'],
+            'english': correct['english'],
+            'answers': rng.sample(answer_list, len(answer_list)),
+            'correct': answer,
+            'bookmark_flag': correct['bookmark']
+        })
+    return data
+
+
+class _Deck:
+    """ 出題デッキ """
+    __slots__ = ('items', 'built_at', 'complete')
+
+    def __init__(self, items, size):
+        """コンストラクタ
+
+        @param items 問題のリスト
+        @param size 作成時の最大件数
+        """
+        self.items = OrderedDict((item['id'], item) for item in items)
+        self.built_at = time.monotonic()
+        # 最大件数に満たなければ出題対象を全て含む(作り直しても増えない)
+        self.complete = len(self.items) < size
+
+
+class QuizDeckCache:
+    """ (セッション, 乱数シード)ごとの出題デッキキャッシュ(LRU) """
+    def __init__(self, load_deck, load_item, word_factory,
+                 max_sessions=64, prefetch=10, ttl=300, page_size=100):
+        """コンストラクタ
+
+        デッキは1回の取得の最大件数よりprefetch件多く作成する
+
+        @param load_deck Word、乱数シード、最大件数を受け取り問題のリストを返す関数
+        @param load_item Word、PKEY、乱数シードを受け取り問題(出題対象外ならNone)を返す関数
+        @param word_factory バックグラウンド処理で使用するWordの生成関数
+        @param max_sessions キャッシュする最大セッション数
+        @param prefetch 残りがこの件数未満になったら作り直す(0なら作り直さない)
+        @param ttl 作成からこの秒数を過ぎたら作り直す
+        @param page_size 1回の取得の最大件数
+        """
+        self._load_deck = load_deck
+        self._load_item = load_item
+        self._word_factory = word_factory
+        self._word = None
+        self._max_sessions = max_sessions
+        self._prefetch = prefetch
+        self._ttl = ttl
+        self._deck_size = page_size + prefetch
+        self._decks = OrderedDict()
+        self._building = set()
+        self._lock = threading.Lock()
+        # バックグラウンド処理のスレッド(初回の使用時に作成する)
+        self._executor = None
+
+    @classmethod
+    def from_env(cls, load_deck, load_item, word_factory, page_size):
+        """環境変数から生成
+
+        QUIZ_CACHE_SESSIONS、QUIZ_CACHE_PREFETCH、QUIZ_CACHE_TTL
+
+        @param load_deck Word、乱数シード、最大件数を受け取り問題のリストを返す関数
+        @param load_item Word、PKEY、乱数シードを受け取り問題(出題対象外ならNone)を返す関数
+        @param word_factory バックグラウンド処理で使用するWordの生成関数
+        @param page_size 1回の取得の最大件数
+        @return QuizDeckCache
+        """
+        return cls(
+            load_deck, load_item, word_factory, page_size=page_size,
+            max_sessions=int(os.environ.get('QUIZ_CACHE_SESSIONS', 64)),
+            prefetch=int(os.environ.get('QUIZ_CACHE_PREFETCH', 10)),
+            ttl=int(os.environ.get('QUIZ_CACHE_TTL', 300)),
+        )
+
+    def _store(self, key, items):
+        """デッキ登録(最大セッション数を超えたら最も古いものを破棄)
+
+        ロックを取得して呼び出すこと
+
+        @param key (セッション, 乱数シード)
+        @param items 問題のリスト
+        """
+        self._decks[key] = _Deck(items, self._deck_size)
+        self._decks.move_to_end(key)
+        while len(self._decks) > self._max_sessions:
+            self._decks.popitem(last=False)
+
+    def get(self, session, seed, offset, limit, word):
+        """出題デッキの範囲取得
+
+        キャッシュがなければ同期で作成し、出題対象が残っているのにデッキの残りが少ない、
+        または古い場合はバックグラウンドで作り直す
+        回答済みの問題はデッキから除かれるため、offsetは未回答の問題の位置となる
+
+        @param session セッション
+        @param seed 乱数シード
+        @param offset 開始位置
+        @param limit 最大件数
+        @param word リクエスト処理中のWord(同期で作成する場合に使用)
+        @return 問題のリスト
+        """
+        key = (session, seed)
+        with self._lock:
+            deck = self._decks.get(key)
+            if deck is not None:
+                self._decks.move_to_end(key)
+        if deck is None:
+            items = self._load_deck(word, seed, self._deck_size)
+            with self._lock:
+                self._store(key, items)
+                deck = self._decks[key]
+
+        with self._lock:
+            result = list(islice(deck.items.values(), offset, offset + limit))
+            remaining = max(len(deck.items) - (offset + limit), 0)
+            stale = not deck.complete and remaining < self._prefetch \
+                or time.monotonic() - deck.built_at > self._ttl
+        if stale:
+            self.refresh(key)
+        return result
+
+    def refresh(self, key):
+        """バックグラウンドでデッキを作り直す(作成中なら何もしない)
+
+        @param key (セッション, 乱数シード)
+        """
+        with self._lock:
+            if key in self._building:
+                return
+            self._building.add(key)
+        self._submit(self._rebuild, key)
+
+    def _submit(self, fn, *args):
+        """バックグラウンド処理の登録
+
+        @param fn 関数
+        @param args 引数
+        @return Future
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix='quiz-deck')
+        return self._executor.submit(fn, *args)
+
+    def _background_word(self):
+        """バックグラウンド処理用のWord取得(初回のみ接続)
+
+        @return Word
+        """
+        if self._word is None:
+            self._word = self._word_factory()
+        return self._word
+
+    def _rebuild(self, key):
+        """デッキ作り直し(バックグラウンド)
+
+        @param key (セッション, 乱数シード)
+        """
+        try:
+            items = self._load_deck(self._background_word(), key[1], self._deck_size)
+            with self._lock:
+                # 作成中に破棄されたセッションは登録しない
+                if key in self._decks:
+                    self._store(key, items)
+        except Exception as err:
+            # 次回は接続し直す
+            LOGGER.error(err)
+            self._word = None
+        finally:
+            with self._lock:
+                self._building.discard(key)
+
+    def discard(self, pkey):
+        """全デッキから問題を除く(回答済み、削除)
+
+        @param pkey PKEY
+        """
+        with self._lock:
+            for deck in self._decks.values():
+                deck.items.pop(pkey, None)
+
+    def patch(self, pkey, **fields):
+        """全デッキの問題の項目を更新
+
+        @param pkey PKEY
+        @param fields {<項目>: <値>}
+        """
+        with self._lock:
+            for deck in self._decks.values():
+                item = deck.items.get(pkey)
+                if item is not None:
+                    item.update(fields)
+
+    def update_correct(self, pkey, correct):
+        """is_correctフラグ更新を反映
+
+        正解なら全デッキから除き、未習得に戻したならバックグラウンドで
+        問題を作成して全デッキの末尾に追加する
+
+        @param pkey PKEY
+        @param correct 論理値
+        """
+        self.discard(pkey)
+        if not correct:
+            self._submit(self._add, pkey)
+
+    def _add(self, pkey):
+        """問題を作成して全デッキに追加(バックグラウンド)
+
+        @param pkey PKEY
+        """
+        with self._lock:
+            seeds = {seed for _, seed in self._decks}
+        items = {}
+        try:
+            for seed in seeds:
+                items[seed] = self._load_item(self._background_word(), pkey, seed)
+        except Exception as err:
+            LOGGER.error(err)
+            self._word = None
+            return
+        with self._lock:
+            for (_, seed), deck in self._decks.items():
+                if items.get(seed) is not None:
+                    deck.items.setdefault(pkey, items[seed])
+
+    def wait(self):
+        """バックグラウンド処理の完了待ち
+        """
+        if self._executor is not None:
+            self._executor.submit(lambda: None).result()
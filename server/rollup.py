@@ -0,0 +1,43 @@
+"""アクティビティの日ごとの集計
+
+activity_daily(日付、イベント、件数)はactivityのトリガーで挿入、削除のたびに更新する
+トリガー作成前のアクティビティ、UPDATE、TRUNCATEは反映されないため、
+全アクティビティから作り直す
+
+python server/rollup.py rebuild
+python server/rollup.py check
+"""
+import argparse
+import sys
+
+
+def main():
+    """コマンドライン実行
+
+    rebuildは全アクティビティから作り直し、checkは差分があれば終了コード1で終了する
+    """
+    parser = argparse.ArgumentParser(description='アクティビティの日ごとの集計')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('rebuild', help='全アクティビティから作り直す')
+    subparsers.add_parser('check', help='全アクティビティの集計との差分を表示')
+    args = parser.parse_args()
+
+    import logconfig
+    from dbaccess import Activity
+    logconfig.load()
+    db_activity = Activity()
+    if args.command == 'rebuild':
+        count = db_activity.rebuild_daily()
+        print(f'{count}件の集計を作成しました')
+        return
+    drift = db_activity.select_daily_drift()
+    for row in drift:
+        print(f'{row["date"]}\t{row["event"]}\t{row["count"]}\t{row["actual"]}')
+    if drift:
+        print(f'{len(drift)}件の集計が一致しません(rebuildで作り直してください)', file=sys.stderr)
+        sys.exit(1)
+    print('集計は一致しています')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+"""類似語インデックス
+
+日本語の文字n-gramから64ビットのSimHashを求め、ビットを回転させた複数の
+ソート済み配列をファイルに書き出す
+検索は各配列を二分探索して前後の候補を集め、ハミング距離が小さい順
+(同じ距離なら文字数の差が小さい順)に返却する(O(log n))
+
+インデックスファイルはmmapで読み込むため、起動時に全体を読み込まない
+IndexFileは初回の使用時に開き、作り直されたファイルは開き直す
+品詞情報は持たないため使用しない
+
+python server/similarity.py --output setting/similarity.idx
+"""
+import argparse
+from array import array
+from bisect import bisect_left
+from hashlib import blake2b
+import heapq
+import mmap
+import os
+import struct
+import threading
+
+
+# インデックスファイルの既定のパス(リポジトリのsetting/similarity.idx)
+DEFAULT_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'setting', 'similarity.idx')
+
+# ヘッダー(マジック、バージョン、配列数、予約、件数、文字列の総バイト数)
+MAGIC = b'EWSI'
+VERSION = 1
+_HEADER = struct.Struct('<4sBBHII')
+_HEADER_SIZE = 16
+
+# 配列数(配列ごとにハッシュを16ビットずつ回転させる)
+TABLES = 4
+# 1配列あたりの探索位置の前後の候補数
+WINDOW = 8
+# 文字n-gramのn
+NGRAM = 2
+
+_MASK = (1 << 64) - 1
+
+
+def _rotate(value, bits):
+    """64ビット左回転
+
+    @param value 値
+    @param bits 回転するビット数
+    @return 値
+    """
+    return ((value << bits) | (value >> (64 - bits))) & _MASK if bits else value
+
+
+def ngrams(text, n=NGRAM):
+    """文字n-gram(前後に境界記号を付ける)
+
+    @param text 文字列
+    @param n n
+    @return n-gramのリスト
+    """
+    padded = f'^{text}$'
+    return [padded[i:i + n] for i in range(max(len(padded) - n + 1, 1))]
+
+
+def simhash(text):
+    """SimHash
+
+    @param text 文字列
+    @return 64ビット整数
+    """
+    counts = [0] * 64
+    for gram in ngrams(text):
+        value = int.from_bytes(blake2b(gram.encode('UTF-8'), digest_size=8).digest(), 'little')
+        for bit in range(64):
+            counts[bit] += 1 if value >> bit & 1 else -1
+    result = 0
+    for bit, count in enumerate(counts):
+        if count > 0:
+            result |= 1 << bit
+    return result
+
+
+def build(texts, file_path, tables=TABLES):
+    """インデックス作成
+
+    @param texts 文字列のイテラブル(重複は除く)
+    @param file_path 出力ファイル
+    @param tables 配列数
+    @return 件数
+    """
+    texts = sorted(set(texts))
+    hashes = array('Q', (simhash(text) for text in texts))
+    blob = bytearray()
+    offsets = array('I', [0])
+    for text in texts:
+        blob += text.encode('UTF-8')
+        offsets.append(len(blob))
+
+    keys, rows = [], []
+    for table in range(tables):
+        bits = table * 64 // tables
+        order = sorted(range(len(texts)), key=lambda row: _rotate(hashes[row], bits))
+        keys.append(array('Q', (_rotate(hashes[row], bits) for row in order)))
+        rows.append(array('I', order))
+
+    tmp_path = f'{file_path}.tmp'
+    with open(tmp_path, 'wb') as file:
+        header = _HEADER.pack(MAGIC, VERSION, tables, 0, len(texts), len(blob))
+        file.write(header.ljust(_HEADER_SIZE, b'\0'))
+        hashes.tofile(file)
+        for values in keys + rows:
+            values.tofile(file)
+        offsets.tofile(file)
+        file.write(blob)
+    os.replace(tmp_path, file_path)
+    return len(texts)
+
+
+class SimilarityIndex:
+    """ 類似語インデックス(mmap) """
+    def __init__(self, file_path):
+        """コンストラクタ
+
+        @param file_path インデックスファイル
+        @exception FileNotFoundError ファイルが存在しない
+        @exception ValueError インデックスファイルでない
+        """
+        with open(file_path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, tables, _, size, blob_size = _HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError('not a similarity index')
+
+        view = memoryview(self._mmap)
+        position = _HEADER_SIZE
+
+        def _take(fmt, count):
+            nonlocal position
+            end = position + count * struct.calcsize(fmt)
+            values = view[position:end].cast(fmt)
+            position = end
+            return values
+
+        self._size = size
+        self._hashes = _take('Q', size)
+        self._keys = [_take('Q', size) for _ in range(tables)]
+        self._rows = [_take('I', size) for _ in range(tables)]
+        self._offsets = _take('I', size + 1)
+        self._blob = view[position:position + blob_size]
+        self._bits = [table * 64 // tables for table in range(tables)]
+
+    @classmethod
+    def open(cls, file_path=DEFAULT_PATH):
+        """インデックスを開く
+
+        @param file_path インデックスファイル
+        @return SimilarityIndex(存在しない、壊れている場合はNone)
+        """
+        try:
+            return cls(file_path)
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def __len__(self):
+        return self._size
+
+    def text(self, row):
+        """文字列取得
+
+        @param row 行番号
+        @return 文字列
+        """
+        return bytes(self._blob[self._offsets[row]:self._offsets[row + 1]]).decode('UTF-8')
+
+    def similar(self, text, k=3):
+        """類似語検索
+
+        @param text 文字列(インデックスに含まれていなくてもよい)
+        @param k 最大件数
+        @return 類似度が高い順の文字列のリスト(text自身を除く)
+        """
+        query = simhash(text)
+        candidates = set()
+        for keys, rows, bits in zip(self._keys, self._rows, self._bits):
+            index = bisect_left(keys, _rotate(query, bits))
+            for position in range(max(index - WINDOW, 0), min(index + WINDOW, self._size)):
+                candidates.add(rows[position])
+
+        scored = []
+        for row in candidates:
+            candidate = self.text(row)
+            if candidate == text:
+                continue
+            distance = bin(self._hashes[row] ^ query).count('1')
+            scored.append((distance, abs(len(candidate) - len(text)), candidate))
+        return [candidate for _, _, candidate in heapq.nsmallest(k, scored)]
+
+    def close(self):
+        """インデックスを閉じる
+        """
+        for values in [self._hashes, self._offsets, self._blob, *self._keys, *self._rows]:
+            values.release()
+        self._mmap.close()
+
+
+class IndexFile:
+    """ 類似語インデックスファイル
+
+    初回の使用時に開き、ファイルが置き換えられたら(buildは置き換えで書き出す)開き直す
+    """
+    def __init__(self, file_path=DEFAULT_PATH):
+        """コンストラクタ
+
+        @param file_path インデックスファイル
+        """
+        self._file_path = file_path
+        self._index = None
+        # 開いたファイルの(iノード番号, 更新日時, サイズ)(Noneなら未確認)
+        self._stat = None
+        self._opened = False
+        self._lock = threading.Lock()
+
+    def _file_stat(self):
+        """ファイルの状態
+
+        @return (iノード番号, 更新日時, サイズ)(存在しない場合はNone)
+        """
+        try:
+            stat = os.stat(self._file_path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def get(self):
+        """インデックス取得
+
+        使用中のインデックスは閉じずに参照を外し、使い終わったら解放させる
+
+        @return SimilarityIndex(存在しない、壊れている場合はNone)
+        """
+        stat = self._file_stat()
+        with self._lock:
+            if not self._opened or stat != self._stat:
+                self._index = SimilarityIndex.open(self._file_path) if stat else None
+                self._stat = stat
+                self._opened = True
+            return self._index
+
+
+def main():
+    """コマンドライン実行
+
+    全単語の日本語から類似語インデックスを作成してファイルに出力する
+    """
+    parser = argparse.ArgumentParser(description='類似語インデックス作成')
+    parser.add_argument('--output', default=DEFAULT_PATH, help='出力ファイル')
+    parser.add_argument('--tables', type=int, default=TABLES, help='配列数')
+    args = parser.parse_args()
+
+    import logconfig
+    from dbaccess import Word
+    logconfig.load()
+    db_word = Word()
+    count = build(
+        (japanese for japanese, in db_word.stream_table(['japanese'])), args.output, args.tables)
+    print(f'{count}件のインデックスを作成しました: {args.output}')
+
+
+if __name__ == '__main__':
+    main()
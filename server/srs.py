@@ -0,0 +1,114 @@
+"""間隔反復スケジューラ
+
+SM-2を元に単語ごとの復習間隔(日)、易しさ係数、連続正解数から次回の出題日時を決める
+学習画面の回答は正解、不正解の2値のため、それぞれ固定の回答品質として扱う
+"""
+from datetime import timedelta
+from math import ceil
+from typing import NamedTuple
+
+
+# 易しさ係数の初期値、最小値
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+
+# 1回目、2回目の正解後の復習間隔(日)
+FIRST_INTERVAL = 1
+SECOND_INTERVAL = 6
+
+# 回答品質(0〜5、PASSING_QUALITY以上を正解とする)
+PASSING_QUALITY = 3
+QUALITY_CORRECT = 4
+QUALITY_INCORRECT = 1
+
+# 1日
+_DAY = timedelta(days=1)
+
+
+class Card(NamedTuple):
+    """ 単語の復習状態 """
+    interval: int = 0
+    ease: float = INITIAL_EASE
+    repetitions: int = 0
+    due_at: object = None
+
+
+def quality_from_flag(flag):
+    """is_correctフラグを回答品質に変換
+
+    @param flag 論理値
+    @return 回答品質
+    """
+    return QUALITY_CORRECT if flag else QUALITY_INCORRECT
+
+
+def ease_delta(quality):
+    """易しさ係数の変化量
+
+    @param quality 回答品質
+    @return 変化量
+    """
+    miss = 5 - quality
+    return 0.1 - miss * (0.08 + miss * 0.02)
+
+
+# 回答品質ごとの易しさ係数の変化量
+_EASE_DELTAS = tuple(ease_delta(quality) for quality in range(6))
+
+
+def next_interval(card, passed):
+    """次回の復習間隔
+
+    不正解なら間隔を0にして即時再出題する
+
+    @param card Card
+    @param passed 論理値(正解ならTrue)
+    @return 復習間隔(日)
+    """
+    if not passed:
+        return 0
+    if card.repetitions == 0:
+        return FIRST_INTERVAL
+    if card.repetitions == 1:
+        return SECOND_INTERVAL
+    return ceil(card.interval * card.ease)
+
+
+def review(card, quality, now):
+    """回答を反映
+
+    @param card Card
+    @param quality 回答品質
+    @param now 回答日時
+    @return 更新後のCard
+    """
+    passed = quality >= PASSING_QUALITY
+    interval = next_interval(card, passed)
+    ease = card.ease + _EASE_DELTAS[quality]
+    return Card(
+        interval,
+        ease if ease > MIN_EASE else MIN_EASE,
+        card.repetitions + 1 if passed else 0,
+        now + _DAY * interval,
+    )
+
+
+def review_assignments(passed):
+    """回答を反映するUPDATE文のSET句
+
+    reviewと同じ計算をSQLで行う(右辺は全て更新前の値を参照する)
+
+    @param passed 論理値、または正解を表すSQLの論理式
+    @return SET句
+    """
+    if isinstance(passed, bool):
+        passed = 'TRUE' if passed else 'FALSE'
+    interval = f'(CASE WHEN NOT ({passed}) THEN 0 '\
+        f'WHEN repetitions = 0 THEN {FIRST_INTERVAL} '\
+        f'WHEN repetitions = 1 THEN {SECOND_INTERVAL} '\
+        'ELSE CEIL(interval_days * ease)::integer END)'
+    return f'interval_days = {interval}, '\
+        f'ease = GREATEST({MIN_EASE!r}, ease + CASE WHEN {passed} '\
+        f'THEN {ease_delta(QUALITY_CORRECT)!r} ELSE {ease_delta(QUALITY_INCORRECT)!r} END), '\
+        f'repetitions = CASE WHEN {passed} THEN repetitions + 1 ELSE 0 END, '\
+        f'due_at = now() + make_interval(days => {interval})'
@@ -0,0 +1,235 @@
+"""pytest
+
+activity_queue.py
+"""
+from datetime import date
+import os
+import pytest
+import sys
+import threading
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from server import activity_queue
+from server.dbaccess import DbOperationError
+
+
+class MockWriter(object):
+    """ 書き込みオブジェクト """
+    batches = []
+    fail = False
+
+    def insert_many(self, rows):
+        if MockWriter.fail:
+            raise DbOperationError('error')
+        MockWriter.batches.append(list(rows))
+
+
+@pytest.fixture(autouse=True)
+def reset_writer():
+    MockWriter.batches = []
+    MockWriter.fail = False
+
+
+def test_activity_queue_001():
+    """アクティビティ書き込みキュー
+    エラーケース
+
+    in:
+      mode='unknown'
+    expect:
+      ValueError
+    """
+    with pytest.raises(ValueError):
+        activity_queue.ActivityQueue(mode='unknown')
+
+
+def test_put_001():
+    """アクティビティ追加(batched)
+    正常ケース
+
+    in:
+      5スレッドから同時に1件ずつ、max_batch=3
+    expect:
+      呼び出しから戻った時点で書き込み済み、1回の書き込みは3件以下
+    """
+    inst = activity_queue.ActivityQueue(
+        mode='batched', max_batch=3, max_delay=0.05, writer_factory=MockWriter)
+    threads = [
+        threading.Thread(target=inst.put, args=(date.today(), '0', f'detail{i}'))
+        for i in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    rows = [row for batch in MockWriter.batches for row in batch]
+    assert sorted(detail for _, _, detail in rows) == [f'detail{i}' for i in range(5)]
+    assert all(len(batch) <= 3 for batch in MockWriter.batches)
+    inst.close()
+
+
+def test_put_002():
+    """アクティビティ追加(batched)
+    エラーケース
+
+    in:
+      書き込みエラー
+    expect:
+      DbOperationError
+    """
+    MockWriter.fail = True
+    inst = activity_queue.ActivityQueue(mode='batched', writer_factory=MockWriter)
+
+    with pytest.raises(DbOperationError):
+        inst.put(date.today(), '0', 'detail')
+    inst.close()
+
+
+def test_put_003():
+    """アクティビティ追加(sync)
+    エラーケース
+
+    in:
+      mode='sync'
+    expect:
+      RuntimeError(キューを使わない)
+    """
+    inst = activity_queue.ActivityQueue(mode='sync', writer_factory=MockWriter)
+
+    with pytest.raises(RuntimeError):
+        inst.put(date.today(), '0', 'detail')
+    assert MockWriter.batches == []
+
+
+def test_close_001():
+    """残りを書き込んで書き込みスレッドを終了(fire_and_forget)
+    正常ケース
+
+    in:
+      100件追加直後にclose
+    expect:
+      100件全て書き込み済み、以降の追加はDbOperationError
+    """
+    inst = activity_queue.ActivityQueue(
+        mode='fire_and_forget', max_batch=50, max_delay=1, writer_factory=MockWriter)
+    for i in range(100):
+        inst.put(date.today(), '0', f'detail{i}')
+    inst.close()
+
+    assert sum(len(batch) for batch in MockWriter.batches) == 100
+    with pytest.raises(DbOperationError):
+        inst.put(date.today(), '0', 'detail')
+
+
+def test_flush_001():
+    """キューに積んだ全件の書き込みが終わるまで待つ
+    正常ケース
+
+    in:
+      10件追加
+    expect:
+      flush後に10件書き込み済み
+    """
+    inst = activity_queue.ActivityQueue(
+        mode='fire_and_forget', max_delay=0.01, writer_factory=MockWriter)
+    for i in range(10):
+        inst.put(date.today(), '0', f'detail{i}')
+
+    assert inst.flush(timeout=5)
+    assert sum(len(batch) for batch in MockWriter.batches) == 10
+    inst.close()
+
+
+class BlockingWriter(object):
+    """ 書き込みが止まっている書き込みオブジェクト """
+    started = threading.Event()
+    release = threading.Event()
+
+    def insert_many(self, rows):
+        BlockingWriter.started.set()
+        BlockingWriter.release.wait(5)
+
+
+def test_put_005():
+    """アクティビティ追加(batched)
+    エラーケース
+
+    in:
+      書き込みが止まっている
+    expect:
+      timeout秒でDbOperationError
+    """
+    BlockingWriter.release.clear()
+    inst = activity_queue.ActivityQueue(
+        mode='batched', max_delay=0, writer_factory=BlockingWriter, timeout=0.05)
+    try:
+        with pytest.raises(DbOperationError):
+            inst.put(date.today(), '0', 'detail')
+    finally:
+        BlockingWriter.release.set()
+        inst.close()
+
+
+def test_close_002():
+    """書き込みスレッドを終了(fire_and_forget)
+    エラーケース
+
+    in:
+      書き込みが止まり、キューが満杯
+    expect:
+      timeout秒で戻る
+    """
+    BlockingWriter.started.clear()
+    BlockingWriter.release.clear()
+    inst = activity_queue.ActivityQueue(
+        mode='fire_and_forget', max_batch=1, max_delay=0, max_size=1,
+        writer_factory=BlockingWriter, timeout=0.05)
+    try:
+        inst.put(date.today(), '0', 'writing')
+        assert BlockingWriter.started.wait(5)
+        inst.put(date.today(), '0', 'queued')
+        with pytest.raises(DbOperationError):
+            inst.put(date.today(), '0', 'full')
+        start = time.monotonic()
+        inst.close(timeout=0.1)
+        assert time.monotonic() - start < 1
+    finally:
+        BlockingWriter.release.set()
+
+
+def test_close_003():
+    """書き込みスレッドを終了(fire_and_forget)
+    正常ケース
+
+    in:
+      キューが空くのを待っている呼び出し元がいる
+    expect:
+      呼び出し元の待機中もcloseは止まらずtimeout秒で戻る
+    """
+    BlockingWriter.started.clear()
+    BlockingWriter.release.clear()
+    inst = activity_queue.ActivityQueue(
+        mode='fire_and_forget', max_batch=1, max_delay=0, max_size=1,
+        writer_factory=BlockingWriter, timeout=2)
+
+    def _put():
+        try:
+            inst.put(date.today(), '0', 'waiting')
+        except DbOperationError:
+            pass
+
+    try:
+        inst.put(date.today(), '0', 'writing')
+        assert BlockingWriter.started.wait(5)
+        inst.put(date.today(), '0', 'queued')
+        producer = threading.Thread(target=_put)
+        producer.start()
+        time.sleep(0.05)
+        start = time.monotonic()
+        inst.close(timeout=0.1)
+        assert time.monotonic() - start < 1
+    finally:
+        BlockingWriter.release.set()
+    producer.join()
@@ -11,6 +11,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from server import api
 from server import dbaccess
+from server import srs
 from server import util
 
 
@@ -402,6 +403,61 @@ class TestValidate(object):
         with pytest.raises(ValueError):
             self.inst.validate_english()
 
+    def test_validate_batch_001(self):
+        """一括更新バリデーション
+        正常ケース
+
+        in:
+          is_correct、bookmark、register、delete、不正な操作
+        expect:
+          バリデート済みデータ、不正な操作はValueError
+        """
+        self.inst = api.Validate(json.dumps([
+            {'op': 'is_correct', 'pkey': '1', 'flag': 'TRUE'},
+            {'op': 'bookmark', 'pkey': 2, 'flag': 'FALSE'},
+            {'op': 'register', 'eng_val': 'english', 'jap_val': '日本語'},
+            {'op': 'delete', 'pkey': '3'},
+            {'op': 'delete', 'pkey': 'x'},
+            {'op': 'unknown'},
+            'str',
+        ]))
+
+        result = self.inst.validate_batch()
+        assert result[:4] == [
+            {'op': 'is_correct', 'pkey': 1, 'flag': 'TRUE'},
+            {'op': 'bookmark', 'pkey': 2, 'flag': 'FALSE'},
+            {'op': 'register', 'eng_val': 'english', 'jap_val': '日本語'},
+            {'op': 'delete', 'pkey': 3},
+        ]
+        assert all(isinstance(item, ValueError) for item in result[4:])
+
+    @pytest.mark.parametrize('input', [
+        ('{"op": "delete", "pkey": "1"}'),
+        ('[]'),
+        (json.dumps([{'op': 'delete', 'pkey': 1}] * (api.BATCH_MAX_OPERATIONS + 1))),
+    ])
+    def test_validate_batch_002(self, input):
+        """一括更新バリデーション
+        エラーケース
+
+        in:
+          '{"op": "delete", "pkey": "1"}'
+        expect:
+          ValueError
+        in:
+          '[]'
+        expect:
+          ValueError
+        in:
+          上限を超える操作数
+        expect:
+          ValueError
+        """
+        self.inst = api.Validate(input)
+
+        with pytest.raises(ValueError):
+            self.inst.validate_batch()
+
 
 class TestDashboardView(object):
     """ ダッシュボード画面 """
@@ -457,7 +513,7 @@ class TestDashboardView(object):
         def mock_select_activity_order_by_desc_limit_5():
             return expect_select_activity_order_by_desc_limit_5
 
-        def mock_select_count_learning_date():
+        def mock_select_count_learning_date(days):
             return expect_select_count_learning_date
 
         monkeypatch.setattr(self.inst, '_count_num', mock_count_num)
@@ -689,6 +745,40 @@ class TestDashboardView(object):
             },
         ]
 
+    @pytest.mark.parametrize('query, expect', [
+        ('', 7),
+        ('days=365', 365),
+    ])
+    def test_validate_001(self, monkeypatch, query, expect):
+        """クエリバリデーション
+        正常ケース
+
+        in:
+          daysなし、days=365
+        expect:
+          既定の日数、指定した日数
+        """
+        monkeypatch.setattr(api, 'Word', lambda: None)
+        monkeypatch.setattr(api, 'Activity', lambda: None)
+        inst = api.DashboardView({'QUERY_STRING': query})
+        assert inst._validate() == expect
+
+    @pytest.mark.parametrize('query', ['days=8', 'days=abc'])
+    def test_validate_002(self, monkeypatch, query):
+        """クエリバリデーション
+        異常ケース
+
+        in:
+          指定できない日数、数値以外
+        expect:
+          ValueError
+        """
+        monkeypatch.setattr(api, 'Word', lambda: None)
+        monkeypatch.setattr(api, 'Activity', lambda: None)
+        inst = api.DashboardView({'QUERY_STRING': query})
+        with pytest.raises(ValueError):
+            inst._validate()
+
 
 class TestLearningView(object):
     """ 学習画面 """
@@ -1250,6 +1340,34 @@ class TestActivityView(object):
         ]
 
 
+class FlagWord(object):
+    """ フラグ更新を記録するWord """
+    def __init__(self):
+        self.calls = []
+
+    def update_is_correct_flag(self, pkey, flag, assignments=None):
+        self.calls.append(('update_is_correct_flag', pkey, flag, assignments))
+        return 'english'
+
+    def update_flag_with_activity(self, column, pkey, flag, activity, assignments=None):
+        self.calls.append(
+            ('update_flag_with_activity', column, pkey, flag, activity, assignments))
+        return 'english'
+
+
+class RecordingQueue(object):
+    """ 追加したアクティビティを記録する書き込みキュー """
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.rows = []
+
+    def put(self, date, type_id, detail):
+        self.rows.append((date, type_id, detail))
+
+    def put_many(self, rows):
+        self.rows.extend(rows)
+
+
 class TestUpdateIsCorrectFlagView(object):
     """ is_correctフラグ更新 """
     def setup(self):
@@ -1279,25 +1397,47 @@ class TestUpdateIsCorrectFlagView(object):
         return self.inst._validate() == {'pkey': 1, 'flag': 'TRUE'}
 
     def test_update_is_correct_flag_001(self, monkeypatch):
-        """is_correctフラグ更新
+        """is_correctフラグ更新(書き込みキュー無効)
         正常ケース
 
         in:
           {'pkey': 1, 'flag': 'TRUE'}
         expect:
-          'englishを習得しました'
+          フラグ、復習状態の更新とアクティビティ登録を1文で実行し、'englishを習得しました'
         """
-        expect_update_is_correct_flag = 'english'
-        def mock_update_is_correct_flag(self, pkey, flag):
-            return expect_update_is_correct_flag
+        monkeypatch.setattr(api, 'Word', FlagWord)
+        monkeypatch.setattr(api, 'ACTIVITY_QUEUE', RecordingQueue(enabled=False))
+        inst = api.UpdateIsCorrectFlagView('{"pkey": "1", "flag": "TRUE"}')
+
+        assert inst._update_is_correct_flag({'pkey': 1, 'flag': 'TRUE'}) == 'englishを習得しました'
+        assert inst._db_word.calls == [(
+            'update_flag_with_activity', 'is_correct', 1, 'TRUE',
+            (api.CLOCK.today(), api.Activity.TYPE[0][0], '', 'を習得しました'),
+            srs.review_assignments(True),
+        )]
+        assert api.ACTIVITY_QUEUE.rows == []
+
+    def test_update_is_correct_flag_002(self, monkeypatch):
+        """is_correctフラグ更新(書き込みキュー有効)
+        正常ケース
 
-        monkeypatch.setattr(
-            dbaccess.Word,
-            'update_is_correct_flag',
-            mock_update_is_correct_flag
-        )
-        assert self.inst._update_is_correct_flag({'pkey': 1, 'flag': 'TRUE'}) ==\
-            f'{expect_update_is_correct_flag}を習得しました'
+        in:
+          {'pkey': 1, 'flag': 'FALSE'}
+        expect:
+          フラグ、復習状態を更新してアクティビティはキューに積み、'englishを未習得に変更しました'
+        """
+        monkeypatch.setattr(api, 'Word', FlagWord)
+        monkeypatch.setattr(api, 'ACTIVITY_QUEUE', RecordingQueue(enabled=True))
+        inst = api.UpdateIsCorrectFlagView('{"pkey": "1", "flag": "FALSE"}')
+
+        assert inst._update_is_correct_flag({'pkey': 1, 'flag': 'FALSE'}) ==\
+            'englishを未習得に変更しました'
+        assert inst._db_word.calls == [
+            ('update_is_correct_flag', 1, 'FALSE', srs.review_assignments(False)),
+        ]
+        assert api.ACTIVITY_QUEUE.rows == [
+            (api.CLOCK.today(), api.Activity.TYPE[0][0], 'englishを未習得に変更しました'),
+        ]
 
     @pytest.mark.parametrize('input_01, input_02, expect', [
         ('english', 'TRUE', 'englishを習得しました'),
@@ -1502,3 +1642,216 @@ class TestDeleteView(object):
         """
         assert self.inst._register_activity('english') ==\
             'englishを削除しました'
+
+
+class BatchConnection(object):
+    """ トランザクションを記録する接続 """
+    def __init__(self, calls):
+        self.calls = calls
+
+    def commit(self):
+        self.calls.append('commit')
+
+    def rollback(self):
+        self.calls.append('rollback')
+
+
+class BatchWord(object):
+    """ 一括操作を記録するWord """
+    calls = []
+
+    def __init__(self):
+        self.conn = BatchConnection(BatchWord.calls)
+        self.autocommit = True
+
+    def insert_many(self, rows):
+        BatchWord.calls.append(('insert_many', rows))
+
+    def update_flags(self, column, rows, assignments=None):
+        BatchWord.calls.append(('update_flags', column, rows))
+        return {pkey: f'word{pkey}' for pkey, _ in rows}
+
+    def delete_many(self, pkeys):
+        BatchWord.calls.append(('delete_many', pkeys))
+        return {pkey: f'word{pkey}' for pkey in pkeys}
+
+
+class BatchActivity(object):
+    """ 一括登録を記録するActivity """
+    TYPE = dbaccess.Activity.TYPE
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.autocommit = True
+
+    def insert_many(self, rows):
+        BatchWord.calls.append(('activity', len(rows)))
+
+
+class RecordingCache(object):
+    """ 反映した操作を記録するキャッシュ """
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, *args))
+
+
+class TestBatchView(object):
+    """ 一括更新 """
+    BODY = json.dumps([
+        {'op': 'delete', 'pkey': 1},
+        {'op': 'register', 'eng_val': 'word1', 'jap_val': '単語'},
+        {'op': 'is_correct', 'pkey': 2, 'flag': 'TRUE'},
+        {'op': 'is_correct', 'pkey': 3, 'flag': 'FALSE'},
+        {'op': 'delete', 'pkey': 2},
+    ])
+
+    def _view(self, monkeypatch, queue):
+        BatchWord.calls = []
+        monkeypatch.setattr(api, 'Word', BatchWord)
+        monkeypatch.setattr(api, 'Activity', BatchActivity)
+        monkeypatch.setattr(api, 'ACTIVITY_QUEUE', queue)
+        monkeypatch.setattr(api, 'QUIZ_DECKS', RecordingCache())
+        monkeypatch.setattr(api, 'AUTOCOMPLETE', RecordingCache())
+        return api.BatchView(self.BODY)
+
+    def test_apply_001(self, monkeypatch):
+        """一括更新(書き込みキュー無効)
+        正常ケース
+
+        in:
+          削除、登録、is_correct2件、削除
+        expect:
+          リクエストの順に連続する同じ操作をまとめて適用し、アクティビティは同じトランザクションで登録
+        """
+        inst = self._view(monkeypatch, RecordingQueue(enabled=False))
+        results = inst._apply(inst._validate())
+
+        assert [result['ok'] for result in results] == [True] * 5
+        assert BatchWord.calls == [
+            ('delete_many', [1]),
+            ('insert_many', [('word1', '単語')]),
+            ('update_flags', 'is_correct', [(2, 'TRUE'), (3, 'FALSE')]),
+            ('delete_many', [2]),
+            ('activity', 5),
+            'commit',
+        ]
+        assert api.AUTOCOMPLETE.calls == [
+            ('discard', 'word1'), ('add', 'word1'), ('discard', 'word2'),
+        ]
+
+    def test_apply_002(self, monkeypatch):
+        """一括更新(書き込みキュー有効)
+        正常ケース
+
+        in:
+          削除、登録、is_correct2件、削除
+        expect:
+          コミット後にアクティビティを書き込みキューに積む
+        """
+        inst = self._view(monkeypatch, RecordingQueue(enabled=True))
+        inst._apply(inst._validate())
+
+        assert ('activity', 5) not in BatchWord.calls
+        assert [detail for _, _, detail in api.ACTIVITY_QUEUE.rows] == [
+            'word1を削除しました', '英語: word1 日本語: 単語 を登録しました', 'word2を習得しました',
+            'word3を未習得に変更しました', 'word2を削除しました',
+        ]
+
+
+class ImportWord(BatchWord):
+    """ 取り込みを記録するWord """
+    def import_rows(self, rows):
+        rows = list(rows)
+        BatchWord.calls.append(('import_rows', rows))
+        return len(rows)
+
+
+class ImportActivity(BatchActivity):
+    """ 登録を記録するActivity """
+    def insert(self, date, type_id, detail):
+        BatchWord.calls.append(('activity', detail))
+
+
+class TestImportView(object):
+    """ 単語一括取り込み """
+    @pytest.mark.parametrize('rows, expect', [
+        ([], ['commit']),
+        ([('apple', 'りんご')], [
+            ('import_rows', [('apple', 'りんご')]), ('activity', '1件の単語を一括登録しました'),
+            'commit', ('invalidate',),
+        ]),
+    ])
+    def test_import_001(self, monkeypatch, rows, expect):
+        """一括取り込み
+        正常ケース
+
+        in:
+          0件、1件
+        expect:
+          0件ならアクティビティ登録、入力補完の読み込み直しを行わない
+        """
+        BatchWord.calls = []
+        autocomplete = RecordingCache()
+        autocomplete.calls = BatchWord.calls
+        monkeypatch.setattr(api, 'Word', ImportWord)
+        monkeypatch.setattr(api, 'Activity', ImportActivity)
+        monkeypatch.setattr(api, 'AUTOCOMPLETE', autocomplete)
+        inst = api.ImportView({'REQUEST_METHOD': 'POST'})
+
+        assert inst._import(iter(rows)) == len(rows)
+        assert [call for call in BatchWord.calls if call != ('import_rows', [])] == expect
+
+
+class ExportConnection(object):
+    """ 閉じたことを記録する接続 """
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ExportWord(object):
+    """ 行を返却するWord """
+    table = 'word'
+
+    def __init__(self):
+        self.conn = ExportConnection()
+        self.rows = None
+
+    def stream_table(self, columns):
+        def _rows():
+            yield (1, 'apple', 'りんご', False, False, 0, 2.5, 0, None)
+        self.rows = _rows()
+        return self.rows
+
+
+class TestExportView(object):
+    """ エクスポート """
+    @pytest.mark.parametrize('consume', [False, True])
+    def test_view_001(self, monkeypatch, consume):
+        """レスポンス
+        正常ケース
+
+        in:
+          反復前にclose(HEADリクエスト、切断)、最後まで反復
+        expect:
+          いずれもカーソル、接続を閉じる
+        """
+        tables = []
+
+        class RecordingWord(ExportWord):
+            def __init__(self):
+                super().__init__()
+                tables.append(self)
+
+        monkeypatch.setattr(api.WordExportView, 'TABLE', RecordingWord)
+        body = api.WordExportView({'QUERY_STRING': 'format=jsonl'}).view().body
+        if consume:
+            assert b'apple' in b''.join(body)
+        body.close()
+
+        assert tables[0].conn.closed
+        assert tables[0].rows.gi_frame is None
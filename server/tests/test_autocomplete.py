@@ -0,0 +1,86 @@
+"""pytest
+
+autocomplete.py
+"""
+import os
+import pytest
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from server import autocomplete
+
+
+WORDS = ['apple', 'Application', 'apply', 'banana', 'band', 'app', 'ápice']
+
+
+@pytest.fixture
+def index():
+    return autocomplete.PrefixIndex(lambda: list(WORDS))
+
+
+def test_complete_001(index):
+    """入力補完
+    正常ケース
+
+    in:
+      大文字を含む入力、最大件数
+    expect:
+      大文字小文字を区別せずキーの昇順に最大件数まで、元の表記で返却
+    """
+    assert index.complete('APP', 3) == ['app', 'apple', 'Application']
+    assert index.complete('ban') == ['banana', 'band']
+    assert index.complete('á') == ['ápice']
+    assert index.complete('z') == []
+
+
+def test_add_001(index):
+    """登録を反映
+    正常ケース
+
+    in:
+      読み込み後に登録、削除
+    expect:
+      差分を合わせた結果を返却
+    """
+    index.complete('a')
+    index.add('appeal')
+    index.add('apple')
+    index.discard('apply')
+    index.discard('appeal')
+    index.add('apricot')
+
+    assert index.complete('ap', 10) == ['app', 'apple', 'Application', 'apricot']
+
+
+def test_add_002(index):
+    """登録を反映
+    正常ケース
+
+    in:
+      読み込み前に登録
+    expect:
+      無視して読み込み時の内容を返却
+    """
+    index.add('appeal')
+
+    assert index.complete('appe') == []
+
+
+def test_compact_001(index, monkeypatch):
+    """差分が多ければ配列を作り直す
+    正常ケース
+
+    in:
+      COMPACT_THRESHOLDを超える差分
+    expect:
+      差分を配列に取り込み、結果は変わらない
+    """
+    monkeypatch.setattr(autocomplete, 'COMPACT_THRESHOLD', 2)
+    index.complete('a')
+    index.add('apricot')
+    index.discard('banana')
+    index.add('bandage')
+
+    assert index.memory_usage()['entries'] == len(WORDS) + 1
+    assert index.complete('ap', 10) == ['app', 'apple', 'Application', 'apply', 'apricot']
+    assert index.complete('ban', 10) == ['band', 'bandage']
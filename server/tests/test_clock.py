@@ -0,0 +1,57 @@
+"""pytest
+
+clock.py
+"""
+from datetime import date, datetime, timedelta, timezone
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from server import clock
+
+
+JST = timezone(timedelta(hours=9))
+
+
+class FakeTime:
+    """ 現在時刻 """
+    def __init__(self, value):
+        self.value = value
+
+    def __call__(self):
+        return self.value
+
+
+def _clock(when):
+    now = FakeTime(when.timestamp())
+    return clock.Clock(JST, now), now
+
+
+def test_today_001():
+    """現在の日付
+    正常ケース
+
+    in:
+      タイムゾーン(UTC+9)の0時の前後
+    expect:
+      UTCではなく指定したタイムゾーンの0時に日付が切り替わる
+    """
+    inst, now = _clock(datetime(2024, 3, 31, 23, 59, 59, tzinfo=JST))
+    assert inst.today() == date(2024, 3, 31)
+    now.value += 1
+    assert inst.today() == date(2024, 4, 1)
+
+
+def test_window_001():
+    """集計期間
+    正常ケース
+
+    in:
+      7日、翌日
+    expect:
+      7日前から今日まで、日付が変わったらずれる
+    """
+    inst, now = _clock(datetime(2024, 1, 1, 12, tzinfo=JST))
+    assert inst.window(7) == (date(2023, 12, 25), date(2024, 1, 1))
+    now.value += 86400
+    assert inst.window(7) == (date(2023, 12, 26), date(2024, 1, 2))
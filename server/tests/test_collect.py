@@ -0,0 +1,360 @@
+"""pytest
+
+collect.py
+"""
+import json
+import os
+import pytest
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import collect
+
+
+class MockResponse(object):
+    """ Responseオブジェクト """
+    def __init__(self, content, status_code=200):
+        self.content = content
+        self.status_code = status_code
+        self.encoding = 'UTF-8'
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise collect.requests.HTTPError(self.status_code)
+
+
+def test_get_urls_001(tmp_path):
+    """スクレイピング対象URLを取得
+    正常ケース
+
+    in:
+      'http://a\\n\\nhttp://b\\n'
+    expect:
+      ['http://a', 'http://b']
+    """
+    target = tmp_path / 'target.txt'
+    target.write_text('http://a\n\nhttp://b\n')
+    assert collect._get_urls(str(target)) == ['http://a', 'http://b']
+
+
+def test_get_urls_002(tmp_path):
+    """スクレイピング対象URLを取得
+    エラーケース
+
+    in:
+      存在しないファイル
+    expect:
+      CollectError
+    """
+    with pytest.raises(collect.CollectError):
+        collect._get_urls(str(tmp_path / 'missing.txt'))
+
+
+def test_checkpoint_001(tmp_path):
+    """チェックポイントジャーナル
+    正常ケース
+
+    in:
+      1バッチ目にhttp://aを記録
+    expect:
+      再読み込み後にhttp://aがスキップされる
+    """
+    journal = str(tmp_path / 'journal.jsonl')
+    collect.Checkpoint(journal).commit(['http://a'], 3)
+
+    inst = collect.Checkpoint(journal)
+    assert inst.batch == 1
+    assert inst.is_completed('http://a')
+    assert inst.pending(['http://a', 'http://b', 'http://b']) == ['http://b']
+
+
+def test_checkpoint_002(tmp_path):
+    """チェックポイントジャーナル
+    正常ケース
+
+    in:
+      書き込み途中で中断された行
+    expect:
+      完了したバッチのみ読み込む
+    """
+    journal = tmp_path / 'journal.jsonl'
+    journal.write_text('{"batch": 1, "urls": ["http://a"], "words": 1}\n{"batch": 2, "ur')
+
+    inst = collect.Checkpoint(str(journal))
+    assert inst.batch == 1
+    assert inst.pending(['http://a', 'http://b']) == ['http://b']
+
+
+@pytest.mark.parametrize('input, expect', [
+    (
+        '<p class="eng">a</p><p class="jap">A</p><p class="eng">b</p><p class="jap">B</p>',
+        ([('a', 'A'), ('b', 'B')], 0)
+    ),
+    (
+        '<p class="eng">a</p><p class="eng">b</p><p class="jap">B</p><p class="jap">C</p>',
+        ([('b', 'B')], 2)
+    ),
+    (
+        '<p class="jap">A</p><p class="eng">b</p>',
+        ([], 2)
+    ),
+])
+def test_pair_elements_001(input, expect):
+    """英語、日本語要素を文書順に対応付け
+    正常ケース
+
+    in:
+      英語、日本語が交互に並ぶ
+    expect:
+      全て対になる
+    in:
+      英語、日本語がそれぞれ1件欠ける
+    expect:
+      欠けた要素の前後のみ破棄し、以降の対はずれない
+    in:
+      日本語が先頭、英語が末尾
+    expect:
+      どちらも破棄
+    """
+    bs_obj = collect.BeautifulSoup(input, 'lxml')
+    assert collect.pair_elements(
+        bs_obj.find_all(class_=['eng', 'jap']),
+        lambda element: 'eng' in element['class']
+    ) == expect
+
+
+def test_source_001():
+    """スクレイピング対象サイト定義
+    正常ケース
+
+    in:
+      独自セレクタ、正規化ルール
+    expect:
+      英語以外を除外し正規化した対
+    """
+    inst = collect.Source(
+        'example', [r'^https://example\.com/'], 'dt', 'dd',
+        normalize={'english': ['collapse_space', 'lower'], 'japanese': ['strip']})
+    bs_obj = collect.BeautifulSoup(
+        '<dl><dt> Good  Morning </dt><dd> おはよう </dd><dt>123</dt><dd>数字</dd></dl>', 'lxml')
+
+    assert inst.matches('https://example.com/words')
+    assert not inst.matches('https://example.org/words')
+    assert inst.extract(bs_obj) == ([('good morning', 'おはよう')], 0)
+
+
+@pytest.mark.parametrize('input', [
+    ({'name': 'bad', 'url_patterns': ['('], 'english': '.eng', 'japanese': '.jap'}),
+    ({'name': 'bad', 'url_patterns': ['.*'], 'english': '..eng', 'japanese': '.jap'}),
+    ({'name': 'bad', 'url_patterns': ['.*'], 'english': '.eng', 'japanese': '.jap',
+      'normalize': {'english': ['unknown']}}),
+])
+def test_source_002(input):
+    """スクレイピング対象サイト定義
+    エラーケース
+
+    in:
+      不正な正規表現、セレクタ、正規化ルール
+    expect:
+      CollectError
+    """
+    with pytest.raises(collect.CollectError):
+        collect.Source(**input)
+
+
+def test_load_sources_001(tmp_path):
+    """サイト定義読み込み
+    正常ケース
+
+    in:
+      存在しないファイル
+    expect:
+      既定のサイト定義
+    """
+    sources = collect.load_sources(str(tmp_path / 'missing.json'))
+    assert [source.name for source in sources] == ['default']
+
+
+def test_word_set_001():
+    """重複判定用の英単語集合
+    正常ケース
+
+    in:
+      [('a', 'A'), ('b', 'B'), ('a', 'C')]
+    expect:
+      [('a', 'A'), ('b', 'B')]、重複数1
+    """
+    inst = collect.WordSet()
+    assert inst.unique([('a', 'A'), ('b', 'B'), ('a', 'C')]) == [('a', 'A'), ('b', 'B')]
+    assert inst.collisions == 1
+
+
+def test_collect_001(tmp_path, monkeypatch):
+    """スクレイピング
+    正常ケース(dry-run)
+
+    in:
+      処理済み1件、成功1件、失敗1件
+    expect:
+      DB、ジャーナルに書き込まず件数のみ返却
+    """
+    markup = b'<p class="eng">apple</p><p class="jap">\xe3\x82\x8a\xe3\x82\x93\xe3\x81\x94</p>'
+    responses = {
+        'http://b': MockResponse(markup),
+        'http://c': MockResponse(b'', 404),
+    }
+    monkeypatch.setattr(
+        collect, '_request', lambda urls, scheduler: [responses[url] for url, _ in urls])
+
+    journal = str(tmp_path / 'journal.jsonl')
+    checkpoint = collect.Checkpoint(journal)
+    checkpoint.commit(['http://a'], 0)
+
+    sources = collect.load_sources(str(tmp_path / 'missing.json'))
+    inst = collect.Collector(
+        ['http://a', 'http://b', 'http://c'], checkpoint, sources,
+        dry_run=True, fetch_in_dry_run=True)
+    report = inst.collect()
+    assert set(report.pop('timings')) == {'fetch', 'parse', 'insert'}
+    assert report == {
+        'skipped': 1, 'unmatched': 0, 'fetched': 1, 'failed': 1, 'disallowed': 0, 'words': 1,
+        'unpaired': 0, 'duplicates': 0, 'batches': 1,
+        'planned': [
+            {'url': 'http://b', 'source': 'default'}, {'url': 'http://c', 'source': 'default'},
+        ],
+    }
+    assert collect.Checkpoint(journal).pending(['http://b']) == ['http://b']
+
+
+def test_collect_002(tmp_path, monkeypatch):
+    """スクレイピング
+    正常ケース(dry-run、取得なし)
+
+    in:
+      処理済み1件、未処理2件
+    expect:
+      取得せずに未処理のURLを取得予定として返却、単語数はNone
+    """
+    def _request(urls, scheduler):
+        raise AssertionError('fetched in dry-run')
+
+    monkeypatch.setattr(collect, '_request', _request)
+    checkpoint = collect.Checkpoint(str(tmp_path / 'journal.jsonl'))
+    checkpoint.commit(['http://a'], 0)
+
+    sources = collect.load_sources(str(tmp_path / 'missing.json'))
+    inst = collect.Collector(
+        ['http://a', 'http://b', 'http://c'], checkpoint, sources, dry_run=True)
+    report = inst.collect()
+    assert report['planned'] == [
+        {'url': 'http://b', 'source': 'default'}, {'url': 'http://c', 'source': 'default'},
+    ]
+    assert report['words'] is None
+    assert report['batches'] == 0
+
+
+def test_collect_003(tmp_path, monkeypatch):
+    """スクレイピング
+    正常ケース
+
+    in:
+      robots.txtにより除外1件、成功1件
+    expect:
+      除外は失敗とは別に数え、処理済みとしてジャーナルに記録
+    """
+    markup = b'<p class="eng">apple</p><p class="jap">\xe3\x82\x8a\xe3\x82\x93\xe3\x81\x94</p>'
+    responses = {
+        'http://a/robots.txt': MockResponse(b'User-agent: *\nDisallow: /private\n'),
+        'http://a/words': MockResponse(markup),
+    }
+    monkeypatch.setattr(collect, 'Word', lambda: None)
+    monkeypatch.setattr(collect.Collector, 'insert_db', lambda self, pairs: len(pairs))
+
+    journal = str(tmp_path / 'journal.jsonl')
+    sources = collect.load_sources(str(tmp_path / 'missing.json'))
+    scheduler = collect.CrawlScheduler(responses.get, rate=None)
+    inst = collect.Collector(
+        ['http://a/private', 'http://a/words'], collect.Checkpoint(journal), sources, scheduler)
+    report = inst.collect()
+
+    assert (report['fetched'], report['failed'], report['disallowed']) == (1, 0, 1)
+    assert collect.Checkpoint(journal).pending(['http://a/private', 'http://a/words']) == []
+
+
+def test_main_001(tmp_path):
+    """コマンドライン実行
+    正常ケース(再生、dry-run)
+
+    in:
+      robots.txtを含まないアーカイブ
+    expect:
+      robots.txtで除外せずに再生し、書き込み予定の単語数を返却
+    """
+    target = tmp_path / 'target.txt'
+    target.write_text('http://a/words\n')
+    archive = str(tmp_path / 'corpus.zip')
+    markup = b'<p class="eng">apple</p><p class="jap">\xe3\x82\x8a\xe3\x82\x93\xe3\x81\x94</p>'
+    with collect.CorpusWriter(archive) as writer:
+        writer.record('http://a/words', MockResponse(markup))
+
+    report = collect.main([
+        '--target', str(target), '--sources', str(tmp_path / 'missing.json'),
+        '--replay', archive, '--dry-run',
+    ])
+    assert report['fetched'] == 1
+    assert report['words'] == 1
+
+
+@pytest.mark.parametrize('options, exits', [
+    ([], True),
+    (['--dry-run'], False),
+])
+def test_main_002(tmp_path, options, exits):
+    """コマンドライン実行
+    異常ケース(ジャーナルの続きから記録)、正常ケース(記録、dry-run)
+
+    in:
+      ジャーナル、既存のアーカイブ、--record
+    expect:
+      --restartなしは終了、dry-runは取得しない、いずれも既存のアーカイブを上書きしない
+    """
+    target = tmp_path / 'target.txt'
+    target.write_text('http://a/words\nhttp://a/next\n')
+    journal = tmp_path / 'checkpoint.jsonl'
+    journal.write_text(json.dumps({'batch': 1, 'urls': ['http://a/words']}) + '\n')
+    archive = tmp_path / 'corpus.zip'
+    with collect.CorpusWriter(str(archive)) as writer:
+        writer.record('http://a/words', MockResponse(b'<p></p>'))
+    recorded = archive.read_bytes()
+
+    argv = [
+        '--target', str(target), '--sources', str(tmp_path / 'missing.json'),
+        '--checkpoint', str(journal), '--record', str(archive), *options,
+    ]
+    if exits:
+        with pytest.raises(SystemExit):
+            collect.main(argv)
+    else:
+        assert collect.main(argv)['planned'] == [{'url': 'http://a/next', 'source': 'default'}]
+    assert archive.read_bytes() == recorded
+
+
+def test_word_set_002():
+    """重複判定用の英単語集合
+    正常ケース
+
+    in:
+      初期のスロット数を超える英単語(2回ずつ)
+    expect:
+      拡張後も全件を保持し、2回目は全て重複
+    """
+    inst = collect.WordSet()
+    words = [f'word{i}' for i in range(collect.WordSet.INITIAL_SLOTS * 3)]
+    assert all(inst.add(word) for word in words)
+    assert not any(inst.add(word) for word in words)
+    assert len(inst) == len(words)
+    assert inst.collisions == len(words)
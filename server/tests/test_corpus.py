@@ -0,0 +1,71 @@
+"""pytest
+
+corpus.py
+"""
+import os
+import pytest
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import corpus
+
+
+class MockResponse(object):
+    """ Responseオブジェクト """
+    def __init__(self, content, status_code=200, encoding='UTF-8'):
+        self.content = content
+        self.status_code = status_code
+        self.encoding = encoding
+
+
+def test_record_replay_001(tmp_path):
+    """記録、再生
+    正常ケース
+
+    in:
+      200、404、接続エラーのレスポンスを記録
+    expect:
+      同じステータスコード、ボディを再生し、接続エラー、未記録はNone
+    """
+    archive = str(tmp_path / 'corpus.zip')
+    responses = {
+        'http://a': MockResponse('りんご'.encode('UTF-8')),
+        'http://b': MockResponse(b'', 404),
+        'http://c': None,
+    }
+    with corpus.CorpusWriter(archive) as writer:
+        fetch = writer.wrap(responses.get)
+        for url in responses:
+            fetch(url)
+
+    with corpus.CorpusReader(archive) as reader:
+        assert reader.urls == ['http://a', 'http://b', 'http://c']
+        assert reader.fetch('http://a').text == 'りんご'
+        assert reader.fetch('http://a').status_code == 200
+        with pytest.raises(corpus.requests.HTTPError):
+            reader.fetch('http://b').raise_for_status()
+        assert reader.fetch('http://c') is None
+        assert reader.fetch('http://d') is None
+
+
+def test_record_001(tmp_path):
+    """記録
+    正常ケース
+
+    in:
+      同じURLを接続エラー、200、404の順に記録
+    expect:
+      エントリは重複せず、最初に取得できたレスポンスを再生
+    """
+    archive = str(tmp_path / 'corpus.zip')
+    with corpus.CorpusWriter(archive) as writer:
+        writer.record('http://a', None)
+        writer.record('http://a', MockResponse(b'first'))
+        writer.record('http://a', MockResponse(b'second', 404))
+
+    with corpus.zipfile.ZipFile(archive) as archive_file:
+        names = archive_file.namelist()
+    assert len(names) == len(set(names)) == 2
+    with corpus.CorpusReader(archive) as reader:
+        response = reader.fetch('http://a')
+        assert (response.status_code, response.content) == (200, b'first')
@@ -0,0 +1,176 @@
+"""pytest
+
+crawl.py
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import pytest
+import sys
+import threading
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import requests
+
+import crawl
+
+
+class FakeServer(object):
+    """ リクエスト数を記録するローカルサーバ """
+    def __init__(self, robots='', delay=0):
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/robots.txt':
+                    body = robots.encode('UTF-8')
+                else:
+                    with lock:
+                        server.requests.append((time.monotonic(), self.path))
+                        server.in_flight += 1
+                        server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                    time.sleep(delay)
+                    with lock:
+                        server.in_flight -= 1
+                    body = b'ok'
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self._httpd.server_address[1]}'
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def fetch(url):
+    return requests.get(url, timeout=3)
+
+
+@pytest.fixture
+def server():
+    inst = FakeServer(robots='User-agent: *\nDisallow: /private\n')
+    yield inst
+    inst.close()
+
+
+def test_token_bucket_001():
+    """トークンバケット
+    正常ケース
+
+    in:
+      rate=2、capacity=2
+    expect:
+      2件まで即時、3件目は0.5秒待ち、0.5秒後に取得可能
+    """
+    now = [0.0]
+    inst = crawl.TokenBucket(2, 2, clock=lambda: now[0])
+    assert inst.try_acquire() == 0
+    assert inst.try_acquire() == 0
+    assert inst.try_acquire() == pytest.approx(0.5)
+    now[0] = 0.5
+    assert inst.try_acquire() == 0
+
+
+def test_run_001(server):
+    """取得
+    正常ケース
+
+    in:
+      rate=20、burst=2で10件
+    expect:
+      どの0.2秒間も2 + 20 * 0.2件以下
+    """
+    inst = crawl.CrawlScheduler(fetch, rate=20, burst=2, concurrency=4)
+    results = inst.run([f'{server.url}/{i}' for i in range(10)])
+
+    assert all(result.status_code == 200 for result in results)
+    times = [t for t, _ in server.requests]
+    assert len(times) == 10
+    for start in times:
+        assert sum(1 for t in times if start <= t < start + 0.2) <= 2 + 20 * 0.2
+
+
+def test_run_002(server):
+    """取得
+    正常ケース
+
+    in:
+      robots.txtでDisallowされたURL
+    expect:
+      リクエストせずNone
+    """
+    inst = crawl.CrawlScheduler(fetch, rate=100, burst=10)
+    results = inst.run([f'{server.url}/private/1', f'{server.url}/public'])
+
+    assert results[0] is None
+    assert results[1].status_code == 200
+    assert [path for _, path in server.requests] == ['/public']
+    assert inst.stats['disallowed'] == 1
+
+
+def test_run_003(server):
+    """取得
+    正常ケース
+
+    in:
+      concurrency=1、優先度付きURL
+    expect:
+      優先度順にリクエスト
+    """
+    inst = crawl.CrawlScheduler(fetch, rate=1000, burst=10, concurrency=1)
+    inst.run([(f'{server.url}/low', 9), (f'{server.url}/high', 0), (f'{server.url}/mid', 5)])
+
+    assert [path for _, path in server.requests] == ['/high', '/mid', '/low']
+
+
+def test_run_004():
+    """取得
+    正常ケース
+
+    in:
+      concurrency=2、各リクエスト0.05秒
+    expect:
+      同時リクエスト数が2以下
+    """
+    server = FakeServer(delay=0.05)
+    try:
+        inst = crawl.CrawlScheduler(fetch, rate=1000, burst=10, concurrency=2)
+        inst.run([f'{server.url}/{i}' for i in range(8)])
+    finally:
+        server.close()
+
+    assert len(server.requests) == 8
+    assert server.max_in_flight <= 2
+
+
+def test_run_005():
+    """取得
+    異常ケース
+
+    in:
+      1件目で例外を送出する取得関数
+    expect:
+      例外のURLはNoneとして失敗数に数え、他のURLは取得する
+    """
+    def raising_fetch(url):
+        if url.endswith('/0'):
+            raise ValueError(url)
+        return url
+
+    inst = crawl.CrawlScheduler(raising_fetch, rate=None, robots=False)
+    result = inst.run([f'http://a/{i}' for i in range(3)])
+
+    assert result == [None, 'http://a/1', 'http://a/2']
+    assert inst.stats['failed'] == 1
@@ -0,0 +1,92 @@
+"""pytest
+
+dbaccess.py
+"""
+import os
+import pytest
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from server import dbaccess
+
+
+@pytest.mark.parametrize('value, expect', [
+    ('apple', 'apple'),
+    ('100%', '100\\%'),
+    ('a_b', 'a\\_b'),
+    ('c:\\%_', 'c:\\\\\\%\\_'),
+])
+def test_escape_like_001(value, expect):
+    """LIKEパターンの特殊文字をエスケープ
+    正常ケース
+
+    in:
+      %、_、\\を含む文字列
+    expect:
+      \\でエスケープした文字列
+    """
+    assert dbaccess.escape_like(value) == expect
+
+
+class _RecordingTable:
+    """ 実行したSQLを記録するテーブル """
+    def __init__(self):
+        self.sqls = []
+
+    def execute(self, sql, data=None):
+        self.sqls.append(sql)
+
+
+@pytest.mark.parametrize('index, expect', [
+    ('word_due_at_idx ON word (due_at, id)',
+     'CREATE INDEX IF NOT EXISTS word_due_at_idx ON word (due_at, id);'),
+    ('UNIQUE activity_daily_event_date_idx ON activity_daily (event, date) INCLUDE (count)',
+     'CREATE UNIQUE INDEX IF NOT EXISTS activity_daily_event_date_idx '
+     'ON activity_daily (event, date) INCLUDE (count);'),
+])
+def test_create_index_001(index, expect):
+    """インデックス作成
+    正常ケース
+
+    in:
+      インデックス定義、UNIQUEで始まるインデックス定義
+    expect:
+      CREATE INDEX、CREATE UNIQUE INDEX
+    """
+    table = _RecordingTable()
+    dbaccess.create_index(table, index)
+    assert table.sqls == [expect]
+
+
+class _ExtensionTable:
+    """ 拡張機能の作成に失敗するテーブル """
+    def __init__(self, installed):
+        self.sqls = []
+        self.cur = self
+        self._installed = installed
+
+    def fetchall(self):
+        return [(name,) for name in self._installed]
+
+    def execute(self, sql, data=None):
+        self.sqls.append(sql)
+        if sql.startswith('CREATE EXTENSION'):
+            raise dbaccess.DbOperationError('permission denied to create extension')
+
+
+@pytest.mark.parametrize('installed, expect, created', [
+    ([], set(), True),
+    (['pg_trgm'], {'pg_trgm'}, False),
+])
+def test_ensure_extensions_001(installed, expect, created):
+    """拡張機能作成
+    正常ケース
+
+    in:
+      作成する権限がないDB(未作成、作成済み)
+    expect:
+      例外を送出せず、使用できる拡張機能名のみ返却、作成済みなら作成しない
+    """
+    table = _ExtensionTable(installed)
+    assert dbaccess.ensure_extensions(table) == expect
+    assert ('CREATE EXTENSION IF NOT EXISTS pg_trgm;' in table.sqls) == created
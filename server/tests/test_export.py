@@ -0,0 +1,92 @@
+"""pytest
+
+export.py
+"""
+from datetime import date, datetime
+import io
+import json
+import os
+import pytest
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from server import export
+
+
+COLUMNS = ['id', 'english', 'japanese', 'is_correct', 'date']
+ROWS = [
+    (1, 'apple', 'りんご', True, date(2020, 1, 2)),
+    (-2, 'a,"b"\nc', '', False, None),
+]
+
+
+def test_encode_csv_001():
+    """CSV変換
+    正常ケース
+
+    in:
+      カンマ、ダブルクォート、改行を含む行
+    expect:
+      ヘッダー付きのCSV
+    """
+    result = b''.join(export.encode_csv(COLUMNS, iter(ROWS))).decode('UTF-8')
+    assert result == 'id,english,japanese,is_correct,date\n'\
+        '1,apple,りんご,True,2020-01-02\n'\
+        '-2,"a,""b""\nc",,False,\n'
+
+
+def test_encode_jsonl_001():
+    """JSON Lines変換
+    正常ケース
+
+    in:
+      日付を含む行
+    expect:
+      1行1オブジェクト、日付はISO 8601
+    """
+    result = b''.join(export.encode_jsonl(COLUMNS, iter(ROWS))).decode('UTF-8')
+    lines = [json.loads(line) for line in result.splitlines()]
+    assert lines[0] == {
+        'id': 1, 'english': 'apple', 'japanese': 'りんご', 'is_correct': True, 'date': '2020-01-02'
+    }
+    assert len(lines) == 2
+
+
+def test_snapshot_001():
+    """バイナリスナップショット変換、読み込み
+    正常ケース
+
+    in:
+      整数、文字列、論理値、日付、日時、浮動小数点、None
+    expect:
+      同じ値を復元
+    """
+    rows = ROWS + [(2 ** 40, 'x', 'y', True, datetime(2020, 1, 2, 3, 4, 5)), (0, 'z', 'w', False, 2.5)]
+    data = b''.join(export.encode_snapshot('word', COLUMNS, iter(rows)))
+
+    table, columns, result = export.decode_snapshot(io.BytesIO(data))
+    assert table == 'word'
+    assert columns == COLUMNS
+    assert list(result) == rows
+
+
+@pytest.mark.parametrize('input', [
+    (b'XXXX'),
+    (b''.join(export.encode_snapshot('word', COLUMNS, iter(ROWS)))[:-3]),
+])
+def test_snapshot_002(input):
+    """バイナリスナップショット読み込み
+    エラーケース
+
+    in:
+      マジックが異なる
+    expect:
+      ValueError
+    in:
+      途中で途切れたデータ
+    expect:
+      ValueError
+    """
+    with pytest.raises(ValueError):
+        _, _, rows = export.decode_snapshot(io.BytesIO(input))
+        list(rows)
@@ -0,0 +1,130 @@
+"""pytest
+
+logconfig.py
+"""
+import io
+import json
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from server import logconfig
+
+
+class _BlockingStream(io.StringIO):
+    """ 書き込みを待たせるストリーム """
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def write(self, text):
+        self.release.wait(5)
+        return super().write(text)
+
+
+def _logger(name, handler):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    return logger
+
+
+def test_configure_001():
+    """非同期のログ出力
+    正常ケース
+
+    in:
+      書き込みが止まっているハンドラー
+    expect:
+      ログ出力は待たずに戻り、停止時にキューに残ったログを書き出して
+      ハンドラーを元に戻す
+    """
+    stream = _BlockingStream()
+    handler = logging.StreamHandler(stream)
+    logger = _logger('test_configure_001', handler)
+    logconfig.configure(json_format=False, logger=logger)
+    try:
+        logger.info('first')
+        logger.info('second')
+        assert stream.getvalue() == ''
+    finally:
+        stream.release.set()
+        logconfig.shutdown()
+
+    assert stream.getvalue() == 'first\nsecond\n'
+    assert logger.handlers == [handler]
+
+
+def test_configure_002():
+    """JSON形式の出力
+    正常ケース
+
+    in:
+      リクエスト処理中の例外ログ
+    expect:
+      リクエストID、経過時間、例外情報を含む1行のJSONを出力
+    """
+    stream = io.StringIO()
+    logger = _logger('test_configure_002', logging.StreamHandler(stream))
+    logconfig.configure(json_format=True, logger=logger)
+    try:
+        request_id = logconfig.start_request({'HTTP_X_REQUEST_ID': 'abc-123'})
+        try:
+            raise ValueError('broken')
+        except ValueError:
+            logger.exception('failed %s', 'view')
+        logconfig.end_request()
+        logger.info('idle')
+    finally:
+        logconfig.shutdown()
+
+    first, second = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert request_id == 'abc-123'
+    assert first['message'] == 'failed view'
+    assert first['level'] == 'ERROR'
+    assert first['request_id'] == 'abc-123'
+    assert first['duration_ms'] >= 0
+    assert 'ValueError: broken' in first['exc_info']
+    assert second['request_id'] is None
+
+
+def test_configure_003(tmp_path):
+    """ローテーション設定の上書き
+    正常ケース
+
+    in:
+      RotatingFileHandler、ファイルサイズ、世代数
+    expect:
+      指定したサイズを超えたらローテーションする
+    """
+    path = tmp_path / 'app.log'
+    handler = logging.handlers.RotatingFileHandler(str(path), maxBytes=0)
+    logger = _logger('test_configure_003', handler)
+    logconfig.configure(json_format=False, max_bytes=10, backup_count=2, logger=logger)
+    try:
+        for i in range(5):
+            logger.info('line %d', i)
+    finally:
+        logconfig.shutdown()
+        handler.close()
+
+    assert handler.maxBytes == 10 and handler.backupCount == 2
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['app.log', 'app.log.1', 'app.log.2']
+
+
+def test_start_request_001():
+    """リクエストID
+    異常ケース
+
+    in:
+      不正な文字を含むX-Request-Idヘッダー
+    expect:
+      ヘッダーの値を使わずに生成
+    """
+    request_id = logconfig.start_request({'HTTP_X_REQUEST_ID': 'a\nb'})
+    logconfig.end_request()
+    assert len(request_id) == 32 and request_id.isalnum()
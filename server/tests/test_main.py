@@ -0,0 +1,79 @@
+"""pytest
+
+main.py
+"""
+import os
+import subprocess
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+
+ROOT = os.path.join(os.path.dirname(__file__), '..', '..')
+
+# 読み込み時間の上限(マイクロ秒、遅い環境でも超えない値)
+IMPORT_BUDGET_US = 1000000
+# 読み込み時に読み込まないモジュール
+LAZY_MODULES = (
+    'psycopg2', 'wsgiref.simple_server', 'cProfile', 'pstats', 'bs4', 'requests', 'soupsieve',
+)
+
+
+def _import_times(tmp_path, code):
+    """-X importtimeでコードを実行
+
+    @param tmp_path 作業ディレクトリ
+    @param code 実行するコード
+    @return {<モジュール名>: <累積時間(マイクロ秒)>}、標準出力
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=str(tmp_path), capture_output=True, text=True, check=True,
+        env={**os.environ, 'PYTHONPATH': os.path.abspath(ROOT)})
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times, result.stdout
+
+
+def test_import_001(tmp_path):
+    """読み込み
+    正常ケース
+
+    in:
+      リポジトリ外の作業ディレクトリでmainを読み込む
+    expect:
+      重い依存モジュールを読み込まず、ログ設定、ログファイル作成、DBクエリの記録の登録を行わず、
+      上限時間内に完了
+    """
+    times, stdout = _import_times(
+        tmp_path,
+        'import logging, main; from server import dbaccess; '
+        'print(len(logging.getLogger().handlers), len(dbaccess.QUERY_OBSERVERS))')
+
+    assert not [name for name in LAZY_MODULES if name in times]
+    assert stdout.strip() == '0 0'
+    assert list(tmp_path.iterdir()) == []
+    assert times['main'] < IMPORT_BUDGET_US, f'import main: {times["main"]}us'
+
+
+def test_bootstrap_001(tmp_path):
+    """起動処理
+    正常ケース
+
+    in:
+      リポジトリ外の作業ディレクトリでbootstrapを2回呼び出す
+    expect:
+      リポジトリのログ設定を1回のみ読み込み、ルートロガーにはQueueHandlerのみ付け、
+      DBクエリの記録を1回のみ登録する
+    """
+    _, stdout = _import_times(
+        tmp_path,
+        'import logging, main; main.bootstrap(); main.bootstrap(); '
+        'print([type(h).__name__ for h in logging.getLogger().handlers]); '
+        'from server import dbaccess, logconfig; print(len(dbaccess.QUERY_OBSERVERS)); '
+        'logconfig.shutdown()')
+
+    assert stdout.strip().splitlines() == ["['_QueueHandler']", '2']
@@ -0,0 +1,150 @@
+"""pytest
+
+metrics.py
+"""
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from server import metrics
+from server.dbaccess import QueryEvent
+
+
+def _event(elapsed):
+    return QueryEvent('SELECT 1', None, elapsed, 0.0, 1)
+
+
+class _Response:
+    status = '200 OK'
+
+
+class BadRequest:
+    status = '400 Bad Request'
+
+
+def test_counter_001():
+    """カウンター出力
+    正常ケース
+
+    in:
+      ラベル付きで加算
+    expect:
+      HELP、TYPE、ラベルごとの値を出力
+    """
+    registry = metrics.Registry()
+    counter = metrics.Counter('test_total', 'Test.', ('endpoint',), registry=registry)
+    counter.inc('/a')
+    counter.inc('/a', amount=2)
+    counter.inc('/"b"')
+    assert registry.render() == (
+        '# HELP test_total Test.\n'
+        '# TYPE test_total counter\n'
+        'test_total{endpoint="/\\"b\\""} 1\n'
+        'test_total{endpoint="/a"} 3\n'
+    )
+
+
+def test_histogram_001():
+    """ヒストグラム出力
+    正常ケース
+
+    in:
+      区切りの境界値、区切りを超える値
+    expect:
+      累積件数、+Inf、合計、件数を出力
+    """
+    registry = metrics.Registry()
+    histogram = metrics.Histogram('test_seconds', 'Test.', buckets=(0.1, 1.0), registry=registry)
+    for value in (0.1, 0.5, 2.0):
+        histogram.observe(value)
+    lines = registry.render().splitlines()
+    assert lines[2:] == [
+        'test_seconds_bucket{le="0.1"} 1',
+        'test_seconds_bucket{le="1.0"} 2',
+        'test_seconds_bucket{le="+Inf"} 3',
+        'test_seconds_sum 2.6',
+        'test_seconds_count 3',
+    ]
+
+
+def test_request_tracker_001():
+    """リクエスト計測
+    正常ケース
+
+    in:
+      計測中のDBクエリ2件、エラーレスポンス
+    expect:
+      DBクエリ数、エラー数を記録し、処理中のリクエスト数を戻す
+    """
+    endpoint = '/test_request_tracker_001'
+    in_flight = metrics.IN_FLIGHT.value()
+    tracker = metrics.RequestTracker(endpoint, 10)
+    assert metrics.IN_FLIGHT.value() == in_flight + 1
+    metrics.observe_query(_event(0.5))
+    metrics.observe_query(_event(0.25))
+    tracker.finish(BadRequest())
+    # 計測終了後のクエリは記録しない
+    metrics.observe_query(_event(1.0))
+
+    assert metrics.IN_FLIGHT.value() == in_flight
+    assert metrics.REQUESTS.value(endpoint, '400') == 1
+    assert metrics.REQUEST_BYTES.value(endpoint) == 10
+    assert metrics.DB_QUERIES.value(endpoint) == 2
+    assert metrics.DB_QUERY_SECONDS.value(endpoint) == 0.75
+    assert metrics.ERRORS.value(endpoint, 'BadRequest') == 1
+
+
+def test_request_tracker_002():
+    """ストリーミングレスポンスの計測
+    正常ケース
+
+    in:
+      送信中にDBクエリを実行するチャンクのジェネレータ
+    expect:
+      送信完了時にバイト数、DBクエリ数を記録し、ジェネレータを閉じる
+    """
+    endpoint = '/test_request_tracker_002'
+    closed = []
+
+    def _chunks():
+        try:
+            metrics.observe_query(_event(0.0))
+            yield b'abc'
+            metrics.observe_query(_event(0.0))
+            yield b'de'
+        finally:
+            closed.append(True)
+
+    tracker = metrics.RequestTracker(endpoint, 0)
+    body = tracker.stream(_Response(), _chunks())
+    assert metrics.REQUESTS.value(endpoint, '200') == 0
+    assert b''.join(body) == b'abcde'
+
+    assert closed == [True]
+    assert metrics.REQUESTS.value(endpoint, '200') == 1
+    assert metrics.RESPONSE_BYTES.value(endpoint) == 5
+    assert metrics.DB_QUERIES.value(endpoint) == 2
+
+
+def test_request_tracker_003():
+    """ストリーミングレスポンスの計測
+    正常ケース
+
+    in:
+      送信を開始せずにclose
+    expect:
+      処理中のリクエスト数を戻して計測終了し、元のジェネレータを閉じる
+    """
+    endpoint = '/test_request_tracker_003'
+    chunks = (chunk for chunk in [b'abc'])
+    in_flight = metrics.IN_FLIGHT.value()
+    tracker = metrics.RequestTracker(endpoint, 0)
+    body = tracker.stream(_Response(), chunks)
+    assert metrics.IN_FLIGHT.value() == in_flight + 1
+
+    body.close()
+    body.close()
+    assert metrics.IN_FLIGHT.value() == in_flight
+    assert metrics.REQUESTS.value(endpoint, '200') == 1
+    assert chunks.gi_frame is None
+    assert list(body) == []
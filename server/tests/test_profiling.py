@@ -0,0 +1,151 @@
+"""pytest
+
+profiling.py
+"""
+import io
+import os
+import pstats
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from server import profiling
+
+
+def _busy_view(environ):
+    end = time.perf_counter() + 0.05
+    while time.perf_counter() < end:
+        pass
+    return 'response'
+
+
+def test_should_profile_001():
+    """プロファイル取得判定
+    正常ケース
+
+    in:
+      割合0、トークン設定あり
+    expect:
+      X-Profileヘッダーがトークンと一致する場合のみ取得
+    """
+    middleware = profiling.ProfilingMiddleware(_busy_view, token='secret')
+    assert middleware.should_profile({'HTTP_X_PROFILE': 'secret'})
+    assert not middleware.should_profile({'HTTP_X_PROFILE': 'other'})
+    assert not middleware.should_profile({})
+
+
+def test_should_profile_002():
+    """プロファイル取得判定
+    正常ケース
+
+    in:
+      割合0.5、トークン未設定
+    expect:
+      乱数が割合未満の場合のみ取得し、ヘッダーは無視する
+    """
+    values = iter([0.4, 0.6])
+    middleware = profiling.ProfilingMiddleware(
+        _busy_view, sample_rate=0.5, rng=lambda: next(values))
+    assert middleware.should_profile({'HTTP_X_PROFILE': ''})
+    assert not middleware.should_profile({'HTTP_X_PROFILE': ''})
+
+
+def test_middleware_001(tmp_path):
+    """スタックサンプラーでの取得
+    正常ケース
+
+    in:
+      ヘッダーでプロファイルを指定したリクエスト
+    expect:
+      レスポンスを返却し、リクエストを先頭のフレームとするcollapsed-stackファイルを出力
+    """
+    middleware = profiling.ProfilingMiddleware(
+        _busy_view, token='secret', directory=str(tmp_path), interval=0.001)
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/learning', 'HTTP_X_PROFILE': 'secret'}
+    assert middleware(environ) == 'response'
+
+    files = list(tmp_path.iterdir())
+    assert len(files) == 1 and files[0].name.endswith('-GET_learning.folded')
+    stacks = profiling.merge_folded([str(files[0])])
+    assert stacks
+    assert all(stack.startswith('GET /learning;') for stack in stacks)
+    assert any('_busy_view (test_profiling.py' in stack for stack in stacks)
+
+
+def test_middleware_002(tmp_path):
+    """cProfileでの取得
+    正常ケース
+
+    in:
+      割合1、cprofile
+    expect:
+      pstatsで読み込めるファイルを出力
+    """
+    middleware = profiling.ProfilingMiddleware(
+        _busy_view, sample_rate=1.0, directory=str(tmp_path), mode='cprofile')
+    assert middleware({'PATH_INFO': '/'}) == 'response'
+
+    files = list(tmp_path.iterdir())
+    assert len(files) == 1 and files[0].suffix == '.prof'
+    names = {name for _, _, name in pstats.Stats(str(files[0])).stats}
+    assert '_busy_view' in names
+
+
+def test_merge_folded_001(tmp_path):
+    """collapsed-stack形式のファイルの合算
+    正常ケース
+
+    in:
+      同じスタックを含む2ファイル
+    expect:
+      スタックごとに回数を合算
+    """
+    (tmp_path / 'a.folded').write_text('GET /;main;view 3\nGET /;main 1\n')
+    (tmp_path / 'b.folded').write_text('GET /;main;view 2\n')
+    stacks = profiling.merge_folded([str(tmp_path / 'a.folded'), str(tmp_path / 'b.folded')])
+    output = io.StringIO()
+    profiling.write_folded(stacks, output)
+    assert output.getvalue() == 'GET /;main 1\nGET /;main;view 5\n'
+
+
+def test_fold_pstats_001():
+    """pstatsからcollapsed-stack形式への変換
+    正常ケース
+
+    in:
+      main -> view(2回、内部時間0.3秒)、main -> helper -> view(1回、内部時間0.1秒)
+    expect:
+      viewの内部時間を呼び出し元からの累積時間の割合で経路ごとに配分
+    """
+    main = ('main.py', 1, 'main')
+    helper = ('main.py', 10, 'helper')
+    view = ('api.py', 5, 'view')
+    stats = {
+        main: (1, 1, 0.1, 0.6, {}),
+        helper: (1, 1, 0.1, 0.2, {main: (1, 1, 0.1, 0.2)}),
+        view: (3, 3, 0.4, 0.4, {main: (2, 2, 0.3, 0.3), helper: (1, 1, 0.1, 0.1)}),
+    }
+    stacks = profiling.fold_pstats(stats, unit=0.01)
+    assert stacks == {
+        'main (main.py:1)': 10,
+        'main (main.py:1);view (api.py:5)': 30,
+        'main (main.py:1);helper (main.py:10)': 10,
+        'main (main.py:1);helper (main.py:10);view (api.py:5)': 10,
+    }
+
+
+def test_merge_folded_002(tmp_path):
+    """collapsed-stack形式、pstats形式のファイルの合算
+    正常ケース
+
+    in:
+      cprofileで出力した.prof
+    expect:
+      ビューを含むスタックに変換
+    """
+    middleware = profiling.ProfilingMiddleware(
+        _busy_view, sample_rate=1.0, directory=str(tmp_path), mode='cprofile')
+    middleware({'PATH_INFO': '/'})
+
+    stacks = profiling.merge_folded([str(path) for path in tmp_path.iterdir()])
+    assert any(stack.split(';')[-1].startswith('_busy_view ') for stack in stacks)
@@ -0,0 +1,89 @@
+"""pytest
+
+querystats.py
+"""
+import logging
+import os
+import pytest
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from server import querystats
+from server.dbaccess import QueryEvent
+
+
+@pytest.mark.parametrize(('sql', 'expected'), [
+    ("SELECT * FROM word WHERE english = 'it''s' LIMIT 10;",
+     'SELECT * FROM word WHERE english = ? LIMIT ?'),
+    ('UPDATE word SET is_correct = %s\n    WHERE id = %(id)s;',
+     'UPDATE word SET is_correct = ? WHERE id = ?'),
+    ('DELETE FROM word WHERE id IN (1, 2, 3);', 'DELETE FROM word WHERE id IN (?)'),
+    ('SELECT * FROM word_1;', 'SELECT * FROM word_1'),
+])
+def test_fingerprint_001(sql, expected):
+    """SQL文の指紋
+    正常ケース
+
+    in:
+      リテラル、プレースホルダー、値のリスト、改行を含むSQL文
+    expect:
+      ?に置き換え、空白をまとめる(識別子中の数字は置き換えない)
+    """
+    assert querystats.fingerprint(sql) == expected
+
+
+def test_top_001():
+    """合計実行時間の上位
+    正常ケース
+
+    in:
+      指紋が同じで値が異なるSQL文、別のSQL文
+    expect:
+      指紋ごとに集計し、合計実行時間の降順に返却
+    """
+    stats = querystats.QueryStats(slow_query_ms=-1)
+    stats.observe(QueryEvent('SELECT * FROM word WHERE id = 1;', None, 0.002, 0.001, 1))
+    stats.observe(QueryEvent('SELECT * FROM word WHERE id = 2;', None, 0.004, 0.001, 1))
+    stats.observe(QueryEvent('SELECT count(*) FROM word;', None, 0.001, 0.0, 1))
+
+    top = stats.top(1)
+    assert top == [{
+        'fingerprint': 'SELECT * FROM word WHERE id = ?',
+        'calls': 2,
+        'total_ms': 6.0,
+        'mean_ms': 3.0,
+        'max_ms': 4.0,
+        'commit_ms': 2.0,
+        'rows': 2,
+    }]
+    assert 'SELECT count(*) FROM word' in stats.report()
+
+
+def test_slow_query_001(caplog):
+    """スロークエリ出力
+    正常ケース
+
+    in:
+      閾値以上のSQL実行2回
+    expect:
+      SQL文と実行計画を出力し、実行計画は指紋ごとに1回のみ取得
+    """
+    explained = []
+
+    def _explain(sql, data):
+        explained.append((sql, data))
+        return ['Seq Scan on word']
+
+    stats = querystats.QueryStats(slow_query_ms=100)
+    event = QueryEvent('SELECT * FROM word WHERE id = %s;', (1,), 0.2, 0.0, 1, _explain)
+    with caplog.at_level(logging.WARNING):
+        stats.observe(event)
+        stats.observe(event)
+        stats.observe(event._replace(elapsed=0.05))
+
+    assert explained == [('SELECT * FROM word WHERE id = %s;', (1,))]
+    messages = [record.getMessage() for record in caplog.records]
+    assert len(messages) == 2
+    assert 'SELECT * FROM word WHERE id = ?' in messages[0]
+    assert 'Seq Scan on word' in messages[0]
+    assert 'Seq Scan on word' not in messages[1]
@@ -0,0 +1,249 @@
+"""pytest
+
+quiz.py
+"""
+import os
+import pytest
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from random import Random
+
+from server import quiz
+
+
+def make_item(pkey):
+    return {'id': pkey, 'english': f'english_{pkey}', 'bookmark_flag': False}
+
+
+class FakeSource(object):
+    """ 出題デッキの読み込み元 """
+    def __init__(self, pkeys):
+        self.pkeys = pkeys
+        self.loaded = []
+
+    def load_deck(self, word, seed, size):
+        self.loaded.append(word)
+        return [make_item(pkey) for pkey in self.pkeys[:size]]
+
+    def load_item(self, word, pkey, seed):
+        return make_item(pkey) if pkey in self.pkeys else None
+
+
+def make_cache(source, **kwargs):
+    return quiz.QuizDeckCache(
+        source.load_deck, source.load_item, lambda: 'background', **kwargs)
+
+
+def test_build_quiz_001():
+    """問題作成
+    正常ケース
+
+    in:
+      正解データ1件、不正解用の日本語データ
+    expect:
+      正解と正解以外の不正解3件の選択肢
+    """
+    corrects = [{'id': 1, 'english': 'apple', 'japanese': 'りんご', 'bookmark': True}]
+    incorrects = [['りんご'], ['みかん'], ['ぶどう'], ['なし']]
+
+    result = quiz.build_quiz(corrects, incorrects)
+
+    assert len(result) == 1
+    assert result[0]['correct'] == 'りんご'
+    assert sorted(result[0]['answers']) == sorted(['りんご', 'みかん', 'ぶどう', 'なし'])
+    assert result[0]['bookmark_flag'] is True
+
+
+def test_build_quiz_002():
+    """問題作成
+    正常ケース
+
+    in:
+      同じ入力、シードで2回、異なるシードで1回
+    expect:
+      同じシードなら同じ問題、異なるシードなら異なる問題
+    """
+    corrects = [
+        {'id': pkey, 'english': f'english_{pkey}', 'japanese': f'日本語_{pkey}', 'bookmark': False}
+        for pkey in range(20)
+    ]
+    incorrects = [[f'日本語_{pkey}'] for pkey in range(50)]
+
+    result = quiz.build_quiz(corrects, incorrects, seed=1)
+
+    assert result == quiz.build_quiz(corrects, list(reversed(incorrects)), seed=1)
+    assert result != quiz.build_quiz(corrects, incorrects, seed=2)
+
+
+def test_build_quiz_003():
+    """問題作成
+    正常ケース
+
+    in:
+      類似語検索関数(2件のみ返却)
+    expect:
+      類似語2件と不足分1件を重複なく選ぶ
+    """
+    corrects = [{'id': 1, 'english': 'tokyo', 'japanese': '東京', 'bookmark': False}]
+    incorrects = [['東京都'], ['京都'], ['大阪']]
+
+    result = quiz.build_quiz(corrects, incorrects, lambda text, k: ['東京都', '京都'])
+
+    assert sorted(result[0]['answers']) == sorted(['東京', '東京都', '京都', '大阪'])
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_sample_distractors_001(seed):
+    """不正解選択
+    正常ケース
+
+    in:
+      無作為な候補、正解、件数
+    expect:
+      正解以外の異なる候補をmin(件数, 正解以外の候補数)件、同じシードなら同じ結果
+    """
+    rng = Random(seed)
+    pool = sorted({f'w{rng.randrange(30)}' for _ in range(rng.randrange(0, 12))})
+    answer = rng.choice(pool + ['other'])
+    k = rng.randrange(0, 5)
+
+    result = quiz.sample_distractors(answer, pool, k, Random(seed))
+
+    assert answer not in result
+    assert len(set(result)) == len(result)
+    assert set(result) <= set(pool)
+    assert len(result) == min(k, len([value for value in pool if value != answer]))
+    assert result == quiz.sample_distractors(answer, pool, k, Random(seed))
+
+
+def test_session_seed_001():
+    """セッション名から乱数シードを求める
+    正常ケース
+
+    in:
+      同じセッション名、異なるセッション名
+    expect:
+      同じセッション名なら同じシード
+    """
+    assert quiz.session_seed('a') == quiz.session_seed('a')
+    assert quiz.session_seed('a') != quiz.session_seed('b')
+
+
+def test_get_001():
+    """出題デッキの範囲取得
+    正常ケース
+
+    in:
+      同じセッションで2回取得
+    expect:
+      初回のみリクエスト処理中のWordで同期作成、範囲のみ返却
+    """
+    source = FakeSource(list(range(50)))
+    inst = make_cache(source, prefetch=0)
+
+    assert [item['id'] for item in inst.get('s', 0, 0, 3, 'request')] == [0, 1, 2]
+    assert [item['id'] for item in inst.get('s', 0, 10, 2, 'request')] == [10, 11]
+    assert source.loaded == ['request']
+
+
+def test_get_002():
+    """出題デッキの範囲取得
+    正常ケース
+
+    in:
+      出題対象が残っていて、デッキの残りがprefetch件未満になる範囲
+    expect:
+      バックグラウンドで作り直す
+    """
+    source = FakeSource(list(range(20)))
+    inst = make_cache(source, prefetch=3, page_size=3)
+
+    inst.get('s', 0, 2, 3, 'request')
+    inst.wait()
+
+    assert source.loaded == ['request', 'background']
+
+
+def test_get_003():
+    """出題デッキの範囲取得
+    正常ケース
+
+    in:
+      max_sessions=2で3セッション
+    expect:
+      最も古いセッションを破棄
+    """
+    source = FakeSource([1])
+    inst = make_cache(source, max_sessions=2, prefetch=0)
+
+    inst.get('a', 0, 0, 1, 'request')
+    inst.get('b', 0, 0, 1, 'request')
+    inst.get('a', 0, 0, 1, 'request')
+    inst.get('c', 0, 0, 1, 'request')
+    inst.get('a', 0, 0, 1, 'request')
+    inst.get('b', 0, 0, 1, 'request')
+
+    assert len(source.loaded) == 4
+
+
+def test_update_correct_001():
+    """is_correctフラグ更新を反映
+    正常ケース
+
+    in:
+      正解、未習得に変更
+    expect:
+      正解は全デッキから除き、未習得に変更は全デッキの末尾に追加
+    """
+    source = FakeSource([1, 2, 3])
+    inst = make_cache(source, prefetch=0)
+    inst.get('a', 0, 0, 3, 'request')
+    inst.get('b', 0, 0, 3, 'request')
+
+    inst.update_correct(2, True)
+    assert [item['id'] for item in inst.get('a', 0, 0, 3, 'request')] == [1, 3]
+
+    source.pkeys.append(4)
+    inst.update_correct(4, False)
+    inst.wait()
+    assert [item['id'] for item in inst.get('b', 0, 0, 3, 'request')] == [1, 3, 4]
+    assert len(source.loaded) == 2
+
+
+def test_patch_001():
+    """全デッキの問題の項目を更新
+    正常ケース
+
+    in:
+      bookmark_flag=True
+    expect:
+      該当する問題のみ更新
+    """
+    source = FakeSource([1, 2])
+    inst = make_cache(source, prefetch=0)
+    inst.get('a', 0, 0, 2, 'request')
+
+    inst.patch(2, bookmark_flag=True)
+
+    assert [item['bookmark_flag'] for item in inst.get('a', 0, 0, 2, 'request')] == [False, True]
+
+
+@pytest.mark.parametrize('pkeys', [list(range(200)), list(range(5))])
+def test_get_004(pkeys):
+    """出題デッキの範囲取得
+    正常ケース
+
+    in:
+      既定の範囲(先頭から1回の取得の最大件数)で2回取得
+    expect:
+      作り直さない(デッキは最大件数よりprefetch件多い、または出題対象を全て含む)
+    """
+    source = FakeSource(pkeys)
+    inst = make_cache(source, prefetch=10, page_size=100)
+
+    inst.get('s', 0, 0, 100, 'request')
+    inst.get('s', 0, 0, 100, 'request')
+    inst.wait()
+
+    assert source.loaded == ['request']
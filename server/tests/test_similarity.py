@@ -0,0 +1,127 @@
+"""pytest
+
+similarity.py
+"""
+import os
+import pytest
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from server import similarity
+
+
+TEXTS = [
+    '東京', '東京都', '東京駅', '京都', '大阪', '大阪府', 'りんご', 'みかん',
+    'ぶどう', '走る', '走った', '歩く', '美しい', '美しさ', '図書館', '図書室',
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    file_path = str(tmp_path / 'similarity.idx')
+    similarity.build(TEXTS + ['東京'], file_path)
+    inst = similarity.SimilarityIndex(file_path)
+    yield inst
+    inst.close()
+
+
+def test_simhash_001():
+    """SimHash
+    正常ケース
+
+    in:
+      文字n-gramを共有する文字列、共有しない文字列
+    expect:
+      共有する文字列の方がハミング距離が小さい
+    """
+    base = similarity.simhash('図書館')
+    near = bin(base ^ similarity.simhash('図書室')).count('1')
+    far = bin(base ^ similarity.simhash('みかん')).count('1')
+    assert near < far
+
+
+def test_similar_001(index):
+    """類似語検索
+    正常ケース
+
+    in:
+      インデックスに含まれる文字列
+    expect:
+      重複を除いた件数、自身を除き文字n-gramを共有する文字列が上位
+    """
+    assert len(index) == len(TEXTS)
+    result = index.similar('図書館', 3)
+
+    assert len(result) == 3
+    assert '図書館' not in result
+    assert result[0] == '図書室'
+
+
+def test_similar_002(index):
+    """類似語検索
+    正常ケース
+
+    in:
+      インデックスに含まれない文字列
+    expect:
+      文字n-gramを共有する文字列を返却
+    """
+    assert index.similar('大阪城', 1)[0] in ('大阪', '大阪府')
+
+
+def test_similar_003(tmp_path):
+    """類似語検索
+    正常ケース
+
+    in:
+      文字n-gramを共有する長い文字列、共有しない同じ長さの文字列
+    expect:
+      文字数の差より文字n-gramの共有を優先する
+    """
+    file_path = str(tmp_path / 'similarity.idx')
+    similarity.build(['りんご', 'ばなな', 'りんごジュース', 'みかん'], file_path)
+    inst = similarity.SimilarityIndex(file_path)
+    try:
+        result = inst.similar('りんご', 3)
+        assert result.index('りんごジュース') < result.index('ばなな')
+        assert result[0] == 'りんごジュース'
+    finally:
+        inst.close()
+
+
+def test_open_001(tmp_path):
+    """インデックスを開く
+    異常ケース
+
+    in:
+      存在しないファイル、インデックスでないファイル
+    expect:
+      None
+    """
+    broken = tmp_path / 'broken.idx'
+    broken.write_bytes(b'broken' * 10)
+
+    assert similarity.SimilarityIndex.open(str(tmp_path / 'missing.idx')) is None
+    assert similarity.SimilarityIndex.open(str(broken)) is None
+
+
+def test_index_file_001(tmp_path):
+    """インデックスファイル
+    正常ケース
+
+    in:
+      作成前、作成後、作り直し後
+    expect:
+      作成前はNone、作成後は開き、作り直したら開き直す
+    """
+    file_path = str(tmp_path / 'similarity.idx')
+    inst = similarity.IndexFile(file_path)
+    assert inst.get() is None
+
+    similarity.build(TEXTS, file_path)
+    first = inst.get()
+    assert len(first) == len(TEXTS)
+    assert inst.get() is first
+
+    similarity.build(TEXTS[:4], file_path)
+    assert len(inst.get()) == 4
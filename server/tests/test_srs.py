@@ -0,0 +1,80 @@
+"""pytest
+
+srs.py
+"""
+from datetime import datetime, timedelta
+import os
+import pytest
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from server import srs
+
+
+NOW = datetime(2020, 1, 1)
+
+
+def test_review_001():
+    """回答を反映
+    正常ケース
+
+    in:
+      新規の単語に3回連続正解
+    expect:
+      復習間隔が1日、6日、6 * 易しさ係数日
+    """
+    card = srs.Card(due_at=NOW)
+    intervals = []
+    for _ in range(3):
+        card = srs.review(card, srs.QUALITY_CORRECT, NOW)
+        intervals.append(card.interval)
+
+    assert intervals == [1, 6, 15]
+    assert card.repetitions == 3
+    assert card.ease == pytest.approx(srs.INITIAL_EASE)
+    assert card.due_at == NOW + timedelta(days=15)
+
+
+def test_review_002():
+    """回答を反映
+    正常ケース
+
+    in:
+      連続正解中の単語に不正解
+    expect:
+      連続正解数、復習間隔が0に戻り即時再出題、易しさ係数は下限まで減少
+    """
+    card = srs.Card(interval=15, ease=1.5, repetitions=3, due_at=NOW)
+    card = srs.review(card, srs.QUALITY_INCORRECT, NOW)
+
+    assert card == srs.Card(0, srs.MIN_EASE, 0, NOW)
+
+
+def test_quality_from_flag_001():
+    """is_correctフラグを回答品質に変換
+    正常ケース
+
+    in:
+      True、False
+    expect:
+      正解、不正解の回答品質
+    """
+    assert srs.quality_from_flag(True) >= srs.PASSING_QUALITY
+    assert srs.quality_from_flag(False) < srs.PASSING_QUALITY
+
+
+def test_review_assignments_001():
+    """回答を反映するUPDATE文のSET句
+    正常ケース
+
+    in:
+      SQLの論理式
+    expect:
+      復習状態の全カラムを論理式で分岐して更新
+    """
+    result = srs.review_assignments('v.flag')
+
+    for column in ('interval_days', 'ease', 'repetitions', 'due_at'):
+        assert f'{column} = ' in result
+    assert 'CASE WHEN v.flag THEN' in result
+    assert srs.review_assignments(True) == srs.review_assignments('TRUE')
@@ -2,6 +2,7 @@
 
 util.py
 """
+import io
 import os
 import pytest
 import sys
@@ -42,3 +43,40 @@ def test_open_file_002():
     with pytest.raises(FileNotFoundError):
         with open('FileNotFoundError.html', 'r') as file:
             file.read()
+
+def test_open_request_body_001():
+    """リクエストボディをテキストストリームとして開く
+    正常ケース
+
+    in:
+      'english,日本語\\n' + 後続データ、Content-Lengthはボディ分のみ
+    expect:
+      'english,日本語\\n'
+    """
+    body = 'english,日本語\n'.encode('UTF-8')
+    req_data = {
+        'wsgi.input': io.BytesIO(body + b'trailing'),
+        'CONTENT_LENGTH': str(len(body)),
+    }
+    assert util.open_request_body(req_data).read() == 'english,日本語\n'
+
+
+@pytest.mark.parametrize('input', [
+    ({'wsgi.input': io.BytesIO(b'')}),
+    ({'wsgi.input': io.BytesIO(b''), 'CONTENT_LENGTH': 'abc'}),
+])
+def test_open_request_body_002(input):
+    """リクエストボディをテキストストリームとして開く
+    エラーケース
+
+    in:
+      Content-Lengthなし
+    expect:
+      ValueError
+    in:
+      Content-Length: 'abc'
+    expect:
+      ValueError
+    """
+    with pytest.raises(ValueError):
+        util.open_request_body(input)
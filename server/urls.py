@@ -1,18 +1,20 @@
 """
 エンドポイント
 """
-import logging.config
+import logging
 from pathlib import PurePath
 
+from server import dbaccess, metrics, querystats
 from server.dbaccess import DbOperationError
 from server.api import (
-    DashboardView, LearningView, EnglishListView, ActivityView, BookMarkView,
+    DashboardView, LearningView, EnglishListView, SearchView, AutocompleteView,
+    ActivityView, BookMarkView,
     UpdateIsCorrectFlagView, UpdateBookmarkView, RegisterWordView, DeleteView,
+    BatchView, ImportView, WordExportView, ActivityExportView, MetricsView, QueryStatsView,
     StaticResponse, BadRequest, NotFound, InternalServerError
 )
 
 
-logging.config.fileConfig('./setting/logging.conf')
 LOGGER = logging.getLogger()
 
 # エンドポイント
@@ -20,14 +22,46 @@ END_POINT = {
     '/': DashboardView,
     '/learning': LearningView,
     '/english_list': EnglishListView,
+    '/search': SearchView,
+    '/autocomplete': AutocompleteView,
     '/bookmark': BookMarkView,
     '/activity': ActivityView,
     '/update/is_correct': UpdateIsCorrectFlagView,
     '/update/bookmark': UpdateBookmarkView,
     '/register': RegisterWordView,
     '/delete': DeleteView,
+    '/batch': BatchView,
+    '/import': ImportView,
+    '/export/word': WordExportView,
+    '/export/activity': ActivityExportView,
+    '/metrics': MetricsView,
+    '/metrics/queries': QueryStatsView,
 }
 
+def install_query_observers():
+    """リクエストごとのDBクエリ数、時間、SQL文ごとの実行統計の記録を登録
+
+    起動時に呼び出す(2回目以降は何もしない)
+    """
+    for observer in (metrics.observe_query, querystats.STATS.observe):
+        if observer not in dbaccess.QUERY_OBSERVERS:
+            dbaccess.QUERY_OBSERVERS.append(observer)
+
+
+def endpoint_label(path):
+    """メトリクスのエンドポイントのラベル
+
+    未定義のパスごとにラベルが増えないよう、まとめて扱う
+
+    @param path リクエストパス
+    @return ラベル
+    """
+    if path in END_POINT:
+        return path
+    if path and PurePath(path).match('static/*/*'):
+        return 'static'
+    return 'other'
+
 
 def dispatch(req_data):
     """割り当て
@@ -76,7 +110,10 @@ def dispatch_api(path, req_data):
         return NotFound()
 
     try:
-        if req_data.get('REQUEST_METHOD') == 'POST':
+        if getattr(req_api, 'TAKES_ENVIRON', False):
+            # ボディの読み込み、クエリの解析はAPI側で行う
+            api = req_api(req_data)
+        elif req_data.get('REQUEST_METHOD') == 'POST':
             api = req_api(req_data.get('wsgi.input')\
                 .read(int(req_data.get('CONTENT_LENGTH', 0))))
         else:
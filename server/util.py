@@ -1,6 +1,8 @@
 """
 汎用
 """
+import io
+
 from server.dbaccess import (
     Activity, DbOperationError
 )
@@ -51,3 +53,51 @@ def convert_to_date_for_display(date):
     @return アクティビティ日付(CSS用)
     """
     return date.strftime('%Y/%m/%d')
+
+
+class _LimitedReader(io.RawIOBase):
+    """ 指定バイト数までのみ読み込むストリーム """
+    def __init__(self, stream, length):
+        """コンストラクタ
+
+        @param stream 入力ストリーム
+        @param length 読み込むバイト数
+        """
+        super().__init__()
+        self._stream = stream
+        self._remaining = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        """読み込み
+
+        @param buffer 書き込み先バッファ
+        @return 読み込んだバイト数
+        """
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        data = self._stream.read(size)
+        buffer[:len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+
+
+def open_request_body(req_data, encoding='utf-8-sig'):
+    """リクエストボディをテキストストリームとして開く
+
+    ボディ全体をメモリに読み込まず、Content-Lengthまで逐次読み込む
+
+    @param req_data リクエストデータ
+    @param encoding 文字コード
+    @return テキストストリーム
+    @exception ValueError Content-Lengthが不正
+    """
+    try:
+        length = int(req_data.get('CONTENT_LENGTH') or '')
+    except ValueError as err:
+        raise ValueError(f'invalid Content-Length: {err}')
+    reader = io.BufferedReader(_LimitedReader(req_data.get('wsgi.input'), length))
+    return io.TextIOWrapper(reader, encoding=encoding, newline='')